@@ -8,7 +8,7 @@
 #
 # Steps
 # Step 1: Calculate Land Use Mix metric.
-# Step 1.1: Spatially join land use polygons and census tract polygons.
+# Step 1.1: Assign land use polygons to the census tracts containing their centers.
 # Step 1.2: Summarize joined feature class by census tract id and land use designation to get area by land use and census tract.
 # this step is required for calculating proportion of land use by census tract.
 # Step 1.3: Summarize same joined feature class by just census tract id to get total area by census tract. This is different from
@@ -17,10 +17,11 @@
 # Step 1.5: Calculate proportion of each land use by census tract.
 # Step 1.6: Calculate Land Use Mix metric and max value normalization.
 # Step 2: Calculate Population Density metric.
-# Step 2.1: Calculating population density metric by adding a new field and dividing the population field by the area field.
+# Step 2.1: Calculating population density metric by adding a new field and dividing the population field by the census tract area.
 # Step 2.2: Max value normalization of population density metric.
 # Step 3: Calculate Commercial Density metric.
-# Step 3.1: Summarize joined table from step 1.1 to get area by commercial area by land use and census tract id.
+# Step 3.1: Assign land use polygons to the census tracts they overlap the most and summarize commercial area by land use
+# and census tract id.
 # Step 3.2: Summarize joined table from step 1.2 to get area by census tract id alone.
 # Step 3.3: Join summary tables from steps 3.1 and 3.2.
 # Step 3.4: Calculating unnormalized commercial density metric.
@@ -37,7 +38,7 @@
 # Step 5.2: Calculate unnormalized sidewalk density.
 # Step 5.3: Max normalization of sidewalk density field.
 # Step 6: Calculate Access to Public Transportation metric.
-# Step 6.1: Create census tract centroids.
+# Step 6.1: Create census tract centroids from the cached census tract geometry.
 # Step 6.2: Create lines between all census tract centroids and transportation points.
 # Step 6.3: Summarize selected lines based on transportation point ID.
 # Step 6.4: Join summarized table from steps 2 and 3 with the lines layer based on transportation location unique id.
@@ -63,102 +64,103 @@
 
 # -------------------------------------------------------------------------------
 
+import os
 import arcpy
 import time
 import math
+import numpy as np
+from PEI_Composite import PEIComposite, parse_weights
+from PEI_Checkpoint import Checkpoint, input_signature, layer_fingerprint
+from PEI_Geometry import BOUNDARY, centroid_points, tract_geometry
+from PEI_Index import layer_index
+from PEI_IO import bulk_write
+from PEI_Lookup import label_grid
+from PEI_Scratch import ScratchStore
+from PEI_Trace import Tracer
 
 timestart = time.time()
 arcpy.env.workspace = data = fr"C:\MSGA_Capstone\capstone_data"
 arcpy.env.overwriteOutput = True
-
-
-def main():
-    #
-    # input parameters
-    #
-    # Land use polygons feature class.
-    land_use_file = arcpy.GetParameterAsText(0)
-    # Area field of land use polygons feature class.
-    land_use_area = arcpy.GetParameterAsText(1)
-    # Commercial area field for land use feature class representing commercial area per tax lot.
-    commercial_area = arcpy.GetParameterAsText(2)
-    # Land use classification field of land use polygons feature class.
-    land_uses = arcpy.GetParameterAsText(3)
-    # Census tracts feature class.
-    geographical_units = arcpy.GetParameterAsText(4)
-    # Census tract id field.
-    geographic_id_field = arcpy.GetParameterAsText(5)
-    # Population field of census tract feature class.
-    population_field = arcpy.GetParameterAsText(6)
-    # Area field of census tract feature class.
-    geographic_area_field = arcpy.GetParameterAsText(7)
-    # Street network feature class.
-    street_network = arcpy.GetParameterAsText(8)
-    # Area field of the roads feature class.
-    roads_area_field = arcpy.GetParameterAsText(9)
-    # Sidewalk polygons feature class.
-    sidewalks = arcpy.GetParameterAsText(10)
-    # Area field of the sidewalk feature class.
-    sidewalk_area_field = arcpy.GetParameterAsText(11)
-    # Points feature class representing transportation (metro and bus) stops.
-    transportation_points = arcpy.GetParameterAsText(12)
-    # Unique ID of transportation (subway and bus) points.
-    transportation_id_field = arcpy.GetParameterAsText(13)
-    # Parks polygon feature class.
-    parks = arcpy.GetParameterAsText(14)
-    # Input geodatabase.
-    gdb = arcpy.GetParameterAsText(15)
-    output = arcpy.GetParameterAsText(16)
-    arcpy.env.workspace = gdb
-
+# The parks rasters are written as compressed tiles, the euclidean and cost distances as 32 bit float rasters.
+RASTER_ENVIRONMENT = {"compression": "LZ77", "tileSize": "512 512"}
+# Object ids per where clause when selecting features by object id.
+WHERE_CHUNK = 1000
+
+
+def feature_centers(features):
+    # Centroid of every feature in cursor order, NaN for empty geometries.
+    with arcpy.da.SearchCursor(features, ["SHAPE@TRUECENTROID"]) as cursor:
+        centers = [tuple(np.nan if value is None else value for value in (row[0] or (None, None))) for row in cursor]
+    centers = np.array(centers, dtype=float).reshape(-1, 2)
+    return centers[:, 0], centers[:, 1]
+
+
+def tract_areas(geographical_units, geographic_id_field):
+    # {census tract id: area} from the census tract geometry cached next to the census tracts, in the units of their
+    # coordinate system. Every density is max value normalized, so the units of the area cancel out.
+    geometry = tract_geometry(geographical_units, geographic_id_field, arcpy.AddMessage)
+    return dict(zip(geometry.ct_id.tolist(), geometry.area.tolist()))
+
+
+def feature_oids(features):
+    with arcpy.da.SearchCursor(features, ["OID@"]) as cursor:
+        return np.array([row[0] for row in cursor], dtype=np.int64)
+
+
+def largest_overlap(features, oids, geographical_units, geographic_id_field, scratch):
+    # Spatially joins only the features with the given object ids to the census tract they overlap the most. Returns
+    # {object id: census tract id}, with None for features overlapping no census tract.
+    layer = arcpy.MakeFeatureLayer_management(features, "overlay_features")
+    oid_field = arcpy.Describe(features).OIDFieldName
+    for start in range(0, len(oids), WHERE_CHUNK):
+        where = f"{oid_field} IN ({','.join(str(oid) for oid in oids[start:start + WHERE_CHUNK].tolist())})"
+        arcpy.SelectLayerByAttribute_management(layer, "NEW_SELECTION" if start == 0 else "ADD_TO_SELECTION", where)
+    joined = scratch.path("overlay_join")
+    arcpy.SpatialJoin_analysis(layer, geographical_units, joined, match_option="LARGEST_OVERLAP")
+    with arcpy.da.SearchCursor(joined, ["TARGET_FID", geographic_id_field]) as cursor:
+        return {row[0]: row[1] for row in cursor}
+
+
+def copy_with_tracts(features, tract_index, tract_ids, geographic_id_field, output):
+    # Copies the attributes of the features to a scratch table and joins the census tract id of the census tract index
+    # assigned to every feature in cursor order. As with a spatial join keeping every feature, features outside every
+    # census tract (-1) keep a null census tract id.
+    arcpy.CopyRows_management(features, output)
+    with arcpy.da.SearchCursor(output, ["OID@"]) as cursor:
+        oids = np.array([row[0] for row in cursor], dtype=np.int64)
+    tract_index = np.asarray(tract_index)
+    inside = np.flatnonzero(tract_index >= 0)
+    tract_ids = np.asarray(tract_ids)
+    array = np.zeros(len(inside), dtype=[("join_oid", np.int64), (geographic_id_field, tract_ids.dtype)])
+    array["join_oid"] = oids[inside]
+    array[geographic_id_field] = tract_ids[tract_index[inside]]
+    arcpy.da.ExtendTable(output, arcpy.Describe(output).OIDFieldName, array, "join_oid", append_only=False)
+
+
+def land_use_mix(land_use_file, land_use_area, land_uses, geographical_units, geographic_id_field, scratch):
     #
     # file locations
     #
-    land_use_geographical_units = fr"{gdb}\census_tract_land_use"
-    summary_land_use = fr"{gdb}\summary_land_use"
-    summary_census_tract = fr"{gdb}\summary_census_tract"
-    land_use_summation = fr"{gdb}\land_use_summation"
-    final_land_use_summation = fr"{gdb}\final_land_use_summation"
-    summary_commercial = fr"{gdb}\summary_commercial"
-    summary_com_census_tract = fr"{gdb}\summary_com_census_tract"
-    commercial_summation = fr"{gdb}\commercial_summation"
-    PEI_step_2 = fr"{gdb}\PEI_step_2"
-    PEI_step_3 = fr"{gdb}\PEI_step_3"
-    street_intersect = fr"{gdb}\street_intersect"
-    street_street_join = fr"{gdb}\street_street_join"
-    street_intersection_points = fr"{gdb}\street_intersection_points"
-    street_dissolve = fr"{gdb}\street_dissolve"
-    single_street = fr"{gdb}\single_street"
-    street_summarize = fr"{gdb}\street_summarize"
-    final_commercial_sum = fr"{gdb}\final_commercial_sum"
-    sidewalk_apportion = fr"{gdb}\sidewalk_apportion"
-    geographical_centroids = fr"{gdb}\geographical_centroids"
-    census_tract_transportation = fr"{gdb}\census_tract_transportation"
-    ctt_lines = fr"{gdb}\ctt_lines"
-    transportation_summarize = fr"{gdb}\transportation_summarize"
-    view_lines = fr"{gdb}\view_lines"
-    ratio_transportation = fr"{gdb}\ratio_transportation"
-    transportation_accessibility = fr"{gdb}\transportation_accessibility"
-    sidewalks_distance = fr"{gdb}\sidewalks_distance"
-    distance_reclass = fr"{gdb}\distance_reclass"
-    parks_FeatureToPoint = fr"C:\MSGA_Capstone\capstone_data\parks_FeatureToPoint.shp"
-    parks_raster = fr"{gdb}\parks_raster"
-    parks_access = fr"{gdb}\parks_access"
-    roads_buffer = fr"{gdb}\roads_buffer"
-    road_apportion = fr"{gdb}\road_apportion"
+    land_use_geographical_units = scratch.path("census_tract_land_use")
+    summary_land_use = scratch.path("summary_land_use")
+    summary_census_tract = scratch.path("summary_census_tract")
+    land_use_summation = scratch.path("land_use_summation")
+    final_land_use_summation = scratch.path("final_land_use_summation")
 
     arcpy.AddMessage("Calculating Land Use Mix Metric...")
 
 
     # Step 1: Calculating land use mix metric.
 
-    # Step 1.1: Spatially join land use polygons and census tract polygons.
+    # Step 1.1: Assign land use polygons to the census tracts containing their centers.
     #
-    # joining zonal geometry to land use polygons to have a single feature class with land use, tax lot areas and census tract ID's
+    # The census tract geometry and its spatial index are cached next to the census tracts layer, so only the lot
+    # centers are read and located instead of spatially joining both layers. The result is a single table with land
+    # use, tax lot areas and census tract ID's, like the spatial join with the HAVE_THEIR_CENTER_IN match option.
     #
-
-    arcpy.SpatialJoin_analysis(land_use_file, geographical_units, land_use_geographical_units,
-                               match_option="HAVE_THEIR_CENTER_IN")
+    geometry = tract_geometry(geographical_units, geographic_id_field, arcpy.AddMessage)
+    copy_with_tracts(land_use_file, geometry.locate(*feature_centers(land_use_file)), geometry.ct_id,
+                     geographic_id_field, land_use_geographical_units)
 
     # Step 1.2: Summarize joined feature class by census tract id and land use designation to get area by land use and census tract.
     # this step is required for calculating proportion of land use by census tract.
@@ -175,7 +177,7 @@ def main():
                                                      geographic_id_field, "KEEP_ALL", "NO_INDEX_JOIN_FIELDS")
 
     arcpy.SelectLayerByAttribute_management(land_use_joined_table, "NEW_SELECTION", "summary_land_use.ct_id > 0")
-    arcpy.TableToTable_conversion(land_use_joined_table, gdb, "land_use_summation", "LandUse IS NOT NULL")
+    arcpy.TableToTable_conversion(land_use_joined_table, scratch.gdb, "land_use_summation", "LandUse IS NOT NULL")
     # calculate shannon's diversity index. This index is defined as the summation of the proportion of the proportion of each land use
     # multiplied by the log of the proportion of each land use. This sum is multiplied by -1 and divided by the log of the number
     # of land uses to obtain the land use diversity of each census tract.
@@ -222,14 +224,24 @@ def main():
                 row[1] = 0
                 cur2.updateRow(row)
 
+    land_use_diversity = {}
+    with arcpy.da.SearchCursor(final_land_use_summation, ["ct_id", "shannon"]) as cursor:
+        for row in cursor:
+            land_use_diversity[row[0]] = row[1]
+    return land_use_diversity
+
 
+def population_density(geographical_units, geographic_id_field, population_field):
     # Step 2: Calculating Population Density metric.
 
-    # Step 2.1: Calculating population density metric by adding a new field and dividing the population field by the area field.
+    # Step 2.1: Calculating population density metric by adding a new field and dividing the population field by the census tract area.
     arcpy.AddMessage("Calculating Population Density metric...")
+    area = tract_areas(geographical_units, geographic_id_field)
     arcpy.AddField_management(geographical_units, "bn_pop_density", "DOUBLE")
-    arcpy.CalculateField_management(geographical_units, "bn_pop_density",
-                                    f"!{population_field}!/!{geographic_area_field}!")
+    with arcpy.da.UpdateCursor(geographical_units, [geographic_id_field, population_field, "bn_pop_density"]) as cur:
+        for row in cur:
+            row[2] = row[1] / area[row[0]] if row[1] is not None and area.get(row[0]) else None
+            cur.updateRow(row)
 
     # Step 2.2: Max value normalization of population density metric.
     max_value = 0.000000000000000001
@@ -247,26 +259,43 @@ def main():
 
     arcpy.AddField_management(geographical_units, "pop_density", "DOUBLE")
     arcpy.CalculateField_management(geographical_units, "pop_density", f"!bn_pop_density!/{max_value}")
-    land_use_population_density_table = arcpy.AddJoin_management(geographical_units, geographic_id_field,
-                                                                 final_land_use_summation, geographic_id_field,
-                                                                 "KEEP_ALL", "NO_INDEX_JOIN_FIELDS")
-    arcpy.SelectLayerByAttribute_management(land_use_population_density_table, "NEW_SELECTION",
-                                            "final_land_use_summation.ct_id > 0")
-    arcpy.TableToTable_conversion(land_use_population_density_table, gdb, "PEI_step_2")
-
-    with arcpy.da.UpdateCursor(PEI_step_2, ["SUM_sha_num", "shannon"]) as cur4:
-        for row in cur4:
-            if row[0] is None:
-                row[0] = 0
-                row[1] = 0
-                cur4.updateRow(row)
 
+    population_density = {}
+    with arcpy.da.SearchCursor(geographical_units, ["ct_id", "pop_density"]) as cursor:
+        for row in cursor:
+            population_density[row[0]] = row[1]
+    return population_density
+
+
+def commercial_density(land_use_file, land_use_area, commercial_area, land_uses, geographical_units, geographic_id_field, scratch):
+    #
+    # file locations
+    #
+    land_use_geographical_units = scratch.path("census_tract_land_use")
+    summary_commercial = scratch.path("summary_commercial")
+    summary_com_census_tract = scratch.path("summary_com_census_tract")
+    commercial_summation = scratch.path("commercial_summation")
+    final_commercial_sum = scratch.path("final_commercial_sum")
 
     # Step 3: Calculating Commercial Density metric.
-    # Step 3.1: Summarize joined table from step 1.1 to get area by commercial area by land use and census tract id.
+    # Step 3.1: Assign land use polygons to the census tracts they overlap the most and summarize commercial area by
+    # land use and census tract id.
     arcpy.AddMessage("Calculating Commercial Density metric...")
-    arcpy.SpatialJoin_analysis(land_use_file, geographical_units, land_use_geographical_units,
-                               match_option="LARGEST_OVERLAP")
+    # A lot whose bounding box lies within a single census tract can only overlap that census tract. The lot boxes
+    # come from the spatial index sidecar of the land use layer, and the census tract label grid and prepared
+    # polygons cached next to the census tracts tell which boxes cross a census tract edge, so the spatial join with
+    # the LARGEST_OVERLAP match option only runs on the lots near census tract edges.
+    grid = label_grid(geographical_units, geographic_id_field, log=arcpy.AddMessage)
+    oids = feature_oids(land_use_file)
+    boxes = layer_index(land_use_file, log=arcpy.AddMessage).feature_boxes(len(oids))
+    tract_index = grid.geometry.covering_tract(boxes, grid.locate)
+    boundary = np.flatnonzero(tract_index == BOUNDARY)
+    if len(boundary):
+        joined = largest_overlap(land_use_file, oids[boundary], geographical_units, geographic_id_field, scratch)
+        position = {ct_id: i for i, ct_id in enumerate(grid.geometry.ct_id.tolist())}
+        tract_index[boundary] = [position.get(joined.get(oid), -1) for oid in oids[boundary].tolist()]
+    copy_with_tracts(land_use_file, tract_index, grid.geometry.ct_id, geographic_id_field,
+                     land_use_geographical_units)
     arcpy.SummarizeAttributes_gapro(land_use_geographical_units, summary_commercial,
                                     [land_uses, geographic_id_field],
                                     [[commercial_area, "SUM"]])
@@ -280,7 +309,7 @@ def main():
     # Table to table conversion is the only way to make the add join operations result permanent.
     arcpy.SelectLayerByAttribute_management(commercial_joined_table, "NEW_SELECTION",
                                             "summary_commercial.ct_id > 0")
-    arcpy.TableToTable_conversion(commercial_joined_table, gdb, "commercial_summation",
+    arcpy.TableToTable_conversion(commercial_joined_table, scratch.gdb, "commercial_summation",
                                   fr"SUM_{land_use_area} IS NOT NULL")
     # Step 3.4: Calculating unnormalized commercial density metric.
     arcpy.AddField_management(commercial_summation, "bn_com_sum", "DOUBLE")
@@ -307,14 +336,23 @@ def main():
     arcpy.AddField_management(final_commercial_sum, "com_sum", "DOUBLE")
     arcpy.CalculateField_management(final_commercial_sum, "com_sum",
                                     f"math.log(!SUM_bn_com_sum!+1)/math.log({max_value}+1)")
-    land_use_population_commercial_density_table = arcpy.AddJoin_management(PEI_step_2, geographic_id_field,
-                                                                            final_commercial_sum,
-                                                                            geographic_id_field,
-                                                                            "KEEP_ALL", "NO_INDEX_JOIN_FIELDS")
-    arcpy.SelectLayerByAttribute_management(land_use_population_commercial_density_table, "NEW_SELECTION",
-                                            "PEI_step_2.ct_id > 0")
-    arcpy.TableToTable_conversion(land_use_population_commercial_density_table, gdb, "PEI_step_3")
 
+    commercial_density = {}
+    with arcpy.da.SearchCursor(final_commercial_sum, ["ct_id", "com_sum"]) as cursor:
+        for row in cursor:
+            commercial_density[row[0]] = row[1]
+    return commercial_density
+
+
+def intersection_density(street_network, geographical_units, geographic_id_field, scratch):
+    #
+    # file locations
+    #
+    street_intersect = scratch.path("street_intersect")
+    street_street_join = scratch.path("street_street_join")
+    street_intersection_points = scratch.path("street_intersection_points")
+    street_dissolve = scratch.path("street_dissolve")
+    single_street = scratch.path("single_street")
 
     # Step 4: Calculating Intersection Density metric.
 
@@ -338,43 +376,33 @@ def main():
     arcpy.MultipartToSinglepart_management(street_dissolve, single_street)
 
     # Step 4.5: Summarizing intersection points within each census tract, with a 3 way intersection equaling 3 and 4 way intersection equaling 4, and so on.
-    arcpy.SummarizeWithin_gapro(single_street, street_summarize, "POLYGON", '', None, geographical_units, "ADD_SUMMARY",
-                                '', "MEAN_Join_Count SUM")
-
-    # Step 4.6: Calculating unnormalized intersection density metric.
-    arcpy.AddField_management(street_summarize, "bn_intersection", "DOUBLE")
-    arcpy.CalculateField_management(street_summarize, "bn_intersection",
-                                    fr"!SUM_MEAN_Join_Count!/(!{geographic_area_field}!*10.764)")
-    arcpy.AddField_management(street_summarize, "intersection", "DOUBLE")
+    # The intersection points are assigned to census tracts with the label grid cached next to the census tracts
+    # instead of summarizing within the census tract polygons.
+    with arcpy.da.SearchCursor(single_street, ["SHAPE@XY", "MEAN_Join_Count"]) as cursor:
+        points = np.array([(row[0][0], row[0][1], row[1] or 0) for row in cursor], dtype=float).reshape(-1, 3)
+    grid = label_grid(geographical_units, geographic_id_field, log=arcpy.AddMessage)
+    tract_index = grid.locate(points[:, 0], points[:, 1])
+    inside = tract_index >= 0
+    join_count = np.bincount(tract_index[inside], points[inside, 2], minlength=len(grid.geometry.ct_id))
+
+    # Step 4.6: Calculating unnormalized intersection density metric, with the census tract areas of the cached
+    # census tract geometry.
+    area = grid.geometry.area
+    with np.errstate(divide="ignore", invalid="ignore"):
+        density = np.where(area > 0, join_count / area, 0)
+    bn_intersection = dict(zip(grid.geometry.ct_id.tolist(), density.tolist()))
 
     # Step 4.7: Max value normalization of Intersection Density metric field.
     # Determining max intersection density value for max value normalization.
-    max_value = 0.000000000000000001
-    with arcpy.da.SearchCursor(street_summarize, ["bn_intersection"]) as cursor:
-        for row in cursor:
-            if row[0] is not None:
-                if row[0] > max_value:
-                    max_value = row[0]
+    max_value = max([0.000000000000000001] + list(bn_intersection.values()))
+    return {ct_id: value / max_value for ct_id, value in bn_intersection.items()}
 
-    with arcpy.da.UpdateCursor(street_summarize, ["bn_intersection"]) as cursor:
-        for row in cursor:
-            if row[0] is None:
-                row[0] = 0
-                cursor.updateRow(row)
-    # Max value normalization.
-    arcpy.CalculateField_management(street_summarize, "intersection", fr"!bn_intersection!/{max_value}")
-    final_density_table = arcpy.AddJoin_management(PEI_step_3, geographic_id_field,
-                                                   street_summarize,
-                                                   geographic_id_field,
-                                                   "KEEP_ALL", "NO_INDEX_JOIN_FIELDS")
-    arcpy.SelectLayerByAttribute_management(final_density_table, "NEW_SELECTION", "PEI_step_3.ct_id > 0")
-    arcpy.TableToTable_conversion(final_density_table, gdb, output)
-    with arcpy.da.UpdateCursor(output, ["intersection"]) as cur5:
-        for row in cur5:
-            if row[0] is None:
-                row[0] = 0
-                cur5.updateRow(row)
 
+def sidewalk_density(sidewalks, sidewalk_area_field, geographical_units, geographic_id_field, scratch):
+    #
+    # file locations
+    #
+    sidewalk_apportion = scratch.path("sidewalk_apportion")
 
     # Step 5: Calculate Sidewalk Density metric.
     arcpy.AddMessage("Calculating Sidewalk Density metric...")
@@ -383,9 +411,13 @@ def main():
     arcpy.ApportionPolygon_analysis(sidewalks, sidewalk_area_field, geographical_units, sidewalk_apportion, "AREA")
 
     # Step 5.2: Calculate unnormalized sidewalk density.
+    area = tract_areas(geographical_units, geographic_id_field)
     arcpy.AddField_management(sidewalk_apportion, "bn_sidewalk_density", "DOUBLE")
-    arcpy.CalculateField_management(sidewalk_apportion, "bn_sidewalk_density",
-                                    f"!{sidewalk_area_field}!/!{geographic_area_field}!")
+    with arcpy.da.UpdateCursor(sidewalk_apportion,
+                               [geographic_id_field, sidewalk_area_field, "bn_sidewalk_density"]) as cursor:
+        for row in cursor:
+            row[2] = row[1] / area[row[0]] if row[1] is not None and area.get(row[0]) else None
+            cursor.updateRow(row)
     # Step 5.3: Max normalization of sidewalk density field.
     max_value = 0.000000000000000001
     with arcpy.da.UpdateCursor(sidewalk_apportion, ["bn_sidewalk_density"]) as cursor:
@@ -404,13 +436,28 @@ def main():
     with arcpy.da.SearchCursor(sidewalk_apportion, ["ct_id", "sidewalk_density"]) as cursor:
         for row in cursor:
             sidewalk_density[row[0]] = row[1]
+    return sidewalk_density
 
 
+def transportation_access(transportation_points, transportation_id_field, geographical_units, geographic_id_field, population_field, scratch):
+    #
+    # file locations
+    #
+    geographical_centroids = scratch.path("geographical_centroids")
+    census_tract_transportation = scratch.path("census_tract_transportation")
+    ctt_lines = scratch.path("ctt_lines")
+    transportation_summarize = scratch.path("transportation_summarize")
+    view_lines = scratch.path("view_lines")
+    ratio_transportation = scratch.path("ratio_transportation")
+    transportation_accessibility = scratch.path("transportation_accessibility")
+
     # Step 6: Calculate Public Transportation Access metric.
     arcpy.AddMessage("Calculating Access to Public Transportation metric...")
 
-    # Step 6.1: Create census tract centroids.
-    arcpy.FeatureToPoint_management(geographical_units, geographical_centroids)
+    # Step 6.1: Create census tract centroids from the cached census tract geometry, with the census tract id and
+    # population the next steps read.
+    centroid_points(geographical_units, geographic_id_field, geographical_centroids, [population_field],
+                    arcpy.AddMessage)
 
     # Step 6.2: Create lines between all census tract centroids and transportation points.
     arcpy.AddGeometryAttributes_management(geographical_centroids, "POINT_X_Y_Z_M", "FEET_US")
@@ -436,7 +483,7 @@ def main():
     arcpy.MakeFeatureLayer_management(ctt_lines, view_lines)
     lines_table = arcpy.AddJoin_management(view_lines, transportation_id_field, transportation_summarize,
                                            transportation_id_field)
-    arcpy.TableToTable_conversion(lines_table, gdb, "ratio_transportation")
+    arcpy.TableToTable_conversion(lines_table, scratch.gdb, "ratio_transportation")
 
     # Step 6.5: Summarize lines feature class from step 4 based on census tract ID to derive sum of ratios, which is the
     # final accessibility score.
@@ -450,25 +497,38 @@ def main():
                 if row[0] > max_value:
                     max_value = row[0]
     arcpy.CalculateField_management(transportation_accessibility, "transportation_access", fr"!SUM_ratio!/{max_value}")
-    transportation_accessibility = fr"{gdb}\transportation_accessibility"
     transportation_access = {}
     with arcpy.da.SearchCursor(transportation_accessibility, ["ct_id", "transportation_access"]) as cursor:
         for row in cursor:
             transportation_access[row[0]] = row[1]
+    return transportation_access
 
 
+def parks_access(parks, sidewalks, geographical_units, scratch):
+    #
+    # file locations
+    #
+    sidewalks_distance = scratch.path("sidewalks_distance")
+    distance_reclass = scratch.path("distance_reclass")
+    parks_FeatureToPoint = scratch.folder_path("parks_FeatureToPoint.shp")
+    parks_raster = scratch.path("parks_raster")
+    parks_access = scratch.path("parks_access")
+
     # Step 7: Calculate Access to Parks metric.
     arcpy.AddMessage("Calculating Access to Parks metric...")
 
     # Step 7.1: Calculate euclidean distance raster for distance from sidewalk polygons.
-    with arcpy.EnvManager(mask=geographical_units):
+    with arcpy.EnvManager(mask=geographical_units, **RASTER_ENVIRONMENT):
         out_distance_raster = arcpy.sa.EucDistance(sidewalks, None, 10, None, "PLANAR", None, None)
         out_distance_raster.save(sidewalks_distance)
 
-    # Step 7.2: Reclassify euclidean distance from sidewalks raster to create cost surface.
-    arcpy.Reclassify_3d(sidewalks_distance, "VALUE",
-                        "0 1;0 30 2;30 60 3;60 100 4;100 24816.060547 5", distance_reclass,
-                        "DATA")
+    # Step 7.2: Reclassify euclidean distance from sidewalks raster to create cost surface. The classes 1 to 5 are
+    # stored as an 8 bit unsigned raster.
+    with arcpy.EnvManager(**RASTER_ENVIRONMENT):
+        arcpy.Reclassify_3d(sidewalks_distance, "VALUE",
+                            "0 1;0 30 2;30 60 3;60 100 4;100 24816.060547 5", distance_reclass + "_int",
+                            "DATA")
+        arcpy.CopyRaster_management(distance_reclass + "_int", distance_reclass, pixel_type="8_BIT_UNSIGNED")
 
     # Step 7.3: Convert park polygons into points.
     arcpy.FeatureToPoint_management(parks, parks_FeatureToPoint)
@@ -478,8 +538,9 @@ def main():
                                            "NEW_SELECTION", "NOT_INVERT")
 
     # Step 7.5: Calculate cost distance using parks points and cost surface from steps 4 and 2, respectively.
-    out_distance_raster = arcpy.sa.CostDistance(parks_FeatureToPoint, distance_reclass)
-    out_distance_raster.save(parks_raster)
+    with arcpy.EnvManager(**RASTER_ENVIRONMENT):
+        out_distance_raster = arcpy.sa.CostDistance(parks_FeatureToPoint, distance_reclass)
+        out_distance_raster.save(parks_raster)
 
     # Step 7.6: Calculate zonal statistics to obtain all the summary statistics of the cost distance raster from step 5 by census tract.
     arcpy.ia.ZonalStatisticsAsTable(geographical_units, "GEOID", parks_raster, parks_access, "DATA", "ALL",
@@ -501,7 +562,15 @@ def main():
     with arcpy.da.SearchCursor(parks_access, ["ct_id", "park_access"]) as cursor:
         for row in cursor:
             access_to_parks[math.floor(row[0])] = row[1]
+    return access_to_parks
+
 
+def street_network_density(street_network, roads_area_field, geographical_units, geographic_id_field, scratch):
+    #
+    # file locations
+    #
+    roads_buffer = scratch.path("roads_buffer")
+    road_apportion = scratch.path("road_apportion")
 
     # Step 8: Calculate Street Network Density metric.
     arcpy.AddMessage("Calculating Street Network Density...")
@@ -516,8 +585,12 @@ def main():
     arcpy.ApportionPolygon_analysis(roads_buffer, "POLY_AREA", geographical_units, road_apportion, "AREA")
 
     # Step 8.3: Calculate unnormalized street network density and max normalization.
+    area = tract_areas(geographical_units, geographic_id_field)
     arcpy.AddField_management(road_apportion, "bn_network_density", "DOUBLE")
-    arcpy.CalculateField_management(road_apportion, "bn_network_density", f"!POLY_AREA!/!{geographic_area_field}!")
+    with arcpy.da.UpdateCursor(road_apportion, [geographic_id_field, "POLY_AREA", "bn_network_density"]) as cursor:
+        for row in cursor:
+            row[2] = row[1] / area[row[0]] if row[1] is not None and area.get(row[0]) else None
+            cursor.updateRow(row)
     max_value = 0
     with arcpy.da.UpdateCursor(road_apportion, ["bn_network_density"]) as cursor:
         for row in cursor:
@@ -533,87 +606,117 @@ def main():
     with arcpy.da.SearchCursor(road_apportion, ["ct_id", "network_density"]) as cursor:
         for row in cursor:
             street_network_density[row[0]] = row[1]
-    arcpy.Delete_management(summary_census_tract)
-    arcpy.Delete_management(land_use_summation)
-    arcpy.Delete_management(summary_land_use)
-    arcpy.Delete_management(final_land_use_summation)
-    arcpy.Delete_management(land_use_geographical_units)
-    arcpy.Delete_management(summary_com_census_tract)
-    arcpy.Delete_management(summary_commercial)
-    arcpy.Delete_management(commercial_summation)
-    arcpy.Delete_management(final_commercial_sum)
-    arcpy.Delete_management(PEI_step_2)
-    arcpy.Delete_management(street_intersect)
-    arcpy.Delete_management(street_street_join)
-    arcpy.Delete_management(street_intersection_points)
-    arcpy.Delete_management(street_dissolve)
-    arcpy.Delete_management(single_street)
-    arcpy.Delete_management(street_summarize)
-    arcpy.Delete_management(PEI_step_3)
-    arcpy.Delete_management(sidewalk_apportion)
-    arcpy.Delete_management(geographical_centroids)
-    arcpy.Delete_management(census_tract_transportation)
-    arcpy.Delete_management(view_lines)
-    arcpy.Delete_management(transportation_summarize)
-    arcpy.Delete_management(ctt_lines)
-    arcpy.Delete_management(ratio_transportation)
-    arcpy.Delete_management(transportation_accessibility)
-    arcpy.Delete_management(sidewalks_distance)
-    arcpy.Delete_management(parks_FeatureToPoint)
-    arcpy.Delete_management(distance_reclass)
-    arcpy.Delete_management(parks_raster)
-    arcpy.Delete_management(parks_access)
-    arcpy.Delete_management(roads_buffer)
-    arcpy.Delete_management(road_apportion)
+    return street_network_density
 
-    # Step 9: Combine metrics to calculate Pedestrian Environment Index.
-    arcpy.AddMessage("Combining metrics to calculate Pedestrian Environment Index.")
-
-    arcpy.AddField_management(geographical_units, "land_use_diversity", "DOUBLE")
-    arcpy.AddField_management(geographical_units, "commercial_density", "DOUBLE")
-    arcpy.AddField_management(geographical_units, "intersection_density", "DOUBLE")
-    arcpy.AddField_management(geographical_units, "sidewalk_density", "DOUBLE")
-    arcpy.AddField_management(geographical_units, "transportation_access", "DOUBLE")
-    arcpy.AddField_management(geographical_units, "parks_access", "DOUBLE")
-    arcpy.AddField_management(geographical_units, "sn_density", "DOUBLE")
-    arcpy.AddField_management(geographical_units, output, "DOUBLE")
-
-    with arcpy.da.UpdateCursor(geographical_units, ["ct_id", "sidewalk_density", "transportation_access", "parks_access", "sn_density"]) as cursor:
-        for row in cursor:
-            row[1] = sidewalk_density[row[0]]
-            del sidewalk_density[row[0]]
-            row[2] = transportation_access[row[0]]
-            del transportation_access[row[0]]
-            if row[0] in access_to_parks.keys():
-                row[3] = access_to_parks[math.floor(row[0])]
-                del access_to_parks[math.floor(row[0])]
-            else:
-                row[3] = 0
-            row[4] = street_network_density[row[0]]
-            del street_network_density[row[0]]
-            cursor.updateRow(row)
 
-    land_use_diversity = {}
-    commercial_density = {}
-    intersection_density = {}
+def main():
+    #
+    # input parameters
+    #
+    # Land use polygons feature class.
+    land_use_file = arcpy.GetParameterAsText(0)
+    # Area field of land use polygons feature class.
+    land_use_area = arcpy.GetParameterAsText(1)
+    # Commercial area field for land use feature class representing commercial area per tax lot.
+    commercial_area = arcpy.GetParameterAsText(2)
+    # Land use classification field of land use polygons feature class.
+    land_uses = arcpy.GetParameterAsText(3)
+    # Census tracts feature class.
+    geographical_units = arcpy.GetParameterAsText(4)
+    # Census tract id field.
+    geographic_id_field = arcpy.GetParameterAsText(5)
+    # Population field of census tract feature class.
+    population_field = arcpy.GetParameterAsText(6)
+    # Area field of census tract feature class. Kept as a tool parameter, the sub metrics take the census tract areas
+    # from the cached census tract geometry.
+    geographic_area_field = arcpy.GetParameterAsText(7)
+    # Street network feature class.
+    street_network = arcpy.GetParameterAsText(8)
+    # Area field of the roads feature class.
+    roads_area_field = arcpy.GetParameterAsText(9)
+    # Sidewalk polygons feature class.
+    sidewalks = arcpy.GetParameterAsText(10)
+    # Area field of the sidewalk feature class.
+    sidewalk_area_field = arcpy.GetParameterAsText(11)
+    # Points feature class representing transportation (metro and bus) stops.
+    transportation_points = arcpy.GetParameterAsText(12)
+    # Unique ID of transportation (subway and bus) points.
+    transportation_id_field = arcpy.GetParameterAsText(13)
+    # Parks polygon feature class.
+    parks = arcpy.GetParameterAsText(14)
+    # Input geodatabase.
+    gdb = arcpy.GetParameterAsText(15)
+    output = arcpy.GetParameterAsText(16)
+    # Optional sub metric weights for the composite, for example "1;1;1;1;2;1;1;1". Equal weights by default.
+    weights = parse_weights(arcpy.GetParameterAsText(17))
+    # Resume a failed run at its first incomplete sub metric, reusing the checkpointed results of the completed ones.
+    resume = arcpy.GetParameterAsText(18).lower() == "true"
+    arcpy.env.workspace = gdb
 
-    with arcpy.da.SearchCursor(output, ["ct_id", "shannon", "com_sum", "intersection"]) as cur6:
-        for row in cur6:
-            land_use_diversity[row[0]] = row[1]
-            commercial_density[row[0]] = row[2]
-            intersection_density[row[0]] = row[3]
+    # Intermediate outputs live in a run specific scratch directory that is removed automatically, even after a crash.
+    scratch = ScratchStore()
+    # Completed sub metrics are checkpointed next to the gdb, keyed by a signature of the parameters and of the content
+    # of the input layers. Only the input fields of the census tracts are read, as the run writes its outputs there.
+    signature = input_signature(land_use_file, land_use_area, commercial_area, land_uses, geographical_units,
+                                geographic_id_field, population_field, geographic_area_field, street_network,
+                                roads_area_field, sidewalks, sidewalk_area_field, transportation_points,
+                                transportation_id_field, parks, gdb, output,
+                                *(layer_fingerprint(layer) for layer in (land_use_file, street_network, sidewalks,
+                                                                         transportation_points, parks)),
+                                layer_fingerprint(geographical_units, [geographic_id_field, population_field]))
+    # Every stage is traced (wall and CPU time, peak memory, row counts) to a JSON lines file next to the gdb.
+    tracer = Tracer(fr"{os.path.splitext(gdb)[0]}_{output}_trace.jsonl", arcpy.AddMessage)
+    checkpoint = Checkpoint(fr"{os.path.splitext(gdb)[0]}_{output}_checkpoint", signature, arcpy.AddMessage, tracer)
+    if not resume:
+        checkpoint.reset()
+
+    # Steps 1-8: Calculate every sub metric, skipping the ones completed by a previous run when resuming.
+    land_use_diversity = checkpoint.run("land_use_mix", land_use_mix, land_use_file, land_use_area, land_uses,
+                                        geographical_units, geographic_id_field, scratch)
+    population = checkpoint.run("population_density", population_density, geographical_units, geographic_id_field,
+                                population_field)
+    commercial = checkpoint.run("commercial_density", commercial_density, land_use_file, land_use_area,
+                                commercial_area, land_uses, geographical_units, geographic_id_field, scratch)
+    intersection = checkpoint.run("intersection_density", intersection_density, street_network, geographical_units,
+                                  geographic_id_field, scratch)
+    sidewalk = checkpoint.run("sidewalk_density", sidewalk_density, sidewalks, sidewalk_area_field,
+                              geographical_units, geographic_id_field, scratch)
+    transportation = checkpoint.run("transportation_access", transportation_access, transportation_points,
+                                    transportation_id_field, geographical_units, geographic_id_field,
+                                    population_field, scratch)
+    access_to_parks = checkpoint.run("parks_access", parks_access, parks, sidewalks, geographical_units, scratch)
+    network = checkpoint.run("street_network_density", street_network_density, street_network,
+                             roads_area_field, geographical_units, geographic_id_field, scratch)
+    scratch.cleanup()
 
-    with arcpy.da.UpdateCursor(geographical_units, ["ct_id", "land_use_diversity", "commercial_density", "intersection_density"]) as cursor:
-        for row in cursor:
-            row[1] = land_use_diversity[row[0]]
-            row[2] = commercial_density[row[0]]
-            row[3] = intersection_density[row[0]]
-            cursor.updateRow(row)
+    # Step 9: Combine metrics to calculate Pedestrian Environment Index.
+    arcpy.AddMessage("Combining metrics to calculate Pedestrian Environment Index.")
 
-    arcpy.CalculateField_management(geographical_units, output, f"((1 + !land_use_diversity!) * (1 + !pop_density!) * "
-                                                                f"(1 + !commercial_density!) * (1 + !intersection_density!) "
-                                                                f"* (1 + !sidewalk_density!) * (1 + !transportation_access!) "
-                                                                f"* (1 + !parks_access!) * (1 + !sn_density!))/256")
+    with tracer.stage("composite") as record:
+        ct_ids = []
+        with arcpy.da.SearchCursor(geographical_units, ["ct_id"]) as cursor:
+            for row in cursor:
+                ct_ids.append(row[0])
+        parks_by_tract = {ct_id: access_to_parks[math.floor(ct_id)] if ct_id in access_to_parks else 0
+                          for ct_id in ct_ids}
+
+        # The composite is evaluated in memory from the sub metric arrays, so re-weighting never touches the gdb.
+        composite = PEIComposite(ct_ids, {"land_use_diversity": land_use_diversity,
+                                          "pop_density": population,
+                                          "commercial_density": commercial,
+                                          "intersection_density": intersection,
+                                          "sidewalk_density": sidewalk,
+                                          "transportation_access": transportation,
+                                          "parks_access": parks_by_tract,
+                                          "sn_density": network})
+        pei = composite.weighted_product(weights)
+        record.update(rows_in=len(ct_ids), rows_out=len(pei))
+
+    # Every sub metric and the PEI are aligned to the sorted ct_id order and written back in a single operation.
+    columns = {name: composite.values[i] for i, name in enumerate(composite.names) if name != "pop_density"}
+    columns[output] = pei
+    tracer.run("bulk_write", bulk_write, geographical_units, "ct_id", composite.ct_id, columns, rows_in=len(pei))
+    tracer.report()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,166 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_ArcpyTrace
+# Purpose: The purpose of this script is to show where the time goes inside the existing arcpy based scripts, such as
+# Final_PEI and the Enhanced_PEI scripts, without changing them. A proxy wraps the arcpy module and its submodules
+# (arcpy.sa, arcpy.management, ...) so every geoprocessing call (SpatialJoin_analysis, SummarizeAttributes_gapro,
+# CostDistance, ...) is recorded as a PEI_Trace stage with its arguments, duration and the feature or row count of its
+# output. Installing the proxy in sys.modules before a script runs makes it a drop-in for any script, and the proxy
+# wraps any module object, so the tracer itself also runs against a stand-in module where arcpy is not installed.
+#
+# Steps
+# Step 1: Wrap the module so every function call becomes a traced stage, recursing into submodules.
+# Step 2: Count the rows of the output dataset of every call.
+# Step 3: Install the proxy in place of arcpy and run a script with it.
+# Step 4: Write a profile report of the calls grouped by tool.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import argparse
+import runpy
+import sys
+import types
+from PEI_Trace import Tracer
+
+ARGUMENT_LENGTH = 200
+
+
+def short_repr(value):
+    text = repr(value)
+    return text if len(text) <= ARGUMENT_LENGTH else text[:ARGUMENT_LENGTH - 3] + "..."
+
+
+def output_of(result):
+    # The first output of a geoprocessing Result, or the result itself when it is a dataset path.
+    if hasattr(result, "getOutput"):
+        try:
+            return result.getOutput(0)
+        except Exception:
+            return None
+    return result if isinstance(result, str) else None
+
+
+class TracedModule:
+
+    def __init__(self, module, tracer, name=None, count_outputs=True, root=None):
+        # Step 1: Wrap the module. Attribute writes, such as arcpy.env settings, pass through to the module.
+        object.__setattr__(self, "_module", module)
+        object.__setattr__(self, "_tracer", tracer)
+        object.__setattr__(self, "_name", name or module.__name__)
+        object.__setattr__(self, "_count_outputs", count_outputs)
+        object.__setattr__(self, "_root", root or module)
+        object.__setattr__(self, "_wrapped", {})
+
+    def __getattr__(self, attribute):
+        value = getattr(self._module, attribute)
+        if isinstance(value, types.ModuleType):
+            return TracedModule(value, self._tracer, f"{self._name}.{attribute}", self._count_outputs, self._root)
+        if not callable(value) or isinstance(value, type):
+            return value
+        if attribute not in self._wrapped:
+            self._wrapped[attribute] = self._wrap(attribute, value)
+        return self._wrapped[attribute]
+
+    def __setattr__(self, attribute, value):
+        setattr(self._module, attribute, value)
+
+    def __dir__(self):
+        return dir(self._module)
+
+    @property
+    def __all__(self):
+        # Names bound by "from arcpy.sa import *" through the proxy.
+        return getattr(self._module, "__all__", [name for name in dir(self._module) if not name.startswith("_")])
+
+    def _wrap(self, attribute, function):
+        tracer, name = self._tracer, f"{self._name}.{attribute}"
+
+        def traced(*args, **kwargs):
+            arguments = [short_repr(a) for a in args] + [f"{k}={short_repr(v)}" for k, v in kwargs.items()]
+            with tracer.stage(name, tool=attribute, arguments=arguments) as record:
+                result = function(*args, **kwargs)
+                if self._count_outputs:
+                    record["output"], record["rows_out"] = self._count(output_of(result))
+            return result
+
+        traced.__name__ = attribute
+        traced.__doc__ = function.__doc__
+        return traced
+
+    def _count(self, output):
+        # Step 2: Row count of the output dataset through the unwrapped module, so counting is not traced itself.
+        if output is None:
+            return None, None
+        try:
+            if not self._root.Exists(output):
+                return str(output), None
+            return str(output), int(self._root.GetCount_management(output).getOutput(0))
+        except Exception:
+            return str(output), None
+
+
+def install(tracer, module_name="arcpy", count_outputs=True):
+    # Step 3: Replace the module and its loaded submodules in sys.modules with traced proxies, so scripts importing
+    # it afterwards use the proxy. Returns the proxy.
+    __import__(module_name)
+    root = sys.modules[module_name]
+    for name in [name for name in sys.modules if name == module_name or name.startswith(f"{module_name}.")]:
+        module = sys.modules[name]
+        if isinstance(module, types.ModuleType):
+            sys.modules[name] = TracedModule(module, tracer, name, count_outputs, root)
+    return sys.modules[module_name]
+
+
+def uninstall(module_name="arcpy"):
+    for name in [name for name in sys.modules if name == module_name or name.startswith(f"{module_name}.")]:
+        if isinstance(sys.modules[name], TracedModule):
+            sys.modules[name] = sys.modules[name]._module
+
+
+def profile(records):
+    # Step 4: Profile table of the traced calls grouped by tool, ranked by total time.
+    tools = {}
+    for record in records:
+        if "tool" in record:
+            tools.setdefault(record["stage"], []).append(record)
+    lines = [f"{'tool':<48}{'calls':>7}{'total s':>10}{'mean s':>10}{'max s':>10}{'rows out':>12}"]
+    for name, calls in sorted(tools.items(), key=lambda item: -sum(r["wall_seconds"] for r in item[1])):
+        seconds = [r["wall_seconds"] for r in calls]
+        rows = sum(r["rows_out"] or 0 for r in calls)
+        lines.append(f"{name[:48]:<48}{len(calls):>7}{sum(seconds):>10.3f}{sum(seconds) / len(calls):>10.3f}"
+                     f"{max(seconds):>10.3f}{rows:>12}")
+    return "\n".join(lines)
+
+
+def main():
+    # Steps 3 and 4: Run a script with arcpy traced, for example
+    # python PEI_ArcpyTrace.py --trace final_pei_trace.jsonl Final_PEI.py <script arguments>
+    parser = argparse.ArgumentParser(description="Trace every arcpy call of a script.")
+    parser.add_argument("script")
+    parser.add_argument("--trace", help="JSON lines file with one record per call.")
+    parser.add_argument("--report", help="Profile report file, printed when omitted.")
+    parser.add_argument("--module", default="arcpy")
+    parser.add_argument("--no-counts", action="store_true", help="Skip counting the output rows of every call.")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    tracer = Tracer(args.trace)
+    install(tracer, args.module, not args.no_counts)
+    sys.argv = [args.script] + args.arguments
+    try:
+        runpy.run_path(args.script, run_name="__main__")
+    finally:
+        uninstall(args.module)
+        report = profile(tracer.records)
+        if args.report:
+            with open(args.report, "w") as f:
+                f.write(report + "\n")
+        else:
+            print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Benchmark
+# Purpose: The purpose of this script is to time every sub metric engine and the full composite on synthetic cities
+# of increasing size, so throughput and memory regressions can be tracked from release to release. Every sub metric
+# runs on the whole synthetic study area as one partition, followed by the reduce step and the weighted product
+# composite, exactly as a single worker of PEI_Partition would. Results are written as a csv table with one row per
+# scale and stage.
+#
+# Steps
+# Step 1: Generate a synthetic city for every scale.
+# Step 2: Time every sub metric and the composite with PEI_Trace.
+# Step 3: Write the wall time, CPU time, peak memory and throughput of every stage.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import argparse
+import numpy as np
+from PEI_Composite import PEIComposite
+from PEI_Partition import SUB_METRICS, partition_task, reduce_metrics
+from PEI_Sensitivity import write_report
+from PEI_Synthetic import synthetic_city
+from PEI_Trace import Tracer
+
+DEFAULT_SCALES = (1000, 10000, 100000, 1000000)
+
+
+def benchmark(n_lots, tracer, seed=0):
+    # Steps 1 and 2: Generate one synthetic city and time every sub metric and the composite on it.
+    with tracer.stage(f"{n_lots}/synthetic_city", rows_in=n_lots) as record:
+        inputs, keys = synthetic_city(n_lots, seed=seed)
+        record["rows_out"] = len(keys)
+    n = len(inputs["tracts"]["ct_id"])
+    area = np.asarray(inputs["tracts"]["area"], dtype=float)
+    task = partition_task(inputs, np.arange(n))
+    result = {"positions": task["positions"]}
+    for name, sub_metric in SUB_METRICS.items():
+        with tracer.stage(f"{n_lots}/{name}", rows_in=n_lots) as record:
+            result.update(sub_metric(task, n, area))
+            record["rows_out"] = n
+    with tracer.stage(f"{n_lots}/composite", rows_in=n) as record:
+        metrics = reduce_metrics([result], n)
+        pei = PEIComposite(inputs["tracts"]["ct_id"], metrics).weighted_product()
+        record["rows_out"] = len(pei)
+    return pei
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pedestrian Environment Index scaling benchmark.")
+    parser.add_argument("--scales", default=",".join(str(s) for s in DEFAULT_SCALES),
+                        help="Comma separated numbers of land use lots, up to 10000000.")
+    parser.add_argument("--output", default="pei_benchmark.csv", help="Output csv file.")
+    parser.add_argument("--trace", help="Optional JSON lines trace file.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    tracer = Tracer(args.trace)
+    scales = [int(s) for s in args.scales.split(",") if s]
+    for n_lots in scales:
+        benchmark(n_lots, tracer, args.seed)
+
+    # Step 3: Write the wall time, CPU time, peak memory and throughput of every stage.
+    records = tracer.records
+    wall = np.array([r["wall_seconds"] for r in records])
+    n_lots = np.array([int(r["stage"].split("/")[0]) for r in records])
+    write_report({"n_lots": n_lots,
+                  "stage": np.array([r["stage"].split("/")[1] for r in records]),
+                  "wall_seconds": wall,
+                  "cpu_seconds": np.array([r["cpu_seconds"] for r in records]),
+                  "peak_rss_mb": np.array([np.nan if r["peak_rss"] is None else r["peak_rss"] / 2 ** 20
+                                           for r in records]).round(1),
+                  "rows_out": np.array([r["rows_out"] for r in records]),
+                  "lots_per_second": (n_lots / np.maximum(wall, 1e-9)).round(0)},
+                 args.output)
+    tracer.report()
+
+
+if __name__ == '__main__':
+    main()
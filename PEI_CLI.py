@@ -0,0 +1,175 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_CLI
+# Purpose: The purpose of this script is to provide a single command line entry point for every sub metric and the
+# Pedestrian Environment Index composite, with the backend chosen at run time. The arcpy backend runs the stages of
+# Final_PEI on feature classes and is the only path that imports arcpy. The NumPy backend runs the PEI_Partition
+# engines on layer files or on a synthetic city. Nothing heavy is imported before the subcommand and backend are
+# known, so the command line starts in well under a second when arcpy is not requested.
+#
+# Steps
+# Step 1: Parse the subcommand, backend and inputs.
+# Step 2: Load the backend lazily.
+# Step 3: Calculate the sub metric or the composite.
+# Step 4: Write the per census tract results as a csv table.
+#
+# Examples
+# python PEI_CLI.py composite --inputs layers_2020 --output pei.csv --weights "1;1;1;1;2;1;1;1"
+# python PEI_CLI.py parks-access --synthetic 100000 --output parks.csv
+# python PEI_CLI.py land-use-mix --backend arcpy --gdb C:\PEI\pei.gdb --land-use-file lots --land-use-area Shape_Area
+#     --land-uses LandUse --tracts census_tracts --output land_use_mix.csv
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import argparse
+import os
+import sys
+
+SUB_METRICS = ["land_use_mix", "population_density", "commercial_density", "intersection_density",
+               "sidewalk_density", "transportation_access", "parks_access", "street_network_density"]
+COMPOSITE = "composite"
+LAYERS = ["tracts", "lots", "nodes", "sidewalks", "roads", "stops", "raster"]
+# Final_PEI tool parameters in order, as (option, help).
+ARCPY_PARAMETERS = [("land_use_file", "Land use polygons feature class."),
+                    ("land_use_area", "Area field of the land use polygons."),
+                    ("commercial_area", "Commercial area field of the land use polygons."),
+                    ("land_uses", "Land use classification field of the land use polygons."),
+                    ("tracts", "Census tracts feature class."),
+                    ("tract_id", "Census tract id field."),
+                    ("population_field", "Population field of the census tracts."),
+                    ("area_field", "Area field of the census tracts."),
+                    ("street_network", "Street network feature class."),
+                    ("roads_area_field", "Area field of the roads."),
+                    ("sidewalks", "Sidewalk polygons feature class."),
+                    ("sidewalk_area_field", "Area field of the sidewalks."),
+                    ("transportation_points", "Transportation stops feature class."),
+                    ("transportation_id_field", "Unique id field of the transportation stops."),
+                    ("parks", "Parks polygon feature class."),
+                    ("gdb", "Input geodatabase, also used as the workspace."),
+                    ("pei_field", "Output PEI field of the census tracts.")]
+# Final_PEI stage arguments of every sub metric, by tool parameter name.
+ARCPY_STAGES = {"land_use_mix": ["land_use_file", "land_use_area", "land_uses", "tracts", "tract_id", "scratch"],
+                "population_density": ["tracts", "tract_id", "population_field"],
+                "commercial_density": ["land_use_file", "land_use_area", "commercial_area", "land_uses", "tracts",
+                                       "tract_id", "scratch"],
+                "intersection_density": ["street_network", "tracts", "tract_id", "scratch"],
+                "sidewalk_density": ["sidewalks", "sidewalk_area_field", "tracts", "tract_id", "scratch"],
+                "transportation_access": ["transportation_points", "transportation_id_field", "tracts", "tract_id",
+                                          "population_field", "scratch"],
+                "parks_access": ["parks", "sidewalks", "tracts", "scratch"],
+                "street_network_density": ["street_network", "roads_area_field", "tracts", "tract_id", "scratch"]}
+
+
+def command_name(name):
+    return name.replace("_", "-")
+
+
+def parser():
+    # Step 1: One subcommand per sub metric and one for the composite, all sharing the backend and input options.
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--backend", choices=["numpy", "arcpy"], default="numpy")
+    common.add_argument("--output", required=True, help="Output csv file with one row per census tract.")
+    numpy_options = common.add_argument_group("numpy backend")
+    numpy_options.add_argument("--inputs", help="Directory with one .npz or .parquet file per layer "
+                                                f"({', '.join(LAYERS)}).")
+    numpy_options.add_argument("--synthetic", type=int, help="Use a synthetic city with this many lots instead, with "
+                                                             "the county of every census tract in a county column.")
+    numpy_options.add_argument("--partition-field", help="Census tract column used as partition key of the composite.")
+    numpy_options.add_argument("--workers", type=int, default=1)
+    arcpy_options = common.add_argument_group("arcpy backend")
+    for name, description in ARCPY_PARAMETERS:
+        arcpy_options.add_argument(f"--{command_name(name)}", dest=name, default="", help=description)
+    arcpy_options.add_argument("--resume", action="store_true", help="Resume a failed composite run.")
+    main_parser = argparse.ArgumentParser(description="Pedestrian Environment Index command line.")
+    subcommands = main_parser.add_subparsers(dest="command", required=True)
+    for name in SUB_METRICS:
+        subcommands.add_parser(command_name(name), parents=[common], help=f"Calculate the {name} sub metric.")
+    composite = subcommands.add_parser(COMPOSITE, parents=[common], help="Calculate every sub metric and the PEI.")
+    composite.add_argument("--weights", default="", help="Sub metric weights, for example 1;1;1;1;2;1;1;1.")
+    return main_parser
+
+
+def load_inputs(args):
+    # Step 2: The PEI_Partition inputs from layer files or a synthetic city.
+    if args.synthetic:
+        from PEI_Synthetic import synthetic_city
+        inputs, keys = synthetic_city(args.synthetic)
+        inputs["tracts"]["county"] = keys
+        return inputs
+    if not args.inputs:
+        raise SystemExit("The numpy backend needs --inputs or --synthetic.")
+    # GeoParquet lots are read with column and bounding box pushdown, against the census tracts when they are
+    # GeoParquet too.
+    from PEI_TimeSeries import LAYER_COLUMNS, load_layer
+    tracts = os.path.join(args.inputs, "tracts.parquet")
+    bbox = None
+    if os.path.exists(tracts):
+        from PEI_IO import is_geoparquet
+        bbox = tracts if is_geoparquet(tracts) else None
+    inputs = {}
+    for layer in LAYERS:
+        for extension in (".npz", ".parquet"):
+            path = os.path.join(args.inputs, layer + extension)
+            if os.path.exists(path):
+                inputs[layer] = load_layer(path, LAYER_COLUMNS.get(layer), bbox if layer == "lots" else None)
+    return inputs
+
+
+def run_numpy(command, args):
+    # Step 3: Calculate a sub metric or the composite with the NumPy engines.
+    import numpy as np
+    from PEI_Partition import partition_metrics, partition_task, reduce_metrics, run_partitioned
+    inputs = load_inputs(args)
+    tracts = inputs["tracts"]
+    n = len(tracts["ct_id"])
+    if command == COMPOSITE:
+        from PEI_Composite import PEIComposite, parse_weights
+        keys = tracts[args.partition_field] if args.partition_field else np.zeros(n)
+        composite = PEIComposite(tracts["ct_id"], run_partitioned(inputs, keys, args.workers))
+        columns = {"ct_id": composite.ct_id}
+        columns.update({name: composite.values[i] for i, name in enumerate(composite.names)})
+        columns["PEI"] = composite.weighted_product(parse_weights(args.weights))
+        return columns
+    task = partition_task(inputs, np.arange(n))
+    metrics = reduce_metrics([partition_metrics(task, [command])], n)
+    return dict({"ct_id": np.asarray(tracts["ct_id"])}, **metrics)
+
+
+def run_arcpy(command, args):
+    # Step 3: Run a Final_PEI stage, or Final_PEI itself for the composite. arcpy is only imported here.
+    import arcpy
+    import numpy as np
+    import Final_PEI
+    arcpy.env.workspace = args.gdb
+    if command == COMPOSITE:
+        sys.argv = [Final_PEI.__file__] + [getattr(args, name) for name, _ in ARCPY_PARAMETERS] + \
+            [args.weights, str(args.resume).lower()]
+        Final_PEI.main()
+        from PEI_Reference import golden_from_table
+        ct_ids, metrics = golden_from_table(args.tracts, "ct_id", args.pei_field)
+        return dict({"ct_id": ct_ids}, **metrics)
+    from PEI_Scratch import ScratchStore
+    with ScratchStore() as scratch:
+        values = dict(vars(args), scratch=scratch)
+        result = getattr(Final_PEI, command)(*(values[name] for name in ARCPY_STAGES[command]))
+    ct_ids = sorted(result)
+    return {"ct_id": np.array(ct_ids), command: np.array([np.nan if result[c] is None else result[c] for c in ct_ids],
+                                                         dtype=float)}
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    command = args.command.replace("-", "_")
+    columns = run_arcpy(command, args) if args.backend == "arcpy" else run_numpy(command, args)
+
+    # Step 4: Write the per census tract results as a csv table.
+    from PEI_Sensitivity import write_report
+    write_report(columns, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Checkpoint
+# Purpose: The purpose of this script is to persist the per census tract result of every completed sub metric stage
+# of a long Pedestrian Environment Index run, so a run that fails late can resume at the first incomplete stage
+# instead of starting again from the land use spatial join. Each stage result is stored as a .npz file of ct_id and
+# value arrays, and a manifest records the stage metadata and a signature of the run inputs, so checkpoints are never
+# reused for a run with different inputs. The signature covers the tool parameters and a cheap fingerprint of every
+# input layer, so editing a layer in place also invalidates the checkpoints.
+#
+# Steps
+# Step 1: Open the checkpoint directory and discard the manifest if it was written for different inputs.
+# Step 2: Skip completed stages by loading their per census tract results.
+# Step 3: Run incomplete stages and save their results and metadata atomically.
+# Step 4: Trace every stage, loaded or run, when a PEI_Trace tracer is given.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import time
+from contextlib import nullcontext
+import numpy as np
+
+MANIFEST = "manifest.json"
+
+
+def input_signature(*values):
+    # Signature of the run inputs, such as tool parameters, used to tell whether checkpoints belong to this run.
+    digest = hashlib.sha1()
+    for value in values:
+        digest.update(str(value).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def layer_fingerprint(layer, fields=()):
+    # Cheap content fingerprint of an input layer: its row count and extent, the modification time of its files when
+    # it is a file on disk such as a shapefile, and a digest of the given attribute fields. The fields are meant for
+    # small layers such as the census tracts and must leave out the fields the run itself writes, so resuming does
+    # not invalidate the checkpoints.
+    import arcpy
+    extent = arcpy.Describe(layer).extent
+    fingerprint = [int(arcpy.GetCount_management(layer)[0]), extent.XMin, extent.YMin, extent.XMax, extent.YMax]
+    base = os.path.splitext(str(layer))[0]
+    for extension in (".shp", ".dbf", ".parquet"):
+        if os.path.exists(base + extension):
+            fingerprint.append(os.path.getmtime(base + extension))
+    if fields:
+        digest = hashlib.sha1()
+        with arcpy.da.SearchCursor(layer, list(fields)) as cursor:
+            for row in cursor:
+                digest.update(repr(row).encode())
+        fingerprint.append(digest.hexdigest())
+    return fingerprint
+
+
+def write_atomic(path, write):
+    # Writes through a temporary file and renames it, so a crash never leaves a half written checkpoint.
+    temporary = f"{path}.tmp"
+    write(temporary)
+    os.replace(temporary, path)
+
+
+class Checkpoint:
+
+    def __init__(self, directory, signature, log=print, tracer=None):
+        # Step 1: Open the checkpoint directory and discard the manifest if it was written for different inputs.
+        self.directory = directory
+        self.signature = signature
+        self.log = log
+        self.tracer = tracer
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = {"signature": signature, "stages": {}}
+        manifest_path = os.path.join(directory, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("signature") == signature:
+                self.manifest = manifest
+
+    def _write_manifest(self):
+        def write(path):
+            with open(path, "w") as f:
+                json.dump(self.manifest, f, indent=2)
+        write_atomic(os.path.join(self.directory, MANIFEST), write)
+
+    def stage_path(self, stage):
+        return os.path.join(self.directory, f"{stage}.npz")
+
+    def reset(self):
+        # Removes every stage result, used when a run is started without resuming.
+        for stage in list(self.manifest["stages"]):
+            if os.path.exists(self.stage_path(stage)):
+                os.remove(self.stage_path(stage))
+        self.manifest = {"signature": self.signature, "stages": {}}
+        self._write_manifest()
+
+    def done(self, stage):
+        return stage in self.manifest["stages"] and os.path.exists(self.stage_path(stage))
+
+    def first_incomplete(self, stages):
+        for stage in stages:
+            if not self.done(stage):
+                return stage
+        return None
+
+    def save(self, stage, values, **metadata):
+        # Step 3: Save a {ct_id: value} stage result and its metadata. Null values are stored as NaN.
+        ct_ids = np.array(list(values))
+        column = np.array([np.nan if value is None else value for value in values.values()], dtype=float)
+
+        def write(path):
+            with open(path, "wb") as f:
+                np.savez(f, ct_id=ct_ids, value=column)
+        write_atomic(self.stage_path(stage), write)
+        self.manifest["stages"][stage] = dict(metadata, rows=len(ct_ids),
+                                              completed=time.strftime("%Y-%m-%d %H:%M:%S"))
+        self._write_manifest()
+
+    def load(self, stage):
+        # Step 2: Load a completed stage result as a {ct_id: value} dictionary.
+        with np.load(self.stage_path(stage)) as data:
+            return dict(zip(data["ct_id"].tolist(), data["value"].tolist()))
+
+    def run(self, stage, function, *args):
+        # Steps 2-4: Load the stage result if the stage is complete, otherwise run it and save its result.
+        with self.tracer.stage(stage) if self.tracer is not None else nullcontext({}) as record:
+            if self.done(stage):
+                self.log(f"Resuming: {stage} already completed on {self.manifest['stages'][stage]['completed']}.")
+                values = self.load(stage)
+                record["resumed"] = True
+            else:
+                start = time.time()
+                values = function(*args)
+                self.save(stage, values, seconds=round(time.time() - start, 3))
+            record["rows_out"] = len(values)
+        return values
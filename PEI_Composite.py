@@ -0,0 +1,130 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Composite
+# Purpose: The purpose of this script is to combine the normalized sub metrics into the Pedestrian Environment
+# Index without going back to the geodatabase. The per census tract sub metric arrays are stored once, sorted by
+# census tract id, and the composite is evaluated with NumPy using weights supplied at call time. With every weight
+# equal to 1 the weighted product reproduces the original ((1 + a) * ... * (1 + h))/2^n formula used by the
+# Pedestrian_Environment_Index, Enhanced_PEI and Final_PEI scripts.
+#
+# Steps
+# Step 1: Align every sub metric to the sorted census tract ids, filling missing tracts with 0.
+# Step 2: Cache the log of each (1 + metric)/2 term so weighted products become a single matrix product.
+# Step 3: Evaluate the weighted product or weighted sum composite for one or many weight vectors.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import numpy as np
+
+# Sub metric fields written to the census tract layer by Final_PEI, in the order of the original composite formula.
+PEI_METRICS = ["land_use_diversity", "pop_density", "commercial_density", "intersection_density",
+               "sidewalk_density", "transportation_access", "parks_access", "sn_density"]
+
+COMPOSITE_METHODS = ("product", "sum")
+
+
+class PEIComposite:
+
+    def __init__(self, ct_ids, metrics):
+        # Step 1: Align every sub metric to the sorted census tract ids, filling missing tracts with 0.
+        # metrics maps a sub metric name to either a {ct_id: value} dictionary, like the ones built from the
+        # search cursors in Final_PEI, or an array in the same order as ct_ids.
+        ct_ids = np.asarray(ct_ids)
+        order = np.argsort(ct_ids, kind="stable")
+        self.ct_id = ct_ids[order]
+        self.names = list(metrics)
+        self.values = np.zeros((len(self.names), len(self.ct_id)))
+        for i, name in enumerate(self.names):
+            source = metrics[name]
+            if isinstance(source, dict):
+                column = [source.get(ct_id) for ct_id in self.ct_id.tolist()]
+                self.values[i] = [0 if value is None else value for value in column]
+            else:
+                self.values[i] = np.asarray(source, dtype=float)[order]
+        self.values = np.nan_to_num(self.values, nan=0.0)
+        # Step 2: Cache the log of each (1 + metric)/2 term so weighted products become a single matrix product.
+        self._log_terms = np.log1p(self.values) - np.log(2)
+
+    def __len__(self):
+        return len(self.ct_id)
+
+    def weight_vector(self, weights=None):
+        # Weights can be None (equal weights of 1), a {metric: weight} dictionary where unlisted metrics keep a
+        # weight of 1, a single sequence with one weight per metric, or a (draws x metrics) matrix.
+        if weights is None:
+            return np.ones(len(self.names))
+        if isinstance(weights, dict):
+            unknown = set(weights) - set(self.names)
+            if unknown:
+                raise ValueError(f"Unknown sub metrics in weights: {sorted(unknown)}")
+            return np.array([float(weights.get(name, 1.0)) for name in self.names])
+        weights = np.asarray(weights, dtype=float)
+        if weights.shape[-1] != len(self.names):
+            raise ValueError(f"Expected {len(self.names)} weights, got {weights.shape[-1]}.")
+        return weights
+
+    def weighted_product(self, weights=None):
+        # Step 3: prod(((1 + m) / 2) ** w) evaluated as exp(w @ log((1 + m) / 2)). A (draws x metrics) weight
+        # matrix returns a (draws x tracts) matrix of composites.
+        return np.exp(self.weight_vector(weights) @ self._log_terms)
+
+    def weighted_sum(self, weights=None):
+        # Step 3: sum(w * m) / sum(w), which keeps the composite between 0 and 1 like the sub metrics.
+        weights = self.weight_vector(weights)
+        total = weights.sum(axis=-1, keepdims=True)
+        if np.any(total == 0):
+            raise ValueError("Weights must not sum to 0 for a weighted sum composite.")
+        return (weights @ self.values) / total
+
+    def composite(self, weights=None, method="product"):
+        if method == "product":
+            return self.weighted_product(weights)
+        if method == "sum":
+            return self.weighted_sum(weights)
+        raise ValueError(f"Unknown composite method {method!r}, expected one of {COMPOSITE_METHODS}.")
+
+    def simulate(self, replacements, weights=None, method="product"):
+        # Evaluates the composite with some sub metrics replaced by (draws x tracts) matrices in sorted ct_id order,
+        # while the remaining sub metrics stay fixed. Returns a (draws x tracts) matrix of composites.
+        unknown = set(replacements) - set(self.names)
+        if unknown:
+            raise ValueError(f"Unknown sub metrics in replacements: {sorted(unknown)}")
+        if method not in COMPOSITE_METHODS:
+            raise ValueError(f"Unknown composite method {method!r}, expected one of {COMPOSITE_METHODS}.")
+        weights = self.weight_vector(weights)
+        fixed = [i for i, name in enumerate(self.names) if name not in replacements]
+        if method == "product":
+            total = weights[fixed] @ self._log_terms[fixed]
+            for name, draws in replacements.items():
+                total = total + weights[self.names.index(name)] * (np.log1p(draws) - np.log(2))
+            return np.exp(total)
+        total = weights[fixed] @ self.values[fixed]
+        for name, draws in replacements.items():
+            total = total + weights[self.names.index(name)] * draws
+        return total / weights.sum()
+
+    def as_dict(self, values):
+        # Maps a per tract composite back to {ct_id: value} for writing through an update cursor.
+        return dict(zip(self.ct_id.tolist(), np.asarray(values).tolist()))
+
+
+def parse_weights(text, names=PEI_METRICS):
+    # Parses the semicolon separated weights tool parameter ("1;1;0.5;..." or "pop_density=2;parks_access=0.5").
+    # An empty parameter means equal weights.
+    if not text:
+        return None
+    parts = [part.strip() for part in text.split(";") if part.strip()]
+    if all("=" in part for part in parts):
+        weights = {}
+        for part in parts:
+            name, value = part.split("=", 1)
+            weights[name.strip()] = float(value)
+        return weights
+    weights = [float(part) for part in parts]
+    if len(weights) != len(names):
+        raise ValueError(f"Expected {len(names)} weights, got {len(weights)}.")
+    return weights
@@ -0,0 +1,121 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Cube
+# Purpose: The purpose of this script is to store the additive base quantities behind the land use mix, population,
+# commercial, intersection, sidewalk and street network density sub metrics on a fine base layer, such as census
+# blocks or a grid from PEI_Grid, so the same sub metrics can be produced for any coarser geography (census tracts,
+# NTAs, ZIP codes, council districts) by summing through a precomputed crosswalk instead of re-running the overlays.
+# Every stored quantity is a sum (areas, populations, weighted intersection counts), so aggregating is a sparse matrix
+# product and a new geography takes seconds. The 2SFCA transportation access and the median cost distance to parks are
+# not additive and are calculated per geography with PEI_Engines.
+#
+# Steps
+# Step 1: Sum the base quantities of every base unit from features already assigned to base units.
+# Step 2: Build a sparse crosswalk from base units to the units of a coarser geography, with area weights.
+# Step 3: Aggregate the base quantities to the coarser geography through the crosswalk.
+# Step 4: Calculate and normalize the sub metrics from the aggregated quantities.
+# Step 5: Save and load the cube.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import numpy as np
+from scipy import sparse
+import PEI_Engines as engines
+
+# Additive quantities stored for every unit, besides the area by land use matrix.
+QUANTITIES = ["unit_area", "population", "lot_area", "commercial_area", "intersection_weight", "sidewalk_area",
+              "road_area"]
+
+
+class StatisticsCube:
+
+    def __init__(self, unit_id, land_uses, land_use_area, quantities):
+        # land_use_area is a sparse (units x land uses) matrix of lot area and quantities maps every name of
+        # QUANTITIES to one value per unit.
+        self.unit_id = np.asarray(unit_id)
+        self.land_uses = np.asarray(land_uses)
+        self.land_use_area = sparse.csr_matrix(land_use_area)
+        self.quantities = {name: np.asarray(quantities[name], dtype=float) for name in QUANTITIES}
+
+    def __len__(self):
+        return len(self.unit_id)
+
+    @classmethod
+    def from_inputs(cls, inputs):
+        # Step 1: Sum the base quantities of every base unit from features already assigned to base units, using the
+        # PEI_Partition input layout where the base units take the place of the census tracts.
+        units = inputs["tracts"]
+        n = len(units["ct_id"])
+        lots, nodes = inputs["lots"], inputs["nodes"]
+        lot_index = np.asarray(lots["tract_index"])
+        valid = lot_index >= 0
+        land_uses, codes = np.unique(np.asarray(lots["land_use"])[valid], return_inverse=True)
+        land_use_area = sparse.csr_matrix((np.asarray(lots["land_use_area"], dtype=float)[valid],
+                                           (lot_index[valid], codes)), shape=(n, len(land_uses)))
+        degree = np.asarray(nodes["degree"], dtype=float)
+        quantities = {"unit_area": units["area"],
+                      "population": units["population"],
+                      "lot_area": engines.tract_sums(lot_index, lots["land_use_area"], n),
+                      "commercial_area": engines.tract_sums(lot_index, lots["commercial_area"], n),
+                      "intersection_weight": engines.tract_sums(np.where(degree > 2, nodes["tract_index"], -1),
+                                                                degree, n),
+                      "sidewalk_area": engines.tract_sums(inputs["sidewalks"]["tract_index"],
+                                                          inputs["sidewalks"]["area"], n),
+                      "road_area": engines.tract_sums(inputs["roads"]["tract_index"], inputs["roads"]["area"], n)}
+        return cls(units["ct_id"], land_uses, land_use_area, quantities)
+
+    def aggregate(self, crosswalk, target_id):
+        # Step 3: Aggregate the base quantities to the coarser geography through a (base units x target units)
+        # crosswalk, returning a new cube for the target units.
+        crosswalk = sparse.csr_matrix(crosswalk)
+        if crosswalk.shape[0] != len(self):
+            raise ValueError(f"Crosswalk has {crosswalk.shape[0]} base units, the cube has {len(self)}.")
+        transposed = crosswalk.T.tocsr()
+        quantities = {name: transposed @ values for name, values in self.quantities.items()}
+        return StatisticsCube(target_id, self.land_uses, transposed @ self.land_use_area, quantities)
+
+    def metrics(self):
+        # Step 4: Calculate and normalize the additive sub metrics, in the unit order of the cube.
+        q = self.quantities
+        area = q["unit_area"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bn_com_sum = np.where(q["lot_area"] > 0, q["commercial_area"] / q["lot_area"], 0.0)
+            bn_intersection = np.where(area > 0, q["intersection_weight"] / (area * engines.SQUARE_FEET), 0.0)
+            bn_sidewalk_density = np.where(area > 0, q["sidewalk_area"] / area, 0.0)
+            bn_network_density = np.where(area > 0, q["road_area"] / area, 0.0)
+        present = np.asarray(self.land_use_area.sum(axis=0)).ravel() > 0
+        return {"land_use_diversity": engines.normalize_land_use_mix(engines.shannon_sum(self.land_use_area),
+                                                                     int(present.sum())),
+                "pop_density": engines.population_density(q["population"], area)[1],
+                "commercial_density": engines.normalize_commercial_density(bn_com_sum),
+                "intersection_density": engines.normalize(bn_intersection),
+                "sidewalk_density": engines.normalize(bn_sidewalk_density),
+                "sn_density": engines.normalize(bn_network_density)}
+
+    def save(self, path):
+        # Step 5: Save the cube as a single .npz file.
+        matrix = self.land_use_area
+        np.savez(path, unit_id=self.unit_id, land_uses=self.land_uses, data=matrix.data, indices=matrix.indices,
+                 indptr=matrix.indptr, shape=np.array(matrix.shape), **self.quantities)
+
+    @classmethod
+    def load(cls, path):
+        # Step 5: Load a cube saved with save.
+        with np.load(path) as data:
+            matrix = sparse.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=tuple(data["shape"]))
+            return cls(data["unit_id"], data["land_uses"], matrix, {name: data[name] for name in QUANTITIES})
+
+
+def crosswalk(base_index, target_index, n_base, n_target, weight=None):
+    # Step 2: Sparse (base units x target units) crosswalk. Every (base_index, target_index) pair is one overlap of a
+    # base unit with a target unit and weight is the share of the base unit in that target unit, for example the
+    # overlap area over the base unit area. Without weights every base unit belongs entirely to its target unit.
+    base_index = np.asarray(base_index)
+    target_index = np.asarray(target_index)
+    weight = np.ones(len(base_index)) if weight is None else np.asarray(weight, dtype=float)
+    keep = (base_index >= 0) & (target_index >= 0)
+    return sparse.csr_matrix((weight[keep], (base_index[keep], target_index[keep])), shape=(n_base, n_target))
@@ -0,0 +1,285 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Distributed
+# Purpose: The purpose of this script is to run the partitioned Pedestrian Environment Index calculation across
+# several machines. The coordinator breaks the work into (partition, sub metric) tasks and publishes them to a queue
+# held in a shared directory. Workers on any node pull tasks, calculate the unnormalized sub metric for their
+# partition and write the per census tract result back. The coordinator requeues tasks whose worker stopped
+# responding, retries failed tasks, and finally runs the reduce step of PEI_Partition to normalize all partitions and
+# combines the sub metrics into the PEI. Workers touch their claims while a task runs, so only the claims of workers
+# that stopped are requeued. Every run publishes its tasks under its own run id and only collects those, so a queue
+# directory can be reused. The queue only uses atomic file renames, so it works on any shared file system, and the
+# coordinator accepts any object with the same methods, so a local broker process can stand in for it.
+#
+# Steps
+# Step 1: Write every partition task once to the shared directory and publish one queue entry per sub metric.
+# Step 2: Workers claim queue entries by renaming them, run them and write their results.
+# Step 3: The coordinator requeues stale claims and retries failed tasks until every task is done.
+# Step 4: Collect the per partition results, normalize them with the reduce step and calculate the PEI.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import pickle
+import socket
+import threading
+import time
+import traceback
+import uuid
+from PEI_Composite import PEIComposite
+from PEI_Partition import SUB_METRICS, partition_metrics, partition_task, reduce_metrics, split_partitions
+
+QUEUE_STATES = ("pending", "claimed", "done", "failed")
+# Seconds between the heartbeats of a worker on the claim of its running task, well below the lease.
+HEARTBEAT_INTERVAL = 60
+
+
+def write_atomic(path, data):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+class FileQueue:
+
+    def __init__(self, directory):
+        self.directory = directory
+        for name in QUEUE_STATES + ("payloads", "results"):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    def _path(self, state, task_id):
+        return os.path.join(self.directory, state, f"{task_id}.json")
+
+    def _read(self, state, task_id):
+        with open(self._path(state, task_id)) as f:
+            return json.load(f)
+
+    def _move(self, task_id, source, target, entry=None):
+        # Renames are atomic, so only one worker can move an entry out of a state.
+        os.replace(self._path(source, task_id), self._path(target, task_id))
+        if entry is not None:
+            write_atomic(self._path(target, task_id), json.dumps(entry).encode())
+
+    def tasks(self, state):
+        names = os.listdir(os.path.join(self.directory, state))
+        return sorted(name[:-5] for name in names if name.endswith(".json"))
+
+    def put_payload(self, name, payload):
+        write_atomic(os.path.join(self.directory, "payloads", f"{name}.pkl"), pickle.dumps(payload))
+
+    def get_payload(self, name):
+        with open(os.path.join(self.directory, "payloads", f"{name}.pkl"), "rb") as f:
+            return pickle.load(f)
+
+    def publish(self, task_id, entry):
+        # Step 1: Publish one queue entry.
+        entry = dict(entry, task_id=task_id, attempts=entry.get("attempts", 0))
+        write_atomic(self._path("pending", task_id), json.dumps(entry).encode())
+
+    def claim(self, worker):
+        # Step 2: Claim the first pending entry that no other worker renamed first.
+        for task_id in self.tasks("pending"):
+            try:
+                os.replace(self._path("pending", task_id), self._path("claimed", task_id))
+            except FileNotFoundError:
+                continue
+            entry = self._read("claimed", task_id)
+            entry.update(worker=worker, claimed=time.time())
+            write_atomic(self._path("claimed", task_id), json.dumps(entry).encode())
+            return entry
+        return None
+
+    def heartbeat(self, task_id):
+        # Keeps a long running claim from being treated as stale. Returns False when the claim was lost.
+        try:
+            os.utime(self._path("claimed", task_id))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def complete(self, task_id, result):
+        # Writes the result and marks the task done. A claim lost to a requeue is taken back from pending or from the
+        # worker that claimed it since, as every run of a task gives the same result. Returns False when the task was
+        # already done.
+        write_atomic(os.path.join(self.directory, "results", f"{task_id}.pkl"), pickle.dumps(result))
+        for state in ("claimed", "pending"):
+            try:
+                self._move(task_id, state, "done")
+                return True
+            except FileNotFoundError:
+                continue
+        return False
+
+    def fail(self, task_id, error):
+        # Records the error of a claimed task. A claim lost to a requeue is left to the worker that runs it again.
+        try:
+            entry = self._read("claimed", task_id)
+            entry["error"] = error
+            self._move(task_id, "claimed", "failed", entry)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def result(self, task_id):
+        with open(os.path.join(self.directory, "results", f"{task_id}.pkl"), "rb") as f:
+            return pickle.load(f)
+
+    def requeue_stale(self, lease):
+        # Step 3: Claims that were not touched within the lease belong to a worker that stopped responding.
+        now = time.time()
+        for task_id in self.tasks("claimed"):
+            try:
+                if now - os.path.getmtime(self._path("claimed", task_id)) > lease:
+                    self._move(task_id, "claimed", "pending")
+            except FileNotFoundError:
+                continue
+
+    def retry_failed(self, max_retries, task_ids=None):
+        # Step 3: Failed tasks, of task_ids when given, go back to pending until they run out of attempts. Returns the
+        # exhausted tasks.
+        exhausted = []
+        for task_id in self.tasks("failed"):
+            if task_ids is not None and task_id not in task_ids:
+                continue
+            entry = self._read("failed", task_id)
+            if entry["attempts"] + 1 >= max_retries:
+                exhausted.append(entry)
+                continue
+            entry["attempts"] += 1
+            self._move(task_id, "failed", "pending", entry)
+        return exhausted
+
+    def remove(self, task_ids, payloads):
+        # Removes the done entries, results and payloads of a collected run.
+        paths = [self._path("done", task_id) for task_id in task_ids]
+        paths += [os.path.join(self.directory, "results", f"{task_id}.pkl") for task_id in task_ids]
+        paths += [os.path.join(self.directory, "payloads", f"{name}.pkl") for name in payloads]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def run_task(queue, entry, heartbeat_interval=HEARTBEAT_INTERVAL):
+    # Step 2: Run one (partition, sub metric) task while a background thread touches its claim.
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(heartbeat_interval):
+            if not queue.heartbeat(entry["task_id"]):
+                return
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        task = queue.get_payload(entry["partition"])
+        return partition_metrics(task, [entry["sub_metric"]])
+    finally:
+        stop.set()
+        thread.join()
+
+
+def worker(queue, name=None, idle_timeout=60, poll=1.0, heartbeat_interval=HEARTBEAT_INTERVAL):
+    # Step 2: Pull tasks until the queue stays empty for idle_timeout seconds or a stop file appears.
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    idle_since = time.time()
+    while not os.path.exists(os.path.join(queue.directory, "stop")):
+        entry = queue.claim(name)
+        if entry is None:
+            if time.time() - idle_since > idle_timeout:
+                return
+            time.sleep(poll)
+            continue
+        try:
+            queue.complete(entry["task_id"], run_task(queue, entry, heartbeat_interval))
+        except Exception:
+            queue.fail(entry["task_id"], traceback.format_exc())
+        idle_since = time.time()
+
+
+def run_id():
+    return f"run_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:12]}"
+
+
+def publish(queue, inputs, keys, sub_metrics=None, run=None, **task_options):
+    # Step 1: Write every partition task once to the shared directory and publish one entry per sub metric, all named
+    # after the run. Returns the task ids and the payload names.
+    run = run or run_id()
+    partitions = split_partitions(keys)
+    task_ids = []
+    payloads = []
+    for number, tracts in enumerate(partitions.values()):
+        payload = f"{run}.partition_{number}"
+        queue.put_payload(payload, partition_task(inputs, tracts, **task_options))
+        payloads.append(payload)
+        for sub_metric in sub_metrics or SUB_METRICS:
+            task_id = f"{payload}.{sub_metric}"
+            queue.publish(task_id, {"partition": payload, "sub_metric": sub_metric})
+            task_ids.append(task_id)
+    return task_ids, payloads
+
+
+def coordinate(queue, inputs, keys, weights=None, max_retries=3, lease=3600, poll=1.0, local_worker=False,
+               **task_options):
+    # Steps 1-4. With local_worker the coordinator also processes tasks itself between polls. Returns the ct_id, the
+    # normalized sub metric and the PEI columns in census tract order.
+    task_ids, payloads = publish(queue, inputs, keys, **task_options)
+    pending = set(task_ids)
+    while pending:
+        queue.requeue_stale(lease)
+        exhausted = queue.retry_failed(max_retries, pending)
+        if exhausted:
+            raise RuntimeError(f"Task {exhausted[0]['task_id']} failed {max_retries} times:\n{exhausted[0]['error']}")
+        if local_worker:
+            worker(queue, name="coordinator", idle_timeout=0, poll=0)
+        else:
+            time.sleep(poll)
+        pending -= set(queue.tasks("done"))
+
+    # Step 4: Collect the per partition results of this run, normalize them with the reduce step and calculate the PEI.
+    by_partition = {}
+    for task_id in task_ids:
+        result = queue.result(task_id)
+        by_partition.setdefault(task_id.rsplit(".", 1)[0], {}).update(result)
+    queue.remove(task_ids, payloads)
+    ct_ids = inputs["tracts"]["ct_id"]
+    metrics = reduce_metrics(list(by_partition.values()), len(ct_ids))
+    composite = PEIComposite(ct_ids, metrics)
+    columns = {"ct_id": composite.ct_id}
+    columns.update({name: composite.values[i] for i, name in enumerate(composite.names)})
+    columns["PEI"] = composite.weighted_product(weights)
+    return columns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed Pedestrian Environment Index worker and coordinator.")
+    parser.add_argument("role", choices=["worker", "coordinator"])
+    parser.add_argument("queue", help="Shared queue directory.")
+    parser.add_argument("--inputs", help="Pickled {'inputs': ..., 'keys': ...} for the coordinator.")
+    parser.add_argument("--output", help="Output csv file with the normalized sub metrics and the PEI, for the "
+                                         "coordinator.")
+    parser.add_argument("--weights", default="", help="Sub metric weights, for example 1;1;1;1;2;1;1;1.")
+    parser.add_argument("--idle-timeout", type=float, default=60)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--lease", type=float, default=3600)
+    args = parser.parse_args()
+    queue = FileQueue(args.queue)
+    if args.role == "worker":
+        worker(queue, idle_timeout=args.idle_timeout)
+        return
+    from PEI_Composite import parse_weights
+    from PEI_Sensitivity import write_report
+    with open(args.inputs, "rb") as f:
+        bundle = pickle.load(f)
+    write_report(coordinate(queue, bundle["inputs"], bundle["keys"], parse_weights(args.weights), args.max_retries,
+                            args.lease), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Engines
+# Purpose: The purpose of this script is to provide vectorized NumPy versions of the sub metric calculations, working
+# on per census tract arrays instead of geodatabase tables. Every function accepts either a single set of values or a
+# batch with one row per draw, so the same code computes one run or thousands of simulated runs at once. The
+# normalizations follow the arcpy scripts, including their small floor values for the max value.
+#
+# Steps
+# Step 1: Max value normalization along the last axis, one maximum per draw.
+# Step 2: Calculate the population density sub metric from population and area.
+# Step 3: Build the sparse census tract by transportation point catchment matrix used by the 2SFCA method.
+# Step 4: Calculate the public transportation access sub metric with the 2SFCA method.
+# Step 5: Calculate the unnormalized land use mix, commercial, intersection, sidewalk and street network densities
+# from features already assigned to census tracts, and normalize them with a given max value.
+# Step 6: Calculate the access to parks sub metric on a raster: euclidean distance from sidewalks, reclassified cost
+# surface, cost distance from park points and the zonal median by census tract. Classified surfaces are uint8 and
+# distances float32, so a fine raster takes a fraction of the memory of float64 surfaces.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import math
+import numpy as np
+from scipy import ndimage, sparse
+from scipy.sparse import csgraph
+from scipy.spatial import cKDTree
+
+# Search radius of the census tract centroid to transportation point spatial join, in feet.
+TRANSPORTATION_RADIUS = 10000
+# Square meters to square feet factor used by the intersection density calculation.
+SQUARE_FEET = 10.764
+# Upper bounds of the euclidean distance from sidewalks classes of the cost surface, in feet. A distance of 0 is class 1.
+COST_CLASSES = (30, 60, 100)
+
+
+def max_normalize(values, floor=0.000000000000000001):
+    # Step 1: Max value normalization along the last axis, one maximum per draw.
+    values = np.nan_to_num(np.asarray(values, dtype=float), nan=0.0)
+    max_value = np.maximum(values.max(axis=-1, keepdims=True), floor)
+    return values / max_value
+
+
+def population_density(population, area):
+    # Step 2: Calculate the population density sub metric from population and area. Returns the unnormalized
+    # bn_pop_density and the normalized pop_density.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bn_pop_density = np.where(area > 0, np.asarray(population, dtype=float) / area, 0.0)
+    return bn_pop_density, max_normalize(bn_pop_density)
+
+
+def catchment_matrix(tract_x, tract_y, point_x, point_y, radius=TRANSPORTATION_RADIUS):
+    # Step 3: Build the sparse census tract by transportation point catchment matrix used by the 2SFCA method.
+    # Entry (i, j) is 1 when transportation point j is within the search radius of the centroid of census tract i.
+    tracts = cKDTree(np.column_stack([tract_x, tract_y]))
+    points = cKDTree(np.column_stack([point_x, point_y]))
+    pairs = tracts.query_ball_tree(points, radius)
+    rows = np.repeat(np.arange(len(pairs)), [len(p) for p in pairs])
+    cols = np.fromiter((j for p in pairs for j in p), dtype=np.int64, count=len(rows))
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(pairs), len(point_x)))
+
+
+def transportation_access(catchment, population):
+    # Step 4: Calculate the public transportation access sub metric with the 2SFCA method. Each transportation point
+    # gets a ratio of 1 over the population within its catchment, and each census tract sums the ratios of the points
+    # within its catchment. population is either one value per tract or a (draws x tracts) matrix. Returns the
+    # unnormalized SUM_ratio and the normalized transportation_access.
+    population = np.asarray(population, dtype=float)
+    batch = np.atleast_2d(population)
+    demand = (catchment.T @ batch.T).T
+    with np.errstate(divide="ignore"):
+        ratio = np.where(demand > 0, 1 / demand, 0.0)
+    sum_ratio = (catchment @ ratio.T).T
+    if population.ndim == 1:
+        sum_ratio = sum_ratio[0]
+    return sum_ratio, max_normalize(sum_ratio, floor=0.000000000000000001)
+
+
+def tract_sums(tract_index, values, n_tracts):
+    # Sums feature values by the index of the census tract they were assigned to. Features outside every census tract
+    # have a negative index and are ignored.
+    tract_index = np.asarray(tract_index)
+    inside = tract_index >= 0
+    return np.bincount(tract_index[inside], weights=np.asarray(values, dtype=float)[inside], minlength=n_tracts)
+
+
+def land_use_mix(tract_index, land_use, area, n_tracts):
+    # Step 5: Unnormalized land use mix. For every census tract this is the sum of -p * log(p) over the proportion p of
+    # lot area in each land use. Returns SUM_sha_num by tract and the land use classes present, whose count is needed
+    # by the normalization.
+    tract_index = np.asarray(tract_index)
+    valid = (tract_index >= 0) & (np.asarray(area, dtype=float) > 0)
+    classes, codes = np.unique(np.asarray(land_use)[valid], return_inverse=True)
+    by_class = np.zeros((n_tracts, len(classes)))
+    np.add.at(by_class, (tract_index[valid], codes), np.asarray(area, dtype=float)[valid])
+    return shannon_sum(by_class), classes
+
+
+def shannon_sum(by_class):
+    # SUM_sha_num from a (tracts x land uses) matrix of lot area, dense or scipy sparse.
+    if sparse.issparse(by_class):
+        by_class = by_class.toarray()
+    by_class = np.asarray(by_class, dtype=float)
+    total = by_class.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        proportion = np.where(total > 0, by_class / total, 0.0)
+        sha_num = np.where(proportion > 0, -proportion * np.log(proportion), 0.0)
+    return sha_num.sum(axis=1)
+
+
+def normalize_land_use_mix(sum_sha_num, land_use_number, max_value=None):
+    # Normalized land use mix, (SUM_sha_num / log(n)) / (max / log(n)) as in the arcpy scripts.
+    sum_sha_num = np.asarray(sum_sha_num, dtype=float)
+    if max_value is None:
+        max_value = sum_sha_num.max(initial=0)
+    max_value = max(max_value, 0.000000000000000001)
+    log_number = math.log(land_use_number) if land_use_number > 1 else 1.0
+    return (sum_sha_num / log_number) / (max_value / log_number)
+
+
+def commercial_density(tract_index, land_use_area, commercial_area, n_tracts):
+    # Step 5: Unnormalized commercial density, the commercial area of the lots in a census tract over their total area.
+    total = tract_sums(tract_index, land_use_area, n_tracts)
+    commercial = tract_sums(tract_index, commercial_area, n_tracts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total > 0, commercial / total, 0.0)
+
+
+def normalize_commercial_density(bn_com_sum, max_value=None):
+    # Normalized commercial density, log(x + 1) / log(max + 1) as in the arcpy scripts.
+    bn_com_sum = np.asarray(bn_com_sum, dtype=float)
+    if max_value is None:
+        max_value = bn_com_sum.max(initial=0)
+    max_value = max(max_value, 0.000000000000000001)
+    return np.log(bn_com_sum + 1) / math.log(max_value + 1)
+
+
+def intersection_density(tract_index, degree, land_area, n_tracts):
+    # Step 5: Unnormalized intersection density. Intersections where fewer than 3 roads meet are ignored, and a 3 way
+    # intersection counts 3, a 4 way intersection 4, and so on.
+    degree = np.asarray(degree, dtype=float)
+    weighted = tract_sums(np.where(degree > 2, tract_index, -1), degree, n_tracts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(land_area > 0, weighted / (np.asarray(land_area, dtype=float) * SQUARE_FEET), 0.0)
+
+
+def areal_density(tract_index, piece_area, tract_area, n_tracts):
+    # Step 5: Unnormalized sidewalk or street network density, the apportioned area of the pieces in a census tract
+    # over the census tract area.
+    area = tract_sums(tract_index, piece_area, n_tracts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(tract_area > 0, area / np.asarray(tract_area, dtype=float), 0.0)
+
+
+def normalize(values, max_value=None, floor=0.000000000000000001):
+    # Max value normalization with a given max value, used when the max comes from a reduce over partitions.
+    values = np.nan_to_num(np.asarray(values, dtype=float), nan=0.0)
+    if max_value is None:
+        return max_normalize(values, floor)
+    return values / max(max_value, floor)
+
+
+def euclidean_distance(sidewalk_mask, cell_size, dtype=np.float32):
+    # Step 6: Euclidean distance raster from the sidewalk cells, in feet. Distances are stored as float32 by default,
+    # about 1 part in 10 million of precision, which is far below the cell size.
+    distance = ndimage.distance_transform_edt(~np.asarray(sidewalk_mask, dtype=bool), sampling=cell_size)
+    return distance.astype(dtype, copy=False)
+
+
+def reclassify_distance(distance, classes=COST_CLASSES):
+    # Step 6: Reclassify the euclidean distance from sidewalks into the five class cost surface. A distance of 0 is
+    # class 1, and each upper bound closes the next class, with everything beyond the last bound in class 5. The
+    # classes fit in uint8, with 0 for NoData.
+    distance = np.asarray(distance)
+    cost = np.searchsorted(np.asarray(classes, dtype=distance.dtype), distance, side="left").astype(np.uint8)
+    cost += 2
+    cost[distance == 0] = 1
+    cost[~np.isfinite(distance)] = 0
+    return cost
+
+
+def cost_surface(sidewalk_mask, cell_size, study_area=None, classes=COST_CLASSES, tile_size=1024):
+    # Step 6: uint8 cost surface of the study area cells, classified tile by tile without the full euclidean distance
+    # raster. Every tile is classified from the distances of a window reaching the last class bound beyond it, which
+    # are exact up to that bound, and a cell farther than the bound from every sidewalk of the window is farther than
+    # it from every sidewalk, so the classes are the same as from the full raster.
+    sidewalk_mask = np.asarray(sidewalk_mask, dtype=bool)
+    rows, cols = sidewalk_mask.shape
+    halo = int(math.ceil(max(classes) / cell_size)) + 1
+    cost = np.zeros((rows, cols), dtype=np.uint8)
+    for r0 in range(0, rows, tile_size):
+        for c0 in range(0, cols, tile_size):
+            r1, c1 = min(r0 + tile_size, rows), min(c0 + tile_size, cols)
+            wr0, wc0 = max(r0 - halo, 0), max(c0 - halo, 0)
+            window = sidewalk_mask[wr0:min(r1 + halo, rows), wc0:min(c1 + halo, cols)]
+            if window.any():
+                distance = euclidean_distance(window, cell_size, np.float64)[r0 - wr0:r1 - wr0, c0 - wc0:c1 - wc0]
+            else:
+                distance = np.full((r1 - r0, c1 - c0), np.inf)
+            tile = reclassify_distance(distance, classes)
+            tile[tile == 0] = len(classes) + 2
+            if study_area is not None:
+                tile[~np.asarray(study_area[r0:r1, c0:c1], dtype=bool)] = 0
+            cost[r0:r1, c0:c1] = tile
+    return cost
+
+
+def cost_graph(cost, cell_size):
+    # Step 6: Sparse graph of the moves between adjacent cells, using the ArcGIS cost distance rule: moving between
+    # adjacent cells costs the mean of their costs times the cell size, or times the cell diagonal for diagonal moves.
+    # Cells with a cost of 0 are NoData and cannot be crossed. Every move is stored once, in one direction. The cost
+    # surface keeps its own dtype, so a uint8 surface is never copied to float, and the moves are written straight
+    # into the compressed rows, four slots per cell in row order, instead of being sorted from coordinates.
+    cost = np.asarray(cost)
+    rows, cols = cost.shape
+    index_dtype = np.int32 if rows * cols < 2 ** 31 else np.int64
+    index = np.arange(rows * cols, dtype=index_dtype).reshape(rows, cols)
+    valid = cost > 0
+    weights = np.zeros((rows, cols, 4))
+    targets = np.zeros((rows, cols, 4), dtype=index_dtype)
+    present = np.zeros((rows, cols, 4), dtype=bool)
+    for slot, (dr, dc, step) in enumerate(((0, 1, 1.0), (1, 0, 1.0), (1, 1, math.sqrt(2)), (1, -1, math.sqrt(2)))):
+        a = (slice(0, rows - dr), slice(max(0, -dc), cols - max(0, dc)))
+        b = (slice(dr, rows), slice(max(0, dc), cols - max(0, -dc)))
+        present[a + (slot,)] = valid[a] & valid[b]
+        targets[a + (slot,)] = index[b]
+        weights[a + (slot,)] = (cost[a].astype(float) + cost[b]) * (cell_size * step / 2)
+    present = present.reshape(-1, 4)
+    indptr = np.concatenate([[0], np.cumsum(present.sum(axis=1))]).astype(index_dtype)
+    return sparse.csr_matrix((weights.reshape(-1, 4)[present], targets.reshape(-1, 4)[present], indptr),
+                             shape=(rows * cols, rows * cols))
+
+
+def cost_distance(cost, source_rows, source_cols, cell_size, dtype=np.float32):
+    # Step 6: Accumulated cost distance from the source cells over the cost surface, stored as float32 by default.
+    cost = np.asarray(cost)
+    valid = (cost > 0).ravel()
+    sources = np.ravel_multi_index((np.asarray(source_rows), np.asarray(source_cols)), cost.shape)
+    sources = np.unique(sources[valid[sources]])
+    if len(sources) == 0:
+        return np.full(cost.shape, np.inf, dtype=dtype)
+    distance = csgraph.dijkstra(cost_graph(cost, cell_size), directed=False, indices=sources, min_only=True)
+    distance = distance.astype(dtype, copy=False)
+    distance[~valid] = np.inf
+    return distance.reshape(cost.shape)
+
+
+def zonal_median(labels, values, n_tracts):
+    # Step 6: Median of the finite raster values by census tract label. Cells labeled -1 are outside every tract. The
+    # values keep their dtype, and only the medians are calculated in float64.
+    labels = np.asarray(labels).ravel()
+    values = np.asarray(values).ravel()
+    keep = (labels >= 0) & np.isfinite(values)
+    labels, values = labels[keep], values[keep]
+    order = np.lexsort((values, labels))
+    labels, values = labels[order], values[order]
+    counts = np.bincount(labels, minlength=n_tracts)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    median = np.full(n_tracts, np.nan)
+    has = counts > 0
+    low = starts[has] + (counts[has] - 1) // 2
+    high = starts[has] + counts[has] // 2
+    median[has] = (values[low].astype(float) + values[high]) / 2
+    return median
+
+
+def parks_cost_median(sidewalk_mask, labels, park_rows, park_cols, cell_size, n_tracts, study_area=None):
+    # Step 6: Median cost distance to parks by census tract, the unnormalized access to parks sub metric. The
+    # distance and cost surfaces are limited to the study area cells, by default the cells inside the census tracts
+    # like the mask in the arcpy script. The cost surface is uint8 and the cost distance float32.
+    if study_area is None:
+        study_area = np.asarray(labels) >= 0
+    cost = cost_surface(sidewalk_mask, cell_size, study_area)
+    return zonal_median(labels, cost_distance(cost, park_rows, park_cols, cell_size), n_tracts)
+
+
+def normalize_parks_access(median, max_value=None):
+    # Normalized access to parks, abs(1 - median / max) as in the arcpy scripts. Tracts without a median get 0.
+    median = np.asarray(median, dtype=float)
+    if max_value is None:
+        max_value = np.nanmax(median, initial=0)
+    max_value = max(max_value, 0.000000000000000001)
+    return np.where(np.isfinite(median), np.abs(1 - median / max_value), 0.0)
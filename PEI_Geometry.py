@@ -0,0 +1,400 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Geometry
+# Purpose: The purpose of this script is to derive the census tract geometry once per version of the census tracts
+# layer instead of in every sub metric: areas, centroids, bounding boxes and prepared polygons for fast point in
+# polygon and intersection tests. The polygons are parsed from WKB, their rings are stored as flat NumPy arrays and the
+# result is cached next to the layer, keyed by a content hash of it, so later runs over the same census tracts load
+# it without touching the geometry again. A prepared polygon buckets its edges into horizontal bands, so a point is
+# only tested against the few edges crossing its band instead of every edge of the census tract. Points are matched to
+# the census tracts whose bounding boxes contain them through the PEI_Index sidecar of the layer. For overlays, the
+# boxes lying within a single census tract are told apart from the ones an edge of it crosses, so only the features
+# near census tract edges need an exact polygon overlay. The cache is keyed by the geometries and census tract ids of
+# the layer alone, so writing other fields to the census tracts keeps it valid. The arcpy sub metrics read the census
+# tract areas and centroids from the cache too, the centroids written as a point feature class.
+#
+# Steps
+# Step 1: Parse the census tract polygons from WKB into flat ring arrays.
+# Step 2: Calculate the area, centroid and bounding box of every census tract.
+# Step 3: Prepare the polygons by bucketing their edges into horizontal bands.
+# Step 4: Test points and boxes against the prepared polygons, assign points to census tracts and find the census
+# tract covering every box.
+# Step 5: Cache the geometry next to the census tracts layer, keyed by its content hash.
+# Step 6: Write the cached census tract centroids as a point feature class.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import os
+import struct
+import numpy as np
+from PEI_Index import content_hash, layer_index, sidecar_path
+
+CACHE_SUFFIX = ".geometry.npz"
+POLYGON, MULTIPOLYGON = 3, 6
+POINT_CHUNK = 65536
+# Most (box, edge) pairs tested at once by PreparedPolygon.meets_boxes.
+PAIR_CHUNK = 1 << 20
+# Census tract index of the boxes that are not known to lie within a single census tract.
+BOUNDARY = -2
+
+
+def parse_wkb(data):
+    # Step 1: Parse a WKB Polygon or MultiPolygon, including Z and M variants, into a list of (ring, is_hole) pairs.
+    # The first ring of every polygon is its exterior.
+    data = bytes(data)
+    rings = []
+
+    def read_geometry(offset):
+        order = "<" if data[offset] == 1 else ">"
+        geometry_type = struct.unpack_from(f"{order}I", data, offset + 1)[0]
+        flags = geometry_type & 0xE0000000
+        geometry_type &= 0x1FFFFFFF
+        dimensions = 2 + (geometry_type // 1000 in (1, 2)) + 2 * (geometry_type // 1000 == 3)
+        dimensions += bool(flags & 0x80000000) + bool(flags & 0x40000000)
+        base_type = geometry_type % 1000
+        offset += 5
+        if flags & 0x20000000:
+            offset += 4
+        count = struct.unpack_from(f"{order}I", data, offset)[0]
+        offset += 4
+        if base_type == MULTIPOLYGON:
+            for _ in range(count):
+                offset = read_geometry(offset)
+            return offset
+        if base_type != POLYGON:
+            raise ValueError(f"Census tract geometry must be a polygon, found WKB type {geometry_type}.")
+        for ring_number in range(count):
+            n_points = struct.unpack_from(f"{order}I", data, offset)[0]
+            offset += 4
+            coordinates = np.frombuffer(data, dtype=f"{order}f8", count=n_points * dimensions, offset=offset)
+            rings.append((coordinates.reshape(n_points, dimensions)[:, :2].astype(float), ring_number > 0))
+            offset += 8 * n_points * dimensions
+        return offset
+
+    read_geometry(0)
+    return rings
+
+
+def ring_area_centroid(ring):
+    # Shoelace area (unsigned) and centroid of a closed ring.
+    x0, y0, x1, y1 = ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1]
+    cross = x0 * y1 - x1 * y0
+    signed = cross.sum() / 2
+    if signed == 0:
+        return 0.0, ring[:, 0].mean(), ring[:, 1].mean()
+    return abs(signed), ((x0 + x1) * cross).sum() / (6 * signed), ((y0 + y1) * cross).sum() / (6 * signed)
+
+
+def crossings(px, py, edges):
+    # Even-odd crossing counts of a horizontal ray from every point against the edges, a (points x edges) test.
+    x0, y0, x1, y1 = (edges[:, i][None, :] for i in range(4))
+    py = py[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hit = ((y0 > py) != (y1 > py)) & (px[:, None] < (x1 - x0) * (py - y0) / (y1 - y0) + x0)
+    return hit.sum(axis=1)
+
+
+def segments_cross(a, b):
+    # Whether any segment of a (n x 4) crosses any segment of b (m x 4), collinear overlaps included.
+    def orientation(px, py, qx, qy, rx, ry):
+        return np.sign((qx - px) * (ry - py) - (qy - py) * (rx - px))
+    ax0, ay0, ax1, ay1 = (a[:, i][:, None] for i in range(4))
+    bx0, by0, bx1, by1 = (b[:, i][None, :] for i in range(4))
+    d1 = orientation(bx0, by0, bx1, by1, ax0, ay0)
+    d2 = orientation(bx0, by0, bx1, by1, ax1, ay1)
+    d3 = orientation(ax0, ay0, ax1, ay1, bx0, by0)
+    d4 = orientation(ax0, ay0, ax1, ay1, bx1, by1)
+    return bool(np.any((d1 * d2 <= 0) & (d3 * d4 <= 0)))
+
+
+def segments_meet_boxes(edges, boxes):
+    # Whether any segment of edges (m x 4) meets every (xmin, ymin, xmax, ymax) box (k x 4), touching included: their
+    # bounding boxes overlap and the box corners are not all strictly on one side of the segment line.
+    x0, y0, x1, y1 = (edges[:, i][None, :] for i in range(4))
+    xmin, ymin, xmax, ymax = (boxes[:, i][:, None] for i in range(4))
+    overlap = ((np.minimum(x0, x1) <= xmax) & (np.maximum(x0, x1) >= xmin) &
+               (np.minimum(y0, y1) <= ymax) & (np.maximum(y0, y1) >= ymin))
+    sides = [np.sign((x1 - x0) * (cy - y0) - (y1 - y0) * (cx - x0))
+             for cx, cy in ((xmin, ymin), (xmin, ymax), (xmax, ymin), (xmax, ymax))]
+    one_side = (sides[0] != 0) & (sides[0] == sides[1]) & (sides[0] == sides[2]) & (sides[0] == sides[3])
+    return (overlap & ~one_side).any(axis=1)
+
+
+class PreparedPolygon:
+
+    def __init__(self, edges, bounds, n_bands=None):
+        # Step 3: Prepare a polygon by bucketing its edges (x0, y0, x1, y1 rows of every ring) into horizontal bands.
+        self.edges = edges
+        self.bounds = bounds
+        self.n_bands = n_bands or int(np.clip(np.sqrt(len(edges)), 1, 256))
+        self.band_height = max((bounds[3] - bounds[1]) / self.n_bands, np.finfo(float).tiny)
+        low = self.band(np.minimum(edges[:, 1], edges[:, 3]))
+        high = self.band(np.maximum(edges[:, 1], edges[:, 3]))
+        span = high - low + 1
+        band_of = np.repeat(low, span) + np.arange(span.sum()) - np.repeat(np.cumsum(span) - span, span)
+        edge_of = np.repeat(np.arange(len(edges)), span)
+        order = np.argsort(band_of, kind="stable")
+        self.band_edges = edge_of[order]
+        self.band_offsets = np.searchsorted(band_of[order], np.arange(self.n_bands + 1))
+
+    def band(self, y):
+        return np.clip(((y - self.bounds[1]) / self.band_height).astype(np.int64), 0, self.n_bands - 1)
+
+    def contains(self, x, y):
+        # Step 4: Whether every point lies inside the polygon, holes and multiple parts included.
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        inside = np.zeros(len(x), dtype=bool)
+        candidates = np.flatnonzero((x >= self.bounds[0]) & (x <= self.bounds[2]) &
+                                    (y >= self.bounds[1]) & (y <= self.bounds[3]))
+        bands = self.band(y[candidates])
+        order = np.argsort(bands, kind="stable")
+        candidates, bands = candidates[order], bands[order]
+        starts = np.searchsorted(bands, np.arange(self.n_bands + 1))
+        for band in np.unique(bands).tolist():
+            edges = self.edges[self.band_edges[self.band_offsets[band]:self.band_offsets[band + 1]]]
+            points = candidates[starts[band]:starts[band + 1]]
+            for i in range(0, len(points), POINT_CHUNK):
+                chunk = points[i:i + POINT_CHUNK]
+                inside[chunk] = crossings(x[chunk], y[chunk], edges) % 2 == 1
+        return inside
+
+    def meets_boxes(self, boxes):
+        # Step 4: Whether an edge of the polygon meets every (xmin, ymin, xmax, ymax) box, testing every box only
+        # against the edges of the bands it spans.
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        meets = np.zeros(len(boxes), dtype=bool)
+        low, high = self.band(boxes[:, 1]), self.band(boxes[:, 3])
+        span = high - low + 1
+        band_of = np.repeat(low, span) + np.arange(span.sum()) - np.repeat(np.cumsum(span) - span, span)
+        box_of = np.repeat(np.arange(len(boxes)), span)
+        order = np.argsort(band_of, kind="stable")
+        band_of, box_of = band_of[order], box_of[order]
+        starts = np.searchsorted(band_of, np.arange(self.n_bands + 1))
+        for band in np.unique(band_of).tolist():
+            edges = self.edges[self.band_edges[self.band_offsets[band]:self.band_offsets[band + 1]]]
+            if not len(edges):
+                continue
+            members = box_of[starts[band]:starts[band + 1]]
+            step = max(PAIR_CHUNK // len(edges), 1)
+            for i in range(0, len(members), step):
+                chunk = members[i:i + step]
+                meets[chunk] |= segments_meet_boxes(edges, boxes[chunk])
+        return meets
+
+    def intersects_box(self, bbox):
+        # Step 4: Whether the polygon intersects an (xmin, ymin, xmax, ymax) box.
+        xmin, ymin, xmax, ymax = bbox
+        if self.bounds[0] > xmax or self.bounds[2] < xmin or self.bounds[1] > ymax or self.bounds[3] < ymin:
+            return False
+        if self.contains([xmin, xmin, xmax, xmax], [ymin, ymax, ymin, ymax]).any():
+            return True
+        vertices = self.edges[:, :2]
+        if np.any((vertices[:, 0] >= xmin) & (vertices[:, 0] <= xmax) &
+                  (vertices[:, 1] >= ymin) & (vertices[:, 1] <= ymax)):
+            return True
+        box_edges = np.array([[xmin, ymin, xmax, ymin], [xmax, ymin, xmax, ymax],
+                              [xmax, ymax, xmin, ymax], [xmin, ymax, xmin, ymin]])
+        return segments_cross(self.edges, box_edges)
+
+
+class TractGeometry:
+
+    def __init__(self, ct_id, vertices, ring_offsets, ring_tract, ring_hole):
+        # vertices holds the closed rings of every census tract one after another, ring_offsets marks where every
+        # ring starts, ring_tract is the census tract index of every ring and ring_hole flags its interior rings.
+        self.ct_id = np.asarray(ct_id)
+        self.vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+        self.ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+        self.ring_tract = np.asarray(ring_tract, dtype=np.int64)
+        self.ring_hole = np.asarray(ring_hole, dtype=bool)
+        # PEI_Index STRTree of the census tract bounding boxes in the same order, used by locate when set.
+        self.index = None
+        self._prepared = {}
+        self._measure()
+
+    def __len__(self):
+        return len(self.ct_id)
+
+    @classmethod
+    def from_wkb(cls, ct_ids, geometries):
+        # Step 1: Parse the census tract polygons from WKB into flat ring arrays. Empty geometries have no rings.
+        rings, ring_tract, ring_hole = [], [], []
+        for i, geometry in enumerate(geometries):
+            for ring, hole in parse_wkb(geometry) if geometry is not None else []:
+                rings.append(ring)
+                ring_tract.append(i)
+                ring_hole.append(hole)
+        offsets = np.cumsum([0] + [len(ring) for ring in rings])
+        vertices = np.concatenate(rings) if rings else np.zeros((0, 2))
+        return cls(ct_ids, vertices, offsets, ring_tract, ring_hole)
+
+    def _measure(self):
+        # Step 2: Calculate the area, centroid and bounding box of every census tract. Holes subtract their area.
+        n = len(self.ct_id)
+        self.area = np.zeros(n)
+        moment_x, moment_y = np.zeros(n), np.zeros(n)
+        self.bounds = np.tile([np.inf, np.inf, -np.inf, -np.inf], (n, 1))
+        for r, tract in enumerate(self.ring_tract.tolist()):
+            ring = self.ring(r)
+            area, cx, cy = ring_area_centroid(ring)
+            sign = -1 if self.ring_hole[r] else 1
+            self.area[tract] += sign * area
+            moment_x[tract] += sign * area * cx
+            moment_y[tract] += sign * area * cy
+            self.bounds[tract, :2] = np.minimum(self.bounds[tract, :2], ring.min(axis=0))
+            self.bounds[tract, 2:] = np.maximum(self.bounds[tract, 2:], ring.max(axis=0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.centroid_x = np.where(self.area > 0, moment_x / self.area, np.nan)
+            self.centroid_y = np.where(self.area > 0, moment_y / self.area, np.nan)
+
+    def ring(self, r):
+        return self.vertices[self.ring_offsets[r]:self.ring_offsets[r + 1]]
+
+    def edges(self, tract):
+        # Edges (x0, y0, x1, y1) of every ring of a census tract.
+        rings = [self.ring(r) for r in np.flatnonzero(self.ring_tract == tract).tolist()]
+        if not rings:
+            return np.zeros((0, 4))
+        return np.concatenate([np.column_stack([ring[:-1], ring[1:]]) for ring in rings])
+
+    def prepared(self, tract):
+        # Step 3: The prepared polygon of a census tract, built on first use.
+        if tract not in self._prepared:
+            self._prepared[tract] = PreparedPolygon(self.edges(tract), self.bounds[tract])
+        return self._prepared[tract]
+
+    def contains(self, tract, x, y):
+        return self.prepared(tract).contains(x, y)
+
+    def intersects_box(self, tract, bbox):
+        return self.prepared(tract).intersects_box(bbox)
+
+    def locate(self, x, y):
+        # Step 4: Census tract index of every point, or -1 outside every census tract. With a spatial index every census
+        # tract only tests the points its bounding box contains. Without one, points are sorted by x once, so every
+        # census tract only tests the points within the x range of its bounding box.
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        result = np.full(len(x), -1, dtype=np.int64)
+        if self.index is not None:
+            points, tracts = self.index.query_points(x, y)
+            valid = self.area[tracts] > 0
+            order = np.lexsort((points[valid], tracts[valid]))
+            points, tracts = points[valid][order], tracts[valid][order]
+            starts = np.flatnonzero(np.r_[True, tracts[1:] != tracts[:-1]]) if len(tracts) else np.arange(0)
+            for start, end in zip(starts.tolist(), np.r_[starts[1:], len(tracts)].tolist()):
+                tract = int(tracts[start])
+                candidates = points[start:end][result[points[start:end]] < 0]
+                if len(candidates):
+                    result[candidates[self.contains(tract, x[candidates], y[candidates])]] = tract
+            return result
+        order = np.argsort(x, kind="stable")
+        sorted_x = x[order]
+        for tract in np.flatnonzero(self.area > 0).tolist():
+            xmin, ymin, xmax, ymax = self.bounds[tract]
+            points = order[np.searchsorted(sorted_x, xmin):np.searchsorted(sorted_x, xmax, side="right")]
+            points = points[(result[points] < 0) & (y[points] >= ymin) & (y[points] <= ymax)]
+            if len(points):
+                result[points[self.contains(tract, x[points], y[points])]] = tract
+        return result
+
+    def covering_tract(self, boxes, locate=None):
+        # Step 4: Census tract index of the census tract covering the whole of every (xmin, ymin, xmax, ymax) box, or
+        # BOUNDARY when the corners of the box fall in different census tracts or outside every census tract, or an
+        # edge of the census tract meets the box. A feature within such a box overlaps that census tract alone, so only
+        # the BOUNDARY ones need an exact overlay. locate assigns the corners, by default self.locate.
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        locate = locate or self.locate
+        result = np.full(len(boxes), BOUNDARY, dtype=np.int64)
+        valid = np.flatnonzero(~np.isnan(boxes).any(axis=1))
+        corners = [np.asarray(locate(boxes[valid, i], boxes[valid, j]), dtype=np.int64)
+                   for i, j in ((0, 1), (0, 3), (2, 1), (2, 3))]
+        same = (corners[0] >= 0) & (corners[0] == corners[1]) & (corners[0] == corners[2]) & (corners[0] == corners[3])
+        result[valid[same]] = corners[0][same]
+        inside = np.flatnonzero(result >= 0)
+        order = inside[np.argsort(result[inside], kind="stable")]
+        tracts = result[order]
+        starts = np.flatnonzero(np.r_[True, tracts[1:] != tracts[:-1]]) if len(tracts) else np.arange(0)
+        for start, end in zip(starts.tolist(), np.r_[starts[1:], len(tracts)].tolist()):
+            members = order[start:end]
+            result[members[self.prepared(int(tracts[start])).meets_boxes(boxes[members])]] = BOUNDARY
+        return result
+
+    def tract_columns(self):
+        # The census tract columns used by PEI_Engines and PEI_Partition, in the order of the cache.
+        return {"ct_id": self.ct_id, "area": self.area, "x": self.centroid_x, "y": self.centroid_y}
+
+    def save(self, path, signature):
+        with open(path, "wb") as f:
+            np.savez(f, signature=np.array(signature), ct_id=self.ct_id, vertices=self.vertices,
+                     ring_offsets=self.ring_offsets, ring_tract=self.ring_tract, ring_hole=self.ring_hole)
+
+    @classmethod
+    def load(cls, path, signature=None):
+        # Loads a saved cache, or returns None if it is missing or was built for other content.
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if signature is not None and str(data["signature"]) != signature:
+                return None
+            return cls(data["ct_id"], data["vertices"], data["ring_offsets"], data["ring_tract"], data["ring_hole"])
+
+
+def read_wkb(path, id_field):
+    # Reads the census tract ids and WKB geometries of a GeoParquet file or, through arcpy, of a feature class.
+    if path.lower().endswith(".parquet"):
+        from PEI_IO import read_geoparquet
+        table = read_geoparquet(path, [id_field])
+        return table.column(id_field).to_numpy(), table.column(table.column_names[-1]).to_pylist()
+    import arcpy
+    ct_ids, geometries = [], []
+    with arcpy.da.SearchCursor(path, [id_field, "SHAPE@WKB"]) as cursor:
+        for row in cursor:
+            ct_ids.append(row[0])
+            geometries.append(None if row[1] is None else bytes(row[1]))
+    return np.array(ct_ids), geometries
+
+
+def tract_geometry(path, id_field="ct_id", log=print):
+    # Step 5: The census tract geometry of a layer, loaded from its cache when the layer is unchanged and derived and
+    # cached otherwise, with the spatial index sidecar of the layer attached. The cache is keyed by the geometries and
+    # census tract ids of the layer.
+    signature = content_hash(path, [id_field])
+    cache = sidecar_path(path, CACHE_SUFFIX)
+    geometry = TractGeometry.load(cache, signature)
+    if geometry is None:
+        log(f"Caching census tract geometry for {path}.")
+        geometry = TractGeometry.from_wkb(*read_wkb(path, id_field))
+        geometry.save(cache, signature)
+    geometry.signature = signature
+    geometry.index = layer_index(path, log=log, signature=signature)
+    return geometry
+
+
+def centroid_points(path, id_field, output, fields=(), log=print):
+    # Step 6: Write the cached centroids of a census tracts feature class as a point feature class with the census
+    # tract id and the given numeric fields, like FeatureToPoint. Census tracts without area have no centroid and are
+    # left out.
+    import arcpy
+    geometry = tract_geometry(path, id_field, log)
+    # The cache holds the census tracts in cursor order.
+    with arcpy.da.SearchCursor(path, list(fields) or [id_field]) as cursor:
+        values = [row for row in cursor]
+    valid = np.flatnonzero(np.isfinite(geometry.centroid_x))
+    ct_id = geometry.ct_id[valid]
+    ct_id = ct_id.astype(str) if ct_id.dtype == object else ct_id
+    array = np.empty(len(valid), dtype=[(id_field, ct_id.dtype)] + [(field, float) for field in fields] +
+                     [("centroid_x", float), ("centroid_y", float)])
+    array[id_field] = ct_id
+    for j, field in enumerate(fields):
+        array[field] = [np.nan if values[i][j] is None else values[i][j] for i in valid.tolist()]
+    array["centroid_x"] = geometry.centroid_x[valid]
+    array["centroid_y"] = geometry.centroid_y[valid]
+    arcpy.da.NumPyArrayToFeatureClass(array, output, ("centroid_x", "centroid_y"),
+                                      arcpy.Describe(path).spatialReference)
+    return output
@@ -0,0 +1,147 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Grid
+# Purpose: The purpose of this script is to generate square or hexagonal grid cells over the study area at a chosen
+# resolution, so the sub metrics can be calculated for equal sized analysis units instead of census tracts, which
+# vary widely in size. Cell ids are integers computed arithmetically from coordinates, so assigning a point to its
+# cell is O(1) without any spatial join and very fine grids remain cheap. The grid units use the same column names as
+# census tracts (ct_id, area, x, y), so every engine in PEI_Engines and PEI_Partition accepts them unchanged.
+#
+# Steps
+# Step 1: Define a square or hexagonal (pointy top) grid over the study area bounding box.
+# Step 2: Compute the cell id of every point arithmetically from its coordinates.
+# Step 3: Compute cell centers, areas and polygon vertices from cell ids.
+# Step 4: Build analysis unit inputs by assigning every feature to its cell and keeping the occupied cells.
+# Step 5: Label the cells of the access to parks raster with their analysis unit.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import math
+import numpy as np
+
+SQRT3 = math.sqrt(3)
+
+
+class Grid:
+
+    def __init__(self, bbox, size, shape="square"):
+        # Step 1: Define a square or hexagonal grid over the study area bounding box. For a square grid size is the
+        # cell width, for a hexagonal grid it is the distance from the cell center to a corner.
+        if shape not in ("square", "hexagon"):
+            raise ValueError(f"Unknown grid shape {shape!r}, expected 'square' or 'hexagon'.")
+        self.shape = shape
+        self.size = float(size)
+        self.x0, self.y0 = float(bbox[0]), float(bbox[1])
+        width, height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        if shape == "square":
+            self.ncols = max(int(math.ceil(width / self.size)), 1)
+            self.nrows = max(int(math.ceil(height / self.size)), 1)
+        else:
+            # Hexagon rows are 1.5 * size apart and columns sqrt(3) * size apart, with odd rows shifted half a column.
+            # The grid starts one cell before the bounding box so the cells on its edges are complete.
+            self.x0 -= SQRT3 * self.size
+            self.y0 -= 1.5 * self.size
+            self.ncols = int(math.ceil(width / (SQRT3 * self.size))) + 3
+            self.nrows = int(math.ceil(height / (1.5 * self.size))) + 3
+
+    @property
+    def n_cells(self):
+        return self.ncols * self.nrows
+
+    @property
+    def cell_area(self):
+        if self.shape == "square":
+            return self.size * self.size
+        return 1.5 * SQRT3 * self.size * self.size
+
+    def cell_ids(self, x, y):
+        # Step 2: Compute the cell id of every point arithmetically from its coordinates, -1 outside the grid.
+        x = np.asarray(x, dtype=float) - self.x0
+        y = np.asarray(y, dtype=float) - self.y0
+        if self.shape == "square":
+            col = np.floor(x / self.size).astype(np.int64)
+            row = np.floor(y / self.size).astype(np.int64)
+        else:
+            row, col = self.hex_offset(x, y)
+        inside = (col >= 0) & (col < self.ncols) & (row >= 0) & (row < self.nrows)
+        return np.where(inside, row * self.ncols + col, -1)
+
+    def hex_offset(self, x, y):
+        # Fractional axial coordinates of a pointy top hexagon grid, rounded to the nearest cell with cube rounding,
+        # then converted to odd-r offset rows and columns.
+        q = (SQRT3 / 3 * x - y / 3) / self.size
+        r = (2 / 3 * y) / self.size
+        s = -q - r
+        rq, rr, rs = np.round(q), np.round(r), np.round(s)
+        dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+        fix_q = (dq > dr) & (dq > ds)
+        fix_r = ~fix_q & (dr > ds)
+        rq = np.where(fix_q, -rr - rs, rq)
+        rr = np.where(fix_r, -rq - rs, rr)
+        row = rr.astype(np.int64)
+        col = rq.astype(np.int64) + (row - (row & 1)) // 2
+        return row, col
+
+    def centers(self, ids):
+        # Step 3: Cell centers of the given cell ids.
+        ids = np.asarray(ids, dtype=np.int64)
+        row, col = ids // self.ncols, ids % self.ncols
+        if self.shape == "square":
+            return self.x0 + (col + 0.5) * self.size, self.y0 + (row + 0.5) * self.size
+        x = SQRT3 * self.size * (col + 0.5 * (row & 1))
+        y = 1.5 * self.size * row
+        return self.x0 + x, self.y0 + y
+
+    def polygons(self, ids):
+        # Step 3: Polygon corner coordinates of the given cell ids, an (n x corners x 2) array.
+        x, y = self.centers(ids)
+        if self.shape == "square":
+            half = self.size / 2
+            offsets = np.array([[-half, -half], [-half, half], [half, half], [half, -half]])
+        else:
+            angles = np.radians(np.arange(6) * 60 + 30)
+            offsets = np.column_stack([np.cos(angles), np.sin(angles)]) * self.size
+        return np.stack([x, y], axis=-1)[:, None, :] + offsets[None, :, :]
+
+
+def grid_inputs(grid, population_points, layers, stops):
+    # Step 4: Build analysis unit inputs for PEI_Engines and PEI_Partition by assigning every feature to its cell by
+    # its x and y coordinates, keeping only the occupied cells. population_points holds population points (x, y,
+    # population), for example census block centroids, and layers maps lots, nodes, sidewalks and roads to their
+    # column dictionaries with x and y. Returns the inputs with census tract style columns for the cells.
+    ids = {name: grid.cell_ids(columns["x"], columns["y"]) for name, columns in layers.items()}
+    ids["population"] = grid.cell_ids(population_points["x"], population_points["y"])
+    occupied = np.unique(np.concatenate([cell_ids[cell_ids >= 0] for cell_ids in ids.values()]))
+    x, y = grid.centers(occupied)
+    n_cells = len(occupied)
+
+    def unit_index(cell_ids):
+        index = np.searchsorted(occupied, cell_ids)
+        return np.where(cell_ids >= 0, np.minimum(index, max(n_cells - 1, 0)), -1)
+
+    population = np.zeros(n_cells)
+    inside = ids["population"] >= 0
+    np.add.at(population, unit_index(ids["population"])[inside],
+              np.asarray(population_points["population"], dtype=float)[inside])
+    inputs = {"tracts": {"ct_id": occupied, "area": np.full(n_cells, grid.cell_area), "population": population,
+                         "x": x, "y": y},
+              "stops": stops}
+    for name, columns in layers.items():
+        inputs[name] = dict(columns, tract_index=unit_index(ids[name]))
+    return inputs
+
+
+def raster_labels(grid, units, shape, x_left, y_top, cell_size):
+    # Step 5: Label every cell of a raster with the index of its analysis unit in units (the sorted ct_id column of
+    # grid_inputs), or -1, so the access to parks engine runs on grid units. The raster starts at its top left corner.
+    rows, cols = np.indices(shape)
+    x = x_left + (cols.ravel() + 0.5) * cell_size
+    y = y_top - (rows.ravel() + 0.5) * cell_size
+    ids = grid.cell_ids(x, y)
+    index = np.minimum(np.searchsorted(units, ids), max(len(units) - 1, 0))
+    found = (ids >= 0) & (np.asarray(units)[index] == ids)
+    return np.where(found, index, -1).reshape(shape)
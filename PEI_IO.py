@@ -0,0 +1,210 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_IO
+# Purpose: The purpose of this script is to read and write the Pedestrian Environment Index inputs as GeoParquet
+# files instead of loading whole feature classes through arcpy. Only the requested columns are loaded, and row groups
+# whose bounding boxes fall outside the study area of the census tracts are skipped using the row group statistics of
+# the GeoParquet bbox covering columns. Rows are written in Morton (Z-order) order of their bounding box centers so
+# every row group covers a compact area and the bounding box pushdown can skip most of a large layer.
+#
+# Steps
+# Step 1: Export a feature class to GeoParquet with WKB geometries and a bbox covering column.
+# Step 2: Determine the study area bounding box from the census tracts file.
+# Step 3: Select the row groups whose bbox column statistics intersect the study area.
+# Step 4: Read only the requested columns of the selected row groups and drop rows outside the study area.
+# Step 5: Write every per census tract output column back in a single operation, aligned by sorted ct_id.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+GEO_METADATA_KEY = b"geo"
+GEOMETRY_COLUMN = "geometry"
+BBOX_COLUMN = "bbox"
+BBOX_FIELDS = ("xmin", "ymin", "xmax", "ymax")
+
+
+def morton_order(bounds, bits=16):
+    # Orders rows by the Morton code of their bounding box centers, so neighbouring features share row groups.
+    bounds = np.asarray(bounds, dtype=float)
+    if len(bounds) == 0:
+        return np.arange(0)
+    center_x = (bounds[:, 0] + bounds[:, 2]) / 2
+    center_y = (bounds[:, 1] + bounds[:, 3]) / 2
+    scale = (1 << bits) - 1
+    span_x = max(center_x.max() - center_x.min(), 1e-12)
+    span_y = max(center_y.max() - center_y.min(), 1e-12)
+    cell_x = ((center_x - center_x.min()) / span_x * scale).astype(np.uint64)
+    cell_y = ((center_y - center_y.min()) / span_y * scale).astype(np.uint64)
+    code = np.zeros(len(bounds), dtype=np.uint64)
+    for bit in range(bits):
+        code |= ((cell_x >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit)
+        code |= ((cell_y >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit + 1)
+    return np.argsort(code, kind="stable")
+
+
+def write_geoparquet(path, columns, geometry, bounds, crs=None, row_group_size=65536, sort=True):
+    # Writes attribute columns, WKB geometries and their (n x 4) xmin, ymin, xmax, ymax bounds as GeoParquet 1.1,
+    # with a bbox covering column whose row group statistics drive the bounding box pushdown on read.
+    bounds = np.asarray(bounds, dtype=float).reshape(-1, 4)
+    order = morton_order(bounds) if sort else np.arange(len(bounds))
+    arrays = {name: pa.array(np.asarray(values)[order]) if not isinstance(values, pa.Array) else values.take(order)
+              for name, values in columns.items()}
+    arrays[GEOMETRY_COLUMN] = pa.array([geometry[i] for i in order.tolist()], type=pa.binary())
+    arrays[BBOX_COLUMN] = pa.StructArray.from_arrays([pa.array(bounds[order, i]) for i in range(4)],
+                                                     names=list(BBOX_FIELDS))
+    table = pa.table(arrays)
+    extent = [float(bounds[:, 0].min()), float(bounds[:, 1].min()), float(bounds[:, 2].max()),
+              float(bounds[:, 3].max())] if len(bounds) else []
+    geo = {"version": "1.1.0",
+           "primary_column": GEOMETRY_COLUMN,
+           "columns": {GEOMETRY_COLUMN: {"encoding": "WKB",
+                                         "geometry_types": [],
+                                         "bbox": extent,
+                                         "crs": crs,
+                                         "covering": {"bbox": {field: [BBOX_COLUMN, field]
+                                                               for field in BBOX_FIELDS}}}}}
+    table = table.replace_schema_metadata({GEO_METADATA_KEY: json.dumps(geo).encode()})
+    pq.write_table(table, path, row_group_size=row_group_size, write_statistics=True)
+
+
+def feature_class_to_geoparquet(feature_class, path, fields, row_group_size=65536):
+    # Step 1: Export a feature class to GeoParquet with WKB geometries and a bbox covering column. This is the only
+    # function here that needs arcpy, so the readers work without it.
+    import arcpy
+    values = {field: [] for field in fields}
+    geometry = []
+    bounds = []
+    with arcpy.da.SearchCursor(feature_class, fields + ["SHAPE@WKB", "SHAPE@"]) as cursor:
+        for row in cursor:
+            for field, value in zip(fields, row):
+                values[field].append(value)
+            geometry.append(bytes(row[-2]))
+            extent = row[-1].extent
+            bounds.append((extent.XMin, extent.YMin, extent.XMax, extent.YMax))
+    crs = arcpy.Describe(feature_class).spatialReference.exportToString()
+    write_geoparquet(path, {field: pa.array(column) for field, column in values.items()}, geometry, bounds,
+                     crs=crs, row_group_size=row_group_size)
+
+
+def geo_metadata(parquet_file):
+    metadata = parquet_file.schema_arrow.metadata or {}
+    if GEO_METADATA_KEY not in metadata:
+        raise ValueError("File has no GeoParquet metadata.")
+    return json.loads(metadata[GEO_METADATA_KEY])
+
+
+def bbox_column_indices(parquet_file, geo):
+    # Finds the leaf column indices of the xmin, ymin, xmax and ymax bbox covering fields, or None without a covering.
+    covering = geo["columns"][geo["primary_column"]].get("covering", {}).get("bbox")
+    if covering is None:
+        return None
+    schema = parquet_file.metadata.schema
+    paths = {schema.column(i).path: i for i in range(len(schema))}
+    try:
+        return [paths[".".join(covering[field])] for field in BBOX_FIELDS]
+    except KeyError:
+        return None
+
+
+def study_area_bbox(path):
+    # Step 2: Determine the study area bounding box from the census tracts file, using the file level bbox metadata
+    # and falling back to the bbox covering column statistics.
+    parquet_file = pq.ParquetFile(path)
+    geo = geo_metadata(parquet_file)
+    bbox = geo["columns"][geo["primary_column"]].get("bbox")
+    if bbox:
+        return tuple(bbox)
+    table = parquet_file.read(columns=[BBOX_COLUMN]).column(BBOX_COLUMN).combine_chunks()
+    return (float(np.min(table.field("xmin"))), float(np.min(table.field("ymin"))),
+            float(np.max(table.field("xmax"))), float(np.max(table.field("ymax"))))
+
+
+def select_row_groups(parquet_file, bbox, geo=None):
+    # Step 3: Select the row groups whose bbox column statistics intersect the study area. Row groups without
+    # statistics are always kept.
+    geo = geo or geo_metadata(parquet_file)
+    metadata = parquet_file.metadata
+    indices = bbox_column_indices(parquet_file, geo)
+    if indices is None:
+        return list(range(metadata.num_row_groups))
+    xmin, ymin, xmax, ymax = bbox
+    selected = []
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        stats = [row_group.column(j).statistics for j in indices]
+        if any(s is None or not s.has_min_max for s in stats):
+            selected.append(i)
+            continue
+        if stats[0].min <= xmax and stats[2].max >= xmin and stats[1].min <= ymax and stats[3].max >= ymin:
+            selected.append(i)
+    return selected
+
+
+def read_geoparquet(path, columns=None, bbox=None, geometry=True):
+    # Step 4: Read only the requested columns of the selected row groups and drop rows outside the study area.
+    # bbox is an (xmin, ymin, xmax, ymax) tuple or the path of a census tracts GeoParquet file. Returns an arrow table.
+    parquet_file = pq.ParquetFile(path)
+    geo = geo_metadata(parquet_file)
+    geometry_column = geo["primary_column"]
+    if columns is None:
+        columns = [name for name in parquet_file.schema_arrow.names if name not in (geometry_column, BBOX_COLUMN)]
+    read_columns = list(columns) + ([geometry_column] if geometry else [])
+    if bbox is None:
+        return parquet_file.read(columns=read_columns)
+    if isinstance(bbox, str):
+        bbox = study_area_bbox(bbox)
+    row_groups = select_row_groups(parquet_file, bbox, geo)
+    table = parquet_file.read_row_groups(row_groups, columns=read_columns + [BBOX_COLUMN])
+    boxes = table.column(BBOX_COLUMN).combine_chunks()
+    inside = ((np.asarray(boxes.field("xmin")) <= bbox[2]) & (np.asarray(boxes.field("xmax")) >= bbox[0]) &
+              (np.asarray(boxes.field("ymin")) <= bbox[3]) & (np.asarray(boxes.field("ymax")) >= bbox[1]))
+    return table.filter(pa.array(inside)).select(read_columns)
+
+
+def is_geoparquet(path):
+    return GEO_METADATA_KEY in (pq.read_schema(path).metadata or {})
+
+
+def read_arrays(path, columns=None, bbox=None):
+    # Reads attribute columns, every one by default, as a {column: numpy array} dictionary, the form used by
+    # PEI_Engines.
+    table = read_geoparquet(path, columns, bbox, geometry=False)
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def aligned_columns(id_field, ct_ids, columns):
+    # Builds a structured array sorted by ct_id with one double field per output column. Columns are either arrays in
+    # the same order as ct_ids or {ct_id: value} dictionaries, with missing or null values written as 0.
+    ct_ids = np.asarray(ct_ids)
+    order = np.argsort(ct_ids, kind="stable")
+    array = np.zeros(len(ct_ids), dtype=[(id_field, ct_ids.dtype)] + [(name, "<f8") for name in columns])
+    array[id_field] = ct_ids[order]
+    for name, values in columns.items():
+        if isinstance(values, dict):
+            column = [values.get(ct_id) for ct_id in array[id_field].tolist()]
+            array[name] = [0 if value is None else value for value in column]
+        else:
+            array[name] = np.nan_to_num(np.asarray(values, dtype=float)[order], nan=0.0)
+    return array
+
+
+def bulk_write(table, id_field, ct_ids, columns, parquet_path=None):
+    # Step 5: Write every per census tract output column back in a single operation, aligned by sorted ct_id. The
+    # columns are joined onto the table with one ExtendTable call, which adds new fields and updates existing ones,
+    # instead of an AddField and an update cursor pass per column. With parquet_path the columns are written to a
+    # single columnar file instead and the table is left untouched.
+    array = aligned_columns(id_field, ct_ids, columns)
+    if parquet_path is not None:
+        pq.write_table(pa.table({name: array[name] for name in array.dtype.names}), parquet_path)
+        return array
+    import arcpy
+    arcpy.da.ExtendTable(table, id_field, array, id_field, append_only=False)
+    return array
@@ -0,0 +1,548 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Incremental
+# Purpose: The purpose of this script is to keep sub metrics up to date under small edits of their inputs instead of
+# re-running the whole calculation. The land use mix keeps the census tract by land use area accumulators of the last
+# run and applies a delta of added, removed and changed lots to them, recalculating the entropy of the affected census
+# tracts only. The normalization max is tracked alongside, so all census tracts are only re-normalized when the max
+# itself changes. Daily parcel edits touching a handful of census tracts then cost milliseconds. The intersection
+# density keeps a node degree index of the street network, so added and removed street segments only change the degree
+# of their end nodes and the weighted intersection sum of the census tracts containing those nodes. Added and removed
+# transportation stops only change the sum of 2SFCA ratios of the census tracts within their radius, and added and
+# removed parks only change the cost distance of the raster cells they are, or were, the closest park of.
+#
+# Steps
+# Step 1: Build the accumulators from a full run and keep them with the lot table.
+# Step 2: Apply a delta of added, removed and changed lots to the accumulators of the affected census tracts.
+# Step 3: Recalculate the affected census tracts and re-normalize everything only if the max changed.
+# Step 4: Save the accumulators for the next run.
+# Step 5: Apply added and removed street segments to the node degree index and update the intersection density.
+# Step 6: Apply added and removed sidewalk or street pieces to the sidewalk or street network density.
+# Step 7: Apply added and removed transportation stops to the sum of 2SFCA ratios of the census tracts.
+# Step 8: Apply added and removed parks to the cost distance raster and the median of the affected census tracts.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import numpy as np
+import PEI_Engines as engines
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.spatial import cKDTree
+
+
+class MaxTracker:
+
+    def __init__(self, values):
+        # Unnormalized values of every census tract and their max, which drives the max value normalization.
+        self.values = np.asarray(values, dtype=float).copy()
+        self._rescan()
+
+    def _rescan(self):
+        self.argmax = int(np.argmax(self.values)) if len(self.values) else -1
+        self.max = float(self.values[self.argmax]) if len(self.values) else 0.0
+
+    def update(self, tracts, values):
+        # Step 3: Updates the values of some census tracts and returns whether the max changed. Only a decrease of
+        # the census tract holding the max needs a scan of all census tracts.
+        old_max = self.max
+        self.values[tracts] = values
+        if self.argmax in set(np.asarray(tracts).tolist()) and self.values[self.argmax] < old_max:
+            self._rescan()
+        elif len(tracts) and np.max(values) > self.max:
+            self.argmax = int(np.asarray(tracts)[np.argmax(values)])
+            self.max = float(np.max(values))
+        return self.max != old_max
+
+
+class IncrementalLandUseMix:
+
+    def __init__(self, ct_id, lot_id, tract_index, land_use, area):
+        # Step 1: Build the census tract by land use area accumulators from the lots of a full run. The lot table is
+        # kept sorted by lot_id, so removed and changed lots can find what they contributed. Removed lots are only
+        # flagged and lots added later go to a small overflow table, so a delta never copies the lot table.
+        self.ct_id = np.asarray(ct_id)
+        order = np.argsort(np.asarray(lot_id), kind="stable")
+        self.lot_id = np.asarray(lot_id)[order]
+        self.lot_tract = np.asarray(tract_index, dtype=np.int64)[order]
+        self.lot_land_use = np.asarray(land_use)[order]
+        self.lot_area = np.asarray(area, dtype=float)[order]
+        self.lot_live = np.ones(len(self.lot_id), dtype=bool)
+        self.overflow = {}
+        valid = (self.lot_tract >= 0) & (self.lot_area > 0)
+        self.land_uses = np.unique(self.lot_land_use[valid])
+        self.by_class = np.zeros((len(self.ct_id), len(self.land_uses)))
+        np.add.at(self.by_class, (self.lot_tract[valid], np.searchsorted(self.land_uses, self.lot_land_use[valid])),
+                  self.lot_area[valid])
+        self.sum_sha_num = MaxTracker(engines.shannon_sum(self.by_class))
+        self.normalized = self._normalize()
+
+    @classmethod
+    def from_inputs(cls, inputs):
+        # Step 1: Build from the PEI_Partition inputs, using the lot_id column or the lot row numbers as ids.
+        lots = inputs["lots"]
+        lot_id = lots.get("lot_id", np.arange(len(lots["tract_index"])))
+        return cls(inputs["tracts"]["ct_id"], lot_id, lots["tract_index"], lots["land_use"], lots["land_use_area"])
+
+    def n_land_uses(self):
+        return int(np.count_nonzero(self.by_class.sum(axis=0) > 0))
+
+    def _normalize(self, tracts=None):
+        values = self.sum_sha_num.values if tracts is None else self.sum_sha_num.values[tracts]
+        return engines.normalize_land_use_mix(values, self.n_land_uses(), self.sum_sha_num.max)
+
+    def _accumulate(self, tract_index, land_use, area, sign):
+        # Step 2: Adds (sign 1) or subtracts (sign -1) lot areas, adding a column for a land use not seen before.
+        valid = (tract_index >= 0) & (area > 0)
+        new = np.setdiff1d(land_use[valid], self.land_uses)
+        if len(new):
+            land_uses = np.union1d(self.land_uses, new)
+            by_class = np.zeros((len(self.ct_id), len(land_uses)))
+            by_class[:, np.searchsorted(land_uses, self.land_uses)] = self.by_class
+            self.land_uses, self.by_class = land_uses, by_class
+        np.add.at(self.by_class, (tract_index[valid], np.searchsorted(self.land_uses, land_use[valid])),
+                  sign * area[valid])
+        return tract_index[valid]
+
+    def _positions(self, lot_id):
+        # Positions of lot ids in the lot table, -1 for lots that are not in it.
+        position = np.minimum(np.searchsorted(self.lot_id, lot_id), max(len(self.lot_id) - 1, 0))
+        found = (self.lot_id[position] == lot_id) if len(self.lot_id) else np.zeros(len(lot_id), dtype=bool)
+        return np.where(found, position, -1)
+
+    def _take(self, lot_id):
+        # Step 2: Removes lots and returns their census tract, land use and area.
+        position = self._positions(lot_id)
+        in_table = position >= 0
+        in_table[in_table] = self.lot_live[position[in_table]]
+        rows = [self.overflow.pop(i) for i in lot_id[~in_table].tolist() if i in self.overflow]
+        if len(rows) != np.count_nonzero(~in_table):
+            raise KeyError(f"Unknown lot ids: {[i for i in lot_id[~in_table].tolist()][:10]}")
+        position = position[in_table]
+        self.lot_live[position] = False
+        return (np.concatenate([self.lot_tract[position], np.array([r[0] for r in rows], dtype=np.int64)]),
+                np.concatenate([self.lot_land_use[position], np.array([r[1] for r in rows],
+                                                                      dtype=self.lot_land_use.dtype)]),
+                np.concatenate([self.lot_area[position], np.array([r[2] for r in rows], dtype=float)]))
+
+    def _put(self, lot_id, tract_index, land_use, area):
+        # Step 2: Adds lots, reusing the lot table row of a lot removed earlier and the overflow table otherwise.
+        position = self._positions(lot_id)
+        if (position >= 0).any() and self.lot_live[position[position >= 0]].any() or \
+                any(i in self.overflow for i in lot_id.tolist()):
+            raise ValueError("Added lots must not already exist, edit them as changed lots instead.")
+        reuse = position >= 0
+        rows = position[reuse]
+        self.lot_tract[rows], self.lot_land_use[rows], self.lot_area[rows] = \
+            tract_index[reuse], land_use[reuse], area[reuse]
+        self.lot_live[rows] = True
+        for i, values in zip(lot_id[~reuse].tolist(), zip(tract_index[~reuse].tolist(), land_use[~reuse].tolist(),
+                                                          area[~reuse].tolist())):
+            self.overflow[i] = values
+
+    def apply(self, added=None, removed=None, changed=None):
+        # Steps 2 and 3: Apply a delta. added and changed are lot column dictionaries with lot_id, tract_index,
+        # land_use and land_use_area, and removed is a list of lot ids. A changed lot is removed with its old values
+        # and added with its new ones. Returns the affected census tract indices and whether all census tracts were
+        # re-normalized.
+        n_land_uses = self.n_land_uses()
+        affected = []
+        outgoing = np.concatenate([np.asarray(removed if removed is not None else [], dtype=self.lot_id.dtype),
+                                   np.asarray(changed["lot_id"] if changed else [], dtype=self.lot_id.dtype)])
+        if len(outgoing):
+            affected.append(self._accumulate(*self._take(outgoing), -1))
+        for lots in (added, changed):
+            if not lots:
+                continue
+            columns = (np.asarray(lots["lot_id"], dtype=self.lot_id.dtype),
+                       np.asarray(lots["tract_index"], dtype=np.int64),
+                       np.asarray(lots["land_use"], dtype=self.lot_land_use.dtype),
+                       np.asarray(lots["land_use_area"], dtype=float))
+            affected.append(self._accumulate(*columns[1:], 1))
+            self._put(*columns)
+
+        # Step 3: Recalculate the entropy of the affected census tracts, clearing the rounding left by subtractions.
+        tracts = np.unique(np.concatenate(affected)) if affected else np.arange(0)
+        rows = self.by_class[tracts]
+        rows[rows < 1e-9 * np.maximum(rows.sum(axis=1, keepdims=True), 1)] = 0
+        self.by_class[tracts] = rows
+        max_changed = self.sum_sha_num.update(tracts, engines.shannon_sum(rows))
+        renormalized = max_changed or self.n_land_uses() != n_land_uses
+        if renormalized:
+            self.normalized = self._normalize()
+        else:
+            self.normalized[tracts] = self._normalize(tracts)
+        return tracts, renormalized
+
+    def lots(self):
+        # The current lot table, sorted by lot_id, with the overflow merged in and removed lots left out.
+        ids = np.array(list(self.overflow), dtype=self.lot_id.dtype)
+        rows = list(self.overflow.values())
+        lot_id = np.concatenate([self.lot_id[self.lot_live], ids])
+        order = np.argsort(lot_id, kind="stable")
+        return (lot_id[order],
+                np.concatenate([self.lot_tract[self.lot_live], np.array([r[0] for r in rows], dtype=np.int64)])[order],
+                np.concatenate([self.lot_land_use[self.lot_live],
+                                np.array([r[1] for r in rows], dtype=self.lot_land_use.dtype)])[order],
+                np.concatenate([self.lot_area[self.lot_live], np.array([r[2] for r in rows], dtype=float)])[order])
+
+    def save(self, path):
+        # Step 4: Save the lot table for the next run. The accumulators are rebuilt from it when loading.
+        lot_id, lot_tract, lot_land_use, lot_area = self.lots()
+        with open(path, "wb") as f:
+            np.savez(f, ct_id=self.ct_id, lot_id=lot_id, lot_tract=lot_tract, lot_land_use=lot_land_use,
+                     lot_area=lot_area)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["ct_id"], data["lot_id"], data["lot_tract"], data["lot_land_use"], data["lot_area"])
+
+
+def intersection_weight(degree):
+    # Contribution of an intersection to the weighted intersection sum: its degree from 3 roads up, 0 otherwise.
+    degree = np.asarray(degree)
+    return np.where(degree > 2, degree, 0).astype(float)
+
+
+class IncrementalIntersectionDensity:
+
+    def __init__(self, ct_id, land_area, node_x, node_y, degree, tract_index, locate=None, tolerance=0.01):
+        # Step 1: Build the node degree index from the street intersections of a full run. Nodes are keyed by their
+        # coordinates snapped to the tolerance, so segment end points find their node. locate assigns new nodes to
+        # census tracts, for example PEI_Lookup.LabelGrid.locate. The street network is expected to be split at its
+        # intersections, as street centerlines are, so every intersection is a segment end point.
+        self.ct_id = np.asarray(ct_id)
+        self.land_area = np.asarray(land_area, dtype=float)
+        self.locate = locate
+        self.tolerance = tolerance
+        self.degree = np.asarray(degree, dtype=np.int64).copy()
+        self.node_tract = np.asarray(tract_index, dtype=np.int64).copy()
+        self.nodes = dict(zip(zip(*self._keys(node_x, node_y)), range(len(self.degree))))
+        inside = self.node_tract >= 0
+        self.weighted = np.bincount(self.node_tract[inside], weights=intersection_weight(self.degree)[inside],
+                                    minlength=len(self.ct_id))
+        self.bn_intersection = MaxTracker(self._density(np.arange(len(self.ct_id))))
+        self.normalized = engines.normalize(self.bn_intersection.values, self.bn_intersection.max)
+
+    @classmethod
+    def from_inputs(cls, inputs, locate=None, tolerance=0.01):
+        # Step 1: Build from the PEI_Partition inputs, whose nodes need x and y columns.
+        nodes, tracts = inputs["nodes"], inputs["tracts"]
+        return cls(tracts["ct_id"], tracts["area"], nodes["x"], nodes["y"], nodes["degree"], nodes["tract_index"],
+                   locate, tolerance)
+
+    def _keys(self, x, y):
+        return (np.round(np.asarray(x, dtype=float) / self.tolerance).astype(np.int64).tolist(),
+                np.round(np.asarray(y, dtype=float) / self.tolerance).astype(np.int64).tolist())
+
+    def _density(self, tracts):
+        area = self.land_area[tracts]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(area > 0, self.weighted[tracts] / (area * engines.SQUARE_FEET), 0.0)
+
+    def _node_indices(self, x, y, create):
+        # Node index of every end point. Unknown end points become new nodes when create is set.
+        keys = list(zip(*self._keys(x, y)))
+        missing = [i for i, key in enumerate(keys) if key not in self.nodes]
+        if missing and not create:
+            raise KeyError(f"Removed segments end at unknown nodes: {[keys[i] for i in missing[:10]]}")
+        if missing:
+            if self.locate is None:
+                raise ValueError("Added segments create new nodes, which need a locate function for their tracts.")
+            new_keys = list(dict.fromkeys(keys[i] for i in missing))
+            new_x = np.array([key[0] for key in new_keys]) * self.tolerance
+            new_y = np.array([key[1] for key in new_keys]) * self.tolerance
+            for key in new_keys:
+                self.nodes[key] = len(self.nodes)
+            self.degree = np.concatenate([self.degree, np.zeros(len(new_keys), dtype=np.int64)])
+            self.node_tract = np.concatenate([self.node_tract, np.asarray(self.locate(new_x, new_y), dtype=np.int64)])
+        return np.array([self.nodes[key] for key in keys], dtype=np.int64)
+
+    def apply(self, added=None, removed=None):
+        # Step 5: Apply added and removed street segments, column dictionaries of x0, y0, x1, y1. Every segment changes
+        # the degree of its two end nodes by one, and only the census tracts containing those nodes are recalculated.
+        # Returns the affected census tract indices and whether all census tracts were re-normalized.
+        changes = []
+        for segments, sign in ((removed, -1), (added, 1)):
+            if not segments:
+                continue
+            x = np.concatenate([segments["x0"], segments["x1"]])
+            y = np.concatenate([segments["y0"], segments["y1"]])
+            changes.append((self._node_indices(x, y, sign > 0), sign))
+        if not changes:
+            return np.arange(0), False
+        nodes = np.concatenate([node for node, _ in changes])
+        delta = np.concatenate([np.full(len(node), sign) for node, sign in changes])
+        touched, inverse = np.unique(nodes, return_inverse=True)
+        new_degree = self.degree[touched] + np.bincount(inverse, weights=delta).astype(np.int64)
+        if (new_degree < 0).any():
+            raise ValueError("Removed segments would leave a node with a negative degree.")
+        tract = self.node_tract[touched]
+        inside = tract >= 0
+        np.add.at(self.weighted, tract[inside],
+                  intersection_weight(new_degree[inside]) - intersection_weight(self.degree[touched][inside]))
+        self.degree[touched] = new_degree
+
+        tracts = np.unique(tract[inside])
+        renormalized = self.bn_intersection.update(tracts, self._density(tracts))
+        if renormalized:
+            self.normalized = engines.normalize(self.bn_intersection.values, self.bn_intersection.max)
+        else:
+            self.normalized[tracts] = engines.normalize(self.bn_intersection.values[tracts], self.bn_intersection.max)
+        return tracts, renormalized
+
+
+class IncrementalAreaDensity:
+
+    def __init__(self, ct_id, tract_area, tract_index, area):
+        # Step 6: Build the apportioned area sums of the sidewalk or street network density by census tract.
+        self.ct_id = np.asarray(ct_id)
+        self.tract_area = np.asarray(tract_area, dtype=float)
+        self.area = engines.tract_sums(np.asarray(tract_index), np.asarray(area, dtype=float), len(self.ct_id))
+        self.density = MaxTracker(self._density(np.arange(len(self.ct_id))))
+        self.normalized = engines.normalize(self.density.values, self.density.max)
+
+    def _density(self, tracts):
+        area = self.tract_area[tracts]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(area > 0, self.area[tracts] / area, 0.0)
+
+    def apply(self, added=None, removed=None):
+        # Step 6: Apply added and removed pieces, column dictionaries of tract_index and area. Returns the affected
+        # census tract indices and whether all census tracts were re-normalized.
+        tract_index, area = [], []
+        for pieces, sign in ((added, 1), (removed, -1)):
+            if pieces:
+                tract_index.append(np.asarray(pieces["tract_index"], dtype=np.int64))
+                area.append(sign * np.asarray(pieces["area"], dtype=float))
+        tract_index = np.concatenate(tract_index) if tract_index else np.arange(0)
+        area = np.concatenate(area) if area else np.zeros(0)
+        inside = tract_index >= 0
+        tracts, inverse = np.unique(tract_index[inside], return_inverse=True)
+        self.area[tracts] += np.bincount(inverse, weights=area[inside], minlength=len(tracts))
+        self.area[tracts] = np.where(np.abs(self.area[tracts]) < 1e-9, 0.0, self.area[tracts])
+        renormalized = self.density.update(tracts, self._density(tracts))
+        if renormalized:
+            self.normalized = engines.normalize(self.density.values, self.density.max)
+        else:
+            self.normalized[tracts] = engines.normalize(self.density.values[tracts], self.density.max)
+        return tracts, renormalized
+
+
+class IncrementalTransportationAccess:
+
+    def __init__(self, ct_id, tract_x, tract_y, population, stop_id, stop_x, stop_y,
+                 radius=engines.TRANSPORTATION_RADIUS):
+        # Step 7: Build the 2SFCA state from a full run: the census tract centroid index and, for every stop, its
+        # location, the census tracts in its catchment and its ratio of 1 over the population served. The ratio of a
+        # stop only depends on its own catchment, so adding or removing a stop only changes the sum of ratios of the
+        # census tracts within its radius.
+        self.ct_id = np.asarray(ct_id)
+        self.population = np.asarray(population, dtype=float)
+        self.radius = radius
+        self.tree = cKDTree(np.column_stack([tract_x, tract_y]))
+        catchment = engines.catchment_matrix(tract_x, tract_y, stop_x, stop_y, radius).tocsc()
+        demand = catchment.T @ self.population
+        with np.errstate(divide="ignore"):
+            ratio = np.where(demand > 0, 1 / demand, 0.0)
+        self.stops = {stop: (x, y, catchment.indices[catchment.indptr[j]:catchment.indptr[j + 1]], ratio[j])
+                      for j, (stop, x, y) in enumerate(zip(np.asarray(stop_id).tolist(), np.asarray(stop_x).tolist(),
+                                                           np.asarray(stop_y).tolist()))}
+        self.sum_ratio = MaxTracker(catchment @ ratio)
+        self.normalized = engines.normalize(self.sum_ratio.values, self.sum_ratio.max)
+
+    @classmethod
+    def from_inputs(cls, inputs, radius=engines.TRANSPORTATION_RADIUS):
+        # Step 7: Build from the PEI_Partition inputs, using the stop_id column or the stop row numbers as ids.
+        tracts, stops = inputs["tracts"], inputs["stops"]
+        stop_id = stops.get("stop_id", np.arange(len(stops["x"])))
+        return cls(tracts["ct_id"], tracts["x"], tracts["y"], tracts["population"], stop_id, stops["x"], stops["y"],
+                   radius)
+
+    def apply(self, added=None, removed=None):
+        # Step 7: Apply added stops, a column dictionary of stop_id, x and y, and removed stops, a list of stop ids.
+        # Returns the affected census tract indices and whether all census tracts were re-normalized.
+        tract_index, ratios = [], []
+        for stop in (removed if removed is not None else []):
+            if stop not in self.stops:
+                raise KeyError(f"Unknown stop id: {stop}")
+            _, _, tracts, ratio = self.stops.pop(stop)
+            tract_index.append(tracts)
+            ratios.append(np.full(len(tracts), -ratio))
+        if added:
+            for stop, x, y in zip(np.asarray(added["stop_id"]).tolist(), np.asarray(added["x"], dtype=float).tolist(),
+                                  np.asarray(added["y"], dtype=float).tolist()):
+                if stop in self.stops:
+                    raise ValueError(f"Stop id {stop} already exists.")
+                tracts = np.sort(np.asarray(self.tree.query_ball_point((x, y), self.radius), dtype=np.int64))
+                demand = self.population[tracts].sum()
+                ratio = 1 / demand if demand > 0 else 0.0
+                self.stops[stop] = (x, y, tracts, ratio)
+                tract_index.append(tracts)
+                ratios.append(np.full(len(tracts), ratio))
+        if not tract_index:
+            return np.arange(0), False
+        tracts, inverse = np.unique(np.concatenate(tract_index), return_inverse=True)
+        values = self.sum_ratio.values[tracts] + np.bincount(inverse, weights=np.concatenate(ratios),
+                                                             minlength=len(tracts))
+        values[np.abs(values) < 1e-15] = 0
+        renormalized = self.sum_ratio.update(tracts, values)
+        if renormalized:
+            self.normalized = engines.normalize(self.sum_ratio.values, self.sum_ratio.max)
+        else:
+            self.normalized[tracts] = engines.normalize(self.sum_ratio.values[tracts], self.sum_ratio.max)
+        return tracts, renormalized
+
+
+class IncrementalParksAccess:
+
+    def __init__(self, sidewalk_mask, labels, park_rows, park_cols, cell_size, n_tracts, study_area=None):
+        # Step 8: Build the surfaces of PEI_Engines.parks_cost_median once and keep the cost graph, the cost distance
+        # of every cell, the park cell it is closest to and the cells of every census tract. An added park only
+        # lowers the cost distance of the cells it is now closest to, found by a search bounded by the largest cost
+        # distance so far. A removed park only raises the cost distance of the cells it was closest to, found again
+        # by a search over those cells seeded from their neighbours.
+        labels = np.asarray(labels)
+        if study_area is None:
+            study_area = labels >= 0
+        self.shape = labels.shape
+        self.cell_size = cell_size
+        self.labels = labels.ravel()
+        self.cost = engines.cost_surface(sidewalk_mask, cell_size, study_area)
+        self.valid = (self.cost > 0).ravel()
+        graph = engines.cost_graph(self.cost, cell_size)
+        self.graph = (graph + graph.T).tocsr()
+        cells = self.cells(park_rows, park_cols)
+        self.parks = dict(zip(*(values.tolist() for values in np.unique(cells, return_counts=True))))
+        self.distance = np.full(self.labels.size, np.inf)
+        self.source = np.full(self.labels.size, -1, dtype=np.int64)
+        if self.parks:
+            distance, _, source = csgraph.dijkstra(self.graph, indices=np.array(list(self.parks)), min_only=True,
+                                                   return_predecessors=True)
+            self.distance, self.source = np.where(self.valid, distance, np.inf), np.where(self.valid, source, -1)
+        keep = np.flatnonzero(self.labels >= 0)
+        self.tract_cells = keep[np.argsort(self.labels[keep], kind="stable")]
+        self.tract_offsets = np.concatenate([[0], np.cumsum(np.bincount(self.labels[keep], minlength=n_tracts))])
+        self.median = engines.zonal_median(self.labels, self.distance, n_tracts)
+        self.parks_median = MaxTracker(np.nan_to_num(self.median, nan=0.0))
+        self.normalized = engines.normalize_parks_access(self.median, self.parks_median.max)
+
+    @classmethod
+    def from_inputs(cls, inputs):
+        raster = inputs["raster"]
+        return cls(raster["sidewalk"], raster["labels"], raster["park_rows"], raster["park_cols"], raster["cell_size"],
+                   len(inputs["tracts"]["ct_id"]), raster.get("study_area"))
+
+    def cells(self, rows, cols):
+        # Park cells as flat raster indices, leaving out the ones outside the raster or on NoData cells.
+        rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+        inside = (rows >= 0) & (rows < self.shape[0]) & (cols >= 0) & (cols < self.shape[1])
+        cells = rows[inside] * self.shape[1] + cols[inside]
+        return cells[self.valid[cells]]
+
+    def _add(self, cells, window=64):
+        # Step 8: The cells closer to a new park than to any existing one take its cost distance. They are found in a
+        # window around the park that doubles until none of them is on its border, as a shortest path leaving the
+        # window would have to cross the border through a cell the park is also closer to.
+        closer = []
+        for cell in cells.tolist():
+            row, col = divmod(cell, self.shape[1])
+            size = window
+            while True:
+                r0, r1 = max(row - size, 0), min(row + size + 1, self.shape[0])
+                c0, c1 = max(col - size, 0), min(col + size + 1, self.shape[1])
+                index = (np.arange(r0, r1)[:, None] * self.shape[1] + np.arange(c0, c1)[None, :]).ravel()
+                old = self.distance[index]
+                finite = old[np.isfinite(old)]
+                limit = finite.max() if len(finite) == len(old) and len(old) else np.inf
+                distance = csgraph.dijkstra(engines.cost_graph(self.cost[r0:r1, c0:c1], self.cell_size),
+                                            directed=False, indices=(row - r0) * (c1 - c0) + col - c0, limit=limit)
+                improved = (distance < old).reshape(r1 - r0, c1 - c0)
+                border = (r0 > 0 and improved[0].any()) or (r1 < self.shape[0] and improved[-1].any()) or \
+                         (c0 > 0 and improved[:, 0].any()) or (c1 < self.shape[1] and improved[:, -1].any())
+                if not border:
+                    break
+                size *= 2
+            improved = improved.ravel()
+            self.distance[index[improved]] = distance[improved]
+            self.source[index[improved]] = cell
+            closer.append(index[improved])
+        return np.concatenate(closer) if closer else np.arange(0)
+
+    def _remove(self, cells):
+        # Step 8: The cells closest to a removed park are searched again from a virtual source linked to each of them
+        # by its best path through a neighbour outside them, which keeps its cost distance and park.
+        region = np.flatnonzero(np.isin(self.source, cells))
+        k = len(region)
+        rows = self.graph[region].tocoo()
+        position = np.searchsorted(region, rows.col)
+        inside = (position < k) & (region[np.minimum(position, k - 1)] == rows.col) if k else np.zeros(0, dtype=bool)
+        border = ~inside & np.isfinite(self.distance[rows.col])
+        seed = self.distance[rows.col[border]] + rows.data[border]
+        order = np.lexsort((seed, rows.row[border]))
+        first = order[np.concatenate([[True], np.diff(rows.row[border][order]) > 0])] if len(order) else order
+        seeded = rows.row[border][first]
+        seed_source = np.full(k, -1, dtype=np.int64)
+        seed_source[seeded] = self.source[rows.col[border][first]]
+        graph = sparse.csr_matrix((np.concatenate([rows.data[inside], seed[first]]),
+                                   (np.concatenate([rows.row[inside], np.full(len(seeded), k)]),
+                                    np.concatenate([position[inside], seeded]))), shape=(k + 1, k + 1))
+        distance, predecessors = csgraph.dijkstra(graph, indices=k, return_predecessors=True)
+
+        # The park of every cell is the park of the seeded cell its shortest path enters the region through, found by
+        # pointer jumping along the predecessors.
+        root = np.where((predecessors[:k] >= 0) & (predecessors[:k] != k), predecessors[:k], np.arange(k))
+        while True:
+            jumped = root[root]
+            if (jumped == root).all():
+                break
+            root = jumped
+        reached = np.isfinite(distance[:k])
+        self.distance[region] = distance[:k]
+        self.source[region] = np.where(reached, seed_source[root], -1)
+        return region
+
+    def apply(self, added=None, removed=None):
+        # Step 8: Apply added and removed parks, column dictionaries of row and col on the raster. Returns the affected
+        # census tract indices and whether all census tracts were re-normalized.
+        changed = []
+        if removed:
+            gone = []
+            for cell in self.cells(removed["row"], removed["col"]).tolist():
+                if cell not in self.parks:
+                    raise KeyError(f"No park at cell {divmod(cell, self.shape[1])}.")
+                self.parks[cell] -= 1
+                if not self.parks[cell]:
+                    del self.parks[cell]
+                    gone.append(cell)
+            if gone:
+                changed.append(self._remove(np.array(gone)))
+        if added:
+            new = []
+            for cell in self.cells(added["row"], added["col"]).tolist():
+                if cell not in self.parks:
+                    new.append(cell)
+                self.parks[cell] = self.parks.get(cell, 0) + 1
+            if new:
+                changed.append(self._add(np.unique(new)))
+        if not changed:
+            return np.arange(0), False
+
+        # Recalculate the median of the census tracts with changed cells only.
+        labels = self.labels[np.concatenate(changed)]
+        tracts = np.unique(labels[labels >= 0])
+        counts = self.tract_offsets[tracts + 1] - self.tract_offsets[tracts]
+        cells = self.tract_cells[np.concatenate([np.arange(self.tract_offsets[t], self.tract_offsets[t + 1])
+                                                 for t in tracts.tolist()] or [np.arange(0)])]
+        self.median[tracts] = engines.zonal_median(np.repeat(np.arange(len(tracts)), counts), self.distance[cells],
+                                                   len(tracts))
+        renormalized = self.parks_median.update(tracts, np.nan_to_num(self.median[tracts], nan=0.0))
+        if renormalized:
+            self.normalized = engines.normalize_parks_access(self.median, self.parks_median.max)
+        else:
+            self.normalized[tracts] = engines.normalize_parks_access(self.median[tracts], self.parks_median.max)
+        return tracts, renormalized
@@ -0,0 +1,282 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Index
+# Purpose: The purpose of this script is to keep a persistent spatial index next to every input layer (land use lots,
+# sidewalks, street network, census tracts) instead of rebuilding one for every spatial join, apportion and select by
+# location. The index is a Sort-Tile-Recursive (STR) packed R-tree stored as a sidecar directory of .npy arrays with
+# a manifest holding a content hash of the input. When the input is unchanged, as on repeated nightly runs over the
+# same parcels, the sidecar is loaded memory-mapped and no index is built at all. A feature class in a geodatabase is
+# hashed by its own row count, extent, object ids and geometries, so writing to another layer of the same geodatabase,
+# or to the attribute fields of the layer itself, keeps its sidecar valid.
+#
+# Steps
+# Step 1: Hash the content of the input layer.
+# Step 2: Load the sidecar memory-mapped if its hash matches the input.
+# Step 3: Otherwise read the feature bounding boxes, pack them into an STR tree and save the sidecar.
+# Step 4: Query the tree for the features whose bounding boxes intersect a box or contain a point, or for all the
+# features containing each of many points at once.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import hashlib
+import json
+import math
+import os
+import numpy as np
+
+NODE_SIZE = 16
+SIDECAR_SUFFIX = ".strtree"
+MANIFEST = "manifest.json"
+CHUNK = 1 << 20
+# Points tested together by STRTree.query_points, and the most features a tile of points is tested against at once
+# before its points walk the tree one by one instead.
+POINT_TILE = 1024
+DENSE_LIMIT = 256
+
+
+def is_feature_class(path):
+    # A feature class inside a geodatabase, or a layer name relative to the arcpy workspace, rather than a file.
+    return os.path.dirname(path).lower().endswith(".gdb") or not os.path.exists(path)
+
+
+def source_files(path, fields=()):
+    # Files holding the content of a layer file: the .shp of a shapefile, with its .dbf when attribute fields count,
+    # every file of a directory, or the file itself.
+    if path.lower().endswith(".shp"):
+        return [path] + ([path[:-4] + ".dbf"] if fields else [])
+    if os.path.isdir(path):
+        return sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+                      if not name.lower().endswith(".lock"))
+    return [path]
+
+
+def feature_class_hash(path, fields=()):
+    # Step 1: Hash a feature class through arcpy by its row count, extent, object ids and geometries, and the given
+    # attribute fields. Other layers of the geodatabase and the other fields of the layer, such as the sub metrics
+    # a run writes to the census tracts, do not change it.
+    import arcpy
+    digest = hashlib.sha1()
+    extent = arcpy.Describe(path).extent
+    digest.update(repr((int(arcpy.GetCount_management(path)[0]), extent.XMin, extent.YMin, extent.XMax,
+                        extent.YMax)).encode())
+    with arcpy.da.SearchCursor(path, ["OID@", "SHAPE@WKB"] + list(fields)) as cursor:
+        for row in cursor:
+            digest.update(str(row[0]).encode())
+            digest.update(bytes(row[1]) if row[1] is not None else b"\0")
+            digest.update(repr(row[2:]).encode())
+    return digest.hexdigest()
+
+
+def content_hash(path, fields=()):
+    # Step 1: Hash the content of the input layer. Feature classes are hashed through arcpy, files by their bytes,
+    # where file names only count within a directory, so a copy of a layer under another name has the same hash.
+    if is_feature_class(path):
+        return feature_class_hash(path, fields)
+    digest = hashlib.sha1()
+    files = source_files(path, fields)
+    for file_path in files:
+        if len(files) > 1:
+            digest.update(os.path.basename(file_path).encode())
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sidecar_path(path, suffix=SIDECAR_SUFFIX):
+    # The sidecar sits next to the input, or next to the geodatabase of a feature class. Layer names are resolved
+    # against the arcpy workspace.
+    if not os.path.dirname(path) and is_feature_class(path):
+        import arcpy
+        path = os.path.join(arcpy.env.workspace, path)
+    parent = os.path.dirname(path)
+    if parent.lower().endswith(".gdb"):
+        return f"{parent}_{os.path.basename(path)}{suffix}"
+    return f"{path}{suffix}"
+
+
+def layer_boxes(path):
+    # Step 3: Read the feature bounding boxes as an (n x 4) array of xmin, ymin, xmax, ymax, from the bbox covering
+    # column of a GeoParquet file or from the feature extents through arcpy.
+    if path.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+        from PEI_IO import BBOX_COLUMN, BBOX_FIELDS
+        boxes = pq.read_table(path, columns=[BBOX_COLUMN]).column(BBOX_COLUMN).combine_chunks()
+        return np.column_stack([np.asarray(boxes.field(field), dtype=float) for field in BBOX_FIELDS])
+    import arcpy
+    with arcpy.da.SearchCursor(path, ["SHAPE@"]) as cursor:
+        return np.array([(row[0].extent.XMin, row[0].extent.YMin, row[0].extent.XMax, row[0].extent.YMax)
+                         if row[0] is not None else (np.nan,) * 4 for row in cursor], dtype=float).reshape(-1, 4)
+
+
+def str_order(boxes, node_size=NODE_SIZE):
+    # Sort-Tile-Recursive order: boxes are sorted by center x into vertical slices of whole nodes, then by center y
+    # within every slice, so consecutive runs of node_size boxes are compact tiles.
+    n = len(boxes)
+    center_x = (boxes[:, 0] + boxes[:, 2]) / 2
+    center_y = (boxes[:, 1] + boxes[:, 3]) / 2
+    slice_size = node_size * max(int(math.ceil(math.sqrt(math.ceil(n / node_size)))), 1)
+    by_x = np.argsort(center_x, kind="stable")
+    slice_number = np.empty(n, dtype=np.int64)
+    slice_number[by_x] = np.arange(n) // slice_size
+    return np.lexsort((center_y, slice_number))
+
+
+def group_bounds(boxes, node_size):
+    # Bounding boxes of consecutive groups of node_size boxes, one level up the tree.
+    starts = np.arange(0, len(boxes), node_size)
+    return np.column_stack([np.minimum.reduceat(boxes[:, 0], starts), np.minimum.reduceat(boxes[:, 1], starts),
+                            np.maximum.reduceat(boxes[:, 2], starts), np.maximum.reduceat(boxes[:, 3], starts)])
+
+
+class STRTree:
+
+    def __init__(self, items, order, nodes, level_offsets, node_size=NODE_SIZE):
+        # items are the feature boxes in packed order and order their feature indices. nodes holds the boxes of every
+        # level above the items, from the lowest level up, with level_offsets marking where each level starts.
+        self.items = items
+        self.order = order
+        self.nodes = nodes
+        self.level_offsets = list(level_offsets)
+        self.node_size = node_size
+
+    def __len__(self):
+        return len(self.items)
+
+    @classmethod
+    def build(cls, boxes, node_size=NODE_SIZE):
+        # Step 3: Pack the feature bounding boxes into an STR tree. Empty geometries (NaN boxes) are left out.
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        valid = np.flatnonzero(~np.isnan(boxes).any(axis=1))
+        order = valid[str_order(boxes[valid], node_size)]
+        items = boxes[order]
+        levels = []
+        level = items
+        while len(level) > 1:
+            level = group_bounds(level, node_size)
+            levels.append(level)
+        offsets = np.cumsum([0] + [len(level) for level in levels]).tolist()
+        nodes = np.concatenate(levels) if levels else np.zeros((0, 4))
+        return cls(items, order, nodes, offsets, node_size)
+
+    def level(self, number):
+        return self.nodes[self.level_offsets[number]:self.level_offsets[number + 1]]
+
+    def positions(self, bbox):
+        # Positions in packed order of the features whose bounding boxes intersect bbox, walking the levels from the
+        # root down.
+        xmin, ymin, xmax, ymax = bbox
+        levels = [self.level(number) for number in reversed(range(len(self.level_offsets) - 1))] + [self.items]
+        candidates = np.arange(len(levels[0]))
+        for depth, boxes in enumerate(levels):
+            selected = boxes[candidates]
+            candidates = candidates[(selected[:, 0] <= xmax) & (selected[:, 2] >= xmin) &
+                                    (selected[:, 1] <= ymax) & (selected[:, 3] >= ymin)]
+            if depth + 1 < len(levels):
+                children = (candidates[:, None] * self.node_size + np.arange(self.node_size)).ravel()
+                candidates = children[children < len(levels[depth + 1])]
+        return candidates
+
+    def query(self, bbox):
+        # Step 4: Indices of the features whose bounding boxes intersect bbox.
+        return np.sort(np.asarray(self.order)[self.positions(bbox)])
+
+    def query_point(self, x, y):
+        # Step 4: Indices of the features whose bounding boxes contain the point.
+        return self.query((x, y, x, y))
+
+    def query_points(self, x, y, tile_size=POINT_TILE):
+        # Step 4: (point index, feature index) pairs of every point and the features whose bounding boxes contain it.
+        # The points are packed into compact tiles in STR order, the tree is walked once per tile and the points of a
+        # tile are tested together against the few features its bounding box meets.
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        valid = np.flatnonzero(~np.isnan(x) & ~np.isnan(y))
+        order = valid[str_order(np.column_stack([x[valid], y[valid], x[valid], y[valid]]), tile_size)]
+        pairs = []
+        for start in range(0, len(order), tile_size):
+            tile = order[start:start + tile_size]
+            positions = self.positions((x[tile].min(), y[tile].min(), x[tile].max(), y[tile].max()))
+            if len(positions) > DENSE_LIMIT:
+                # Sparse points over many features: every point walks the tree on its own, level by level.
+                pairs.append(self.walk_points(tile, x, y))
+                continue
+            boxes = self.items[positions]
+            px, py = x[tile][:, None], y[tile][:, None]
+            hit = ((boxes[:, 0] <= px) & (boxes[:, 2] >= px) & (boxes[:, 1] <= py) & (boxes[:, 3] >= py))
+            point, position = np.nonzero(hit)
+            pairs.append((tile[point], np.asarray(self.order)[positions[position]]))
+        if not pairs:
+            return np.arange(0), np.arange(0)
+        return np.concatenate([p[0] for p in pairs]), np.concatenate([p[1] for p in pairs])
+
+    def walk_points(self, points, x, y):
+        # (point, feature index) pairs of the given points, walking the levels for all of them at once.
+        levels = [self.level(number) for number in reversed(range(len(self.level_offsets) - 1))] + [self.items]
+        nodes = np.tile(np.arange(len(levels[0])), len(points))
+        points = np.repeat(points, len(levels[0]))
+        for depth, boxes in enumerate(levels):
+            selected = boxes[nodes]
+            px, py = x[points], y[points]
+            keep = (selected[:, 0] <= px) & (selected[:, 2] >= px) & (selected[:, 1] <= py) & (selected[:, 3] >= py)
+            points, nodes = points[keep], nodes[keep]
+            if depth + 1 < len(levels):
+                children = (nodes[:, None] * self.node_size + np.arange(self.node_size)).ravel()
+                points = np.repeat(points, self.node_size)
+                valid = children < len(levels[depth + 1])
+                points, nodes = points[valid], children[valid]
+        return points, np.asarray(self.order)[nodes]
+
+    def feature_boxes(self, n_features):
+        # Bounding box of every feature in feature order, NaN for the empty geometries left out of the tree.
+        boxes = np.full((n_features, 4), np.nan)
+        boxes[np.asarray(self.order)] = self.items
+        return boxes
+
+    def query_boxes(self, boxes):
+        # Step 4: (box index, feature index) pairs of every query box and the features it intersects.
+        pairs = [(np.full(len(hits), i), hits) for i, hits in enumerate(self.query(box) for box in boxes)]
+        if not pairs:
+            return np.arange(0), np.arange(0)
+        return np.concatenate([p[0] for p in pairs]), np.concatenate([p[1] for p in pairs])
+
+    def save(self, directory, signature):
+        os.makedirs(directory, exist_ok=True)
+        for name in ("items", "order", "nodes"):
+            np.save(os.path.join(directory, f"{name}.npy"), np.asarray(getattr(self, name)))
+        manifest = {"signature": signature, "node_size": self.node_size, "level_offsets": self.level_offsets}
+        temporary = os.path.join(directory, f"{MANIFEST}.tmp")
+        with open(temporary, "w") as f:
+            json.dump(manifest, f)
+        os.replace(temporary, os.path.join(directory, MANIFEST))
+
+    @classmethod
+    def load(cls, directory, signature=None):
+        # Step 2: Load a sidecar memory-mapped, or return None if it is missing or was built for other content.
+        manifest_path = os.path.join(directory, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if signature is not None and manifest["signature"] != signature:
+            return None
+        arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in ("items", "order", "nodes")]
+        return cls(*arrays, manifest["level_offsets"], manifest["node_size"])
+
+
+def layer_index(path, node_size=NODE_SIZE, log=print, signature=None):
+    # Steps 1-3: The spatial index of an input layer, loaded from its sidecar when the content is unchanged and built
+    # and saved otherwise. A signature already calculated for the layer saves hashing it again.
+    signature = signature or content_hash(path)
+    directory = sidecar_path(path)
+    tree = STRTree.load(directory, signature)
+    if tree is not None:
+        return tree
+    log(f"Building spatial index for {path}.")
+    tree = STRTree.build(layer_boxes(path), node_size)
+    tree.save(directory, signature)
+    return tree
@@ -0,0 +1,128 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Lookup
+# Purpose: The purpose of this script is to assign millions of points (lot centroids, street intersections, demand
+# points) to census tracts without a spatial join. The census tracts are rasterized once into a fine label grid whose
+# cells hold the census tract that covers the whole cell, -1 for cells outside every census tract, or a boundary flag
+# for cells crossed by a census tract edge. A point is assigned by indexing the grid with its coordinates, and only
+# the few points falling in boundary cells are tested exactly against the prepared polygons of PEI_Geometry.
+#
+# Steps
+# Step 1: Lay a grid of square cells over the census tracts.
+# Step 2: Label every cell by the census tract containing its center.
+# Step 3: Flag the cells crossed by a census tract edge, and their neighbours, as boundary cells.
+# Step 4: Assign points by grid lookup, testing only points in boundary cells against the polygons.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import math
+import os
+import numpy as np
+from scipy import ndimage
+from PEI_Geometry import tract_geometry
+from PEI_Index import sidecar_path
+
+CACHE_SUFFIX = ".labels.npz"
+OUTSIDE = -1
+BOUNDARY = -2
+# Default number of grid cells, which keeps the label grid at 4 MB.
+MAX_CELLS = 1 << 20
+
+
+class LabelGrid:
+
+    def __init__(self, geometry, cell_size=None, max_cells=MAX_CELLS, labels=None):
+        # Step 1: Lay a grid of square cells over the census tracts of a PEI_Geometry TractGeometry. Without a cell
+        # size the cells are as small as max_cells allows.
+        self.geometry = geometry
+        valid = geometry.area > 0
+        bounds = geometry.bounds[valid]
+        self.x0, self.y0 = bounds[:, 0].min(), bounds[:, 1].min()
+        width, height = bounds[:, 2].max() - self.x0, bounds[:, 3].max() - self.y0
+        self.cell_size = cell_size or max(math.sqrt(width * height / max_cells), np.finfo(float).eps)
+        self.ncols = max(int(math.ceil(width / self.cell_size)), 1)
+        self.nrows = max(int(math.ceil(height / self.cell_size)), 1)
+        self.labels = self._rasterize() if labels is None else labels
+
+    def _rasterize(self):
+        # Step 2: Label every cell by the census tract containing its center.
+        rows, cols = np.indices((self.nrows, self.ncols))
+        labels = self.geometry.locate(self.x0 + (cols.ravel() + 0.5) * self.cell_size,
+                                      self.y0 + (rows.ravel() + 0.5) * self.cell_size)
+        labels = labels.reshape(self.nrows, self.ncols).astype(np.int32)
+
+        # Step 3: Sample every edge at half the cell size to find the cells it crosses. An edge can clip the corner
+        # of a cell between two samples, but that cell always neighbours a sampled one, so the neighbours are
+        # flagged as well.
+        crossed = np.zeros(labels.shape, dtype=bool)
+        vertices = self.geometry.vertices
+        for r in range(len(self.geometry.ring_tract)):
+            start, end = self.geometry.ring_offsets[r], self.geometry.ring_offsets[r + 1]
+            x0, y0 = vertices[start:end - 1, 0], vertices[start:end - 1, 1]
+            x1, y1 = vertices[start + 1:end, 0], vertices[start + 1:end, 1]
+            steps = np.ceil(np.hypot(x1 - x0, y1 - y0) / (self.cell_size / 2)).astype(np.int64) + 1
+            edge = np.repeat(np.arange(len(steps)), steps)
+            t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps - 1, steps)
+            t = np.nan_to_num(t)
+            row, col = self.cells(x0[edge] + t * (x1 - x0)[edge], y0[edge] + t * (y1 - y0)[edge])
+            inside = row >= 0
+            crossed[row[inside], col[inside]] = True
+        crossed = ndimage.binary_dilation(crossed, structure=np.ones((3, 3), dtype=bool))
+        labels[crossed] = BOUNDARY
+        return labels
+
+    def cells(self, x, y):
+        # Grid row and column of every point, -1 outside the grid.
+        col = np.floor((np.asarray(x, dtype=float) - self.x0) / self.cell_size).astype(np.int64)
+        row = np.floor((np.asarray(y, dtype=float) - self.y0) / self.cell_size).astype(np.int64)
+        inside = (row >= 0) & (row < self.nrows) & (col >= 0) & (col < self.ncols)
+        return np.where(inside, row, -1), np.where(inside, col, -1)
+
+    def locate(self, x, y):
+        # Step 4: Census tract index of every point, or -1 outside every census tract. Points in boundary cells are
+        # tested exactly against the prepared census tract polygons.
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        row, col = self.cells(x, y)
+        result = np.where(row >= 0, self.labels[np.maximum(row, 0), np.maximum(col, 0)], OUTSIDE).astype(np.int64)
+        boundary = np.flatnonzero(result == BOUNDARY)
+        if len(boundary):
+            result[boundary] = self.geometry.locate(x[boundary], y[boundary])
+        return result
+
+    @property
+    def boundary_fraction(self):
+        return float(np.mean(self.labels == BOUNDARY))
+
+    def save(self, path, signature):
+        with open(path, "wb") as f:
+            np.savez(f, signature=np.array(signature), labels=self.labels, cell_size=self.cell_size)
+
+    @classmethod
+    def load(cls, geometry, path, signature=None):
+        # Loads a label grid saved for the same census tracts, or returns None if it is missing or was built for other
+        # content.
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if signature is not None and str(data["signature"]) != signature:
+                return None
+            grid = cls(geometry, float(data["cell_size"]), labels=data["labels"])
+        return grid if grid.labels.shape == (grid.nrows, grid.ncols) else None
+
+
+def label_grid(path, id_field="ct_id", cell_size=None, log=print):
+    # The label grid of a census tracts layer, cached next to it like its geometry and rebuilt when the layer changes.
+    geometry = tract_geometry(path, id_field, log)
+    cache = sidecar_path(path, CACHE_SUFFIX)
+    grid = LabelGrid.load(geometry, cache, geometry.signature)
+    if grid is not None and (cell_size is None or grid.cell_size == cell_size):
+        return grid
+    log(f"Rasterizing census tract labels for {path}.")
+    grid = LabelGrid(geometry, cell_size)
+    grid.save(cache, geometry.signature)
+    return grid
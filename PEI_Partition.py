@@ -0,0 +1,239 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Partition
+# Purpose: The purpose of this script is to calculate the Pedestrian Environment Index sub metrics for a whole region
+# by splitting the census tracts into partitions, such as counties or boroughs, and processing every partition on a
+# separate worker process. Every sub metric is normalized by a max value over the whole study area, so the workers
+# only calculate the unnormalized values and a reduce step combines the per partition maxima and land use classes
+# before normalizing all partitions consistently. The catchment based transportation access and the raster based
+# access to parks look across partition boundaries through halos. The transportation halo covers the whole catchment
+# radius, so partition edges do not change that sub metric. The parks halo is a fixed window, so the access to parks
+# is only exact for cost paths within the halo distance: parks just outside it, and paths that leave it, are missed.
+#
+# Steps
+# Step 1: Split the census tracts into partitions by a key such as the county part of the GEOID.
+# Step 2: Build one task per partition with its census tracts, assigned features and the halo around it.
+# Step 3: Calculate the unnormalized sub metrics of every partition on separate workers.
+# Step 4: Reduce the per partition maxima and land use classes to study area values.
+# Step 5: Normalize every partition with the study area values and combine them in census tract order.
+#
+# The inputs are a dictionary of NumPy column dictionaries:
+# tracts: ct_id, area, population, x, y (centroids)
+# lots: tract_index, land_use, land_use_area, commercial_area
+# nodes: tract_index, degree (street intersections and the number of roads meeting there)
+# sidewalks, roads: tract_index, area (pieces apportioned to census tracts)
+# stops: x, y (transportation points)
+# raster (optional): sidewalk (boolean grid), labels (census tract index grid, -1 outside), park_rows, park_cols,
+# cell_size
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import math
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import PEI_Engines as engines
+
+# Default halo around every partition for the access to parks raster, in feet. Cost paths longer than the halo are cut
+# off, so it should exceed the longest cost distance to a park that matters.
+PARKS_HALO = 5000
+RAW_METRICS = ["sum_sha_num", "bn_pop_density", "bn_com_sum", "bn_intersection", "bn_sidewalk_density",
+               "sum_ratio", "parks_median", "bn_network_density"]
+
+
+def county_keys(geoids, length=5):
+    # Step 1: Partition key from the state and county part of the census tract GEOID.
+    return np.array([str(geoid)[:length] for geoid in geoids])
+
+
+def split_partitions(keys):
+    # Step 1: Census tract indices of every partition, in sorted key order.
+    keys = np.asarray(keys)
+    return {key: np.flatnonzero(keys == key) for key in np.unique(keys).tolist()}
+
+
+def select_rows(columns, mask):
+    return {name: np.asarray(values)[mask] for name, values in columns.items()}
+
+
+def assigned_features(columns, local_index):
+    # Features of the partition, with their census tract index remapped from the study area to the partition.
+    tract_index = np.asarray(columns["tract_index"])
+    mapped = np.where(tract_index >= 0, local_index[np.maximum(tract_index, 0)], -1)
+    keep = mapped >= 0
+    features = select_rows(columns, keep)
+    features["tract_index"] = mapped[keep]
+    return features
+
+
+def within_bbox(x, y, bbox):
+    return (x >= bbox[0]) & (x <= bbox[2]) & (y >= bbox[1]) & (y <= bbox[3])
+
+
+def expand(bbox, distance):
+    return (bbox[0] - distance, bbox[1] - distance, bbox[2] + distance, bbox[3] + distance)
+
+
+def partition_task(inputs, tracts_in_partition, radius=engines.TRANSPORTATION_RADIUS, parks_halo=PARKS_HALO):
+    # Step 2: Build one task per partition with its census tracts, assigned features and the halo around it.
+    tracts = inputs["tracts"]
+    n_tracts = len(tracts["ct_id"])
+    local_index = np.full(n_tracts, -1)
+    local_index[tracts_in_partition] = np.arange(len(tracts_in_partition))
+    task = {"tracts": select_rows(tracts, tracts_in_partition), "positions": tracts_in_partition}
+    for layer in ("lots", "nodes", "sidewalks", "roads"):
+        task[layer] = assigned_features(inputs[layer], local_index)
+
+    # Transportation halo: the stops within the radius of the partition and every census tract within the radius of
+    # those stops, so the population served by each stop is complete.
+    x, y = np.asarray(tracts["x"]), np.asarray(tracts["y"])
+    bbox = (x[tracts_in_partition].min(), y[tracts_in_partition].min(),
+            x[tracts_in_partition].max(), y[tracts_in_partition].max())
+    stops = inputs["stops"]
+    task["stops"] = select_rows(stops, within_bbox(np.asarray(stops["x"]), np.asarray(stops["y"]),
+                                                   expand(bbox, radius)))
+    halo = np.flatnonzero(within_bbox(x, y, expand(bbox, 2 * radius)))
+    task["halo"] = {"x": x[halo], "y": y[halo], "population": np.asarray(tracts["population"])[halo],
+                    "local_index": local_index[halo]}
+    task["radius"] = radius
+
+    # Parks halo: a raster window around the partition cells, where the cells of other census tracts can be crossed
+    # but are left out of the zonal median.
+    raster = inputs.get("raster")
+    if raster is not None:
+        labels = np.asarray(raster["labels"])
+        rows, cols = np.nonzero(np.isin(labels, tracts_in_partition))
+        halo_cells = int(math.ceil(parks_halo / raster["cell_size"]))
+        r0, r1 = max(rows.min() - halo_cells, 0), min(rows.max() + halo_cells + 1, labels.shape[0])
+        c0, c1 = max(cols.min() - halo_cells, 0), min(cols.max() + halo_cells + 1, labels.shape[1])
+        window = labels[r0:r1, c0:c1]
+        park_rows, park_cols = np.asarray(raster["park_rows"]), np.asarray(raster["park_cols"])
+        parks = (park_rows >= r0) & (park_rows < r1) & (park_cols >= c0) & (park_cols < c1)
+        task["raster"] = {"sidewalk": np.asarray(raster["sidewalk"])[r0:r1, c0:c1],
+                          "labels": np.where(window >= 0, local_index[np.maximum(window, 0)], -1),
+                          "study_area": window >= 0,
+                          "park_rows": park_rows[parks] - r0, "park_cols": park_cols[parks] - c0,
+                          "cell_size": raster["cell_size"]}
+    return task
+
+
+def land_use_metrics(task, n, area):
+    lots = task["lots"]
+    sum_sha_num, land_uses = engines.land_use_mix(lots["tract_index"], lots["land_use"], lots["land_use_area"], n)
+    return {"sum_sha_num": sum_sha_num, "land_uses": land_uses}
+
+
+def population_metrics(task, n, area):
+    return {"bn_pop_density": engines.population_density(task["tracts"]["population"], area)[0]}
+
+
+def commercial_metrics(task, n, area):
+    lots = task["lots"]
+    return {"bn_com_sum": engines.commercial_density(lots["tract_index"], lots["land_use_area"],
+                                                     lots["commercial_area"], n)}
+
+
+def intersection_metrics(task, n, area):
+    nodes = task["nodes"]
+    return {"bn_intersection": engines.intersection_density(nodes["tract_index"], nodes["degree"], area, n)}
+
+
+def sidewalk_metrics(task, n, area):
+    sidewalks = task["sidewalks"]
+    return {"bn_sidewalk_density": engines.areal_density(sidewalks["tract_index"], sidewalks["area"], area, n)}
+
+
+def transportation_metrics(task, n, area):
+    # Only the census tracts of the partition keep their sum of ratios, the halo tracts only add demand to the stops.
+    halo = task["halo"]
+    catchment = engines.catchment_matrix(halo["x"], halo["y"], task["stops"]["x"], task["stops"]["y"], task["radius"])
+    sum_ratio = engines.transportation_access(catchment, halo["population"])[0]
+    core = halo["local_index"] >= 0
+    result = np.zeros(n)
+    result[halo["local_index"][core]] = sum_ratio[core]
+    return {"sum_ratio": result}
+
+
+def parks_metrics(task, n, area):
+    raster = task.get("raster")
+    if raster is None:
+        return {"parks_median": np.full(n, np.nan)}
+    return {"parks_median": engines.parks_cost_median(raster["sidewalk"], raster["labels"], raster["park_rows"],
+                                                      raster["park_cols"], raster["cell_size"], n,
+                                                      raster["study_area"])}
+
+
+def network_metrics(task, n, area):
+    roads = task["roads"]
+    return {"bn_network_density": engines.areal_density(roads["tract_index"], roads["area"], area, n)}
+
+
+# Unnormalized sub metric calculations of a partition, by sub metric.
+SUB_METRICS = {"land_use_mix": land_use_metrics,
+               "population_density": population_metrics,
+               "commercial_density": commercial_metrics,
+               "intersection_density": intersection_metrics,
+               "sidewalk_density": sidewalk_metrics,
+               "transportation_access": transportation_metrics,
+               "parks_access": parks_metrics,
+               "street_network_density": network_metrics}
+
+
+def partition_metrics(task, sub_metrics=None):
+    # Step 3: Calculate the unnormalized sub metrics of one partition, all of them by default. This runs on a worker.
+    n = len(task["tracts"]["ct_id"])
+    area = np.asarray(task["tracts"]["area"], dtype=float)
+    result = {"positions": task["positions"]}
+    for name in sub_metrics or SUB_METRICS:
+        result.update(SUB_METRICS[name](task, n, area))
+    return result
+
+
+# Normalized sub metric, the unnormalized value it is calculated from and its normalization with the study area max.
+NORMALIZATIONS = {"land_use_diversity": ("sum_sha_num", lambda raw, max_value, land_uses:
+                                         engines.normalize_land_use_mix(raw, len(land_uses), max_value)),
+                  "pop_density": ("bn_pop_density", lambda raw, max_value, land_uses:
+                                  engines.normalize(raw, max_value)),
+                  "commercial_density": ("bn_com_sum", lambda raw, max_value, land_uses:
+                                         engines.normalize_commercial_density(raw, max_value)),
+                  "intersection_density": ("bn_intersection", lambda raw, max_value, land_uses:
+                                           engines.normalize(raw, max_value)),
+                  "sidewalk_density": ("bn_sidewalk_density", lambda raw, max_value, land_uses:
+                                       engines.normalize(raw, max_value)),
+                  "transportation_access": ("sum_ratio", lambda raw, max_value, land_uses:
+                                            engines.normalize(raw, max_value)),
+                  "parks_access": ("parks_median", lambda raw, max_value, land_uses:
+                                   engines.normalize_parks_access(raw, max_value)),
+                  "sn_density": ("bn_network_density", lambda raw, max_value, land_uses:
+                                 engines.normalize(raw, max_value))}
+
+
+def reduce_metrics(results, n_tracts):
+    # Steps 4 and 5: Reduce the per partition maxima and land use classes to study area values, then normalize every
+    # partition with them and combine the partitions in census tract order. Only the sub metrics calculated by the
+    # partitions are returned.
+    present = [name for name in RAW_METRICS if all(name in r for r in results)]
+    max_values = {name: max((np.nanmax(r[name], initial=0) for r in results), default=0) for name in present}
+    land_uses = np.unique(np.concatenate([r.get("land_uses", []) for r in results]))
+    raw = {name: np.zeros(n_tracts) for name in present}
+    for r in results:
+        for name in present:
+            raw[name][r["positions"]] = r[name]
+    return {metric: normalization(raw[name], max_values[name], land_uses)
+            for metric, (name, normalization) in NORMALIZATIONS.items() if name in present}
+
+
+def run_partitioned(inputs, keys, workers=None, radius=engines.TRANSPORTATION_RADIUS, parks_halo=PARKS_HALO):
+    # Steps 1-5. Returns the normalized sub metrics in the census tract order of the inputs. With workers set to 1
+    # the partitions are processed in this process, which is also what each remote worker does.
+    partitions = split_partitions(keys)
+    tasks = [partition_task(inputs, tracts, radius, parks_halo) for tracts in partitions.values()]
+    if workers == 1:
+        results = [partition_metrics(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(partition_metrics, tasks))
+    return reduce_metrics(results, len(inputs["tracts"]["ct_id"]))
@@ -0,0 +1,230 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Raster
+# Purpose: The purpose of this script is to keep the rasters of the access to parks chain compact. The chain of
+# Parks_Access_Index.py stores a euclidean distance raster, a five class cost surface and a cost distance raster, all
+# at full precision. Here the cost surface, which only holds the classes 1 to 5, is uint8, the distances are float32
+# and the rasters are written as chunked, compressed tiles, so a 10 ft grid over a borough takes a fraction of the
+# memory and disk I/O of float64 rasters. Tiles equal to the fill value are not written at all and any window can be
+# read back without reading the whole raster. The precision lost against a float64 run is reported for every surface,
+# for the median by census tract and for the normalized sub metric.
+#
+# Steps
+# Step 1: Write and read rasters as chunked, compressed tiles.
+# Step 2: Calculate the uint8 cost surface and the float32 cost distance and write them as tiles.
+# Step 3: Calculate the same surfaces in float64 and measure the precision lost and the memory saved.
+# Step 4: Report the precision loss and the sizes of every surface.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+import numpy as np
+import PEI_Engines as engines
+
+DEFAULT_TILE_SIZE = 512
+METADATA = "tiles.json"
+
+
+class TileStore:
+
+    def __init__(self, directory, shape, dtype, tile_size=DEFAULT_TILE_SIZE, fill=0):
+        # Step 1: A raster of the given shape and dtype stored as one compressed .npz file per tile in directory.
+        self.directory = directory
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.tile_size = int(tile_size)
+        self.fill = fill
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, METADATA), "w") as f:
+            json.dump({"shape": self.shape, "dtype": self.dtype.str, "tile_size": self.tile_size,
+                       "fill": float(fill)}, f)
+
+    @classmethod
+    def open(cls, directory):
+        with open(os.path.join(directory, METADATA)) as f:
+            metadata = json.load(f)
+        store = cls.__new__(cls)
+        store.directory = directory
+        store.shape = tuple(metadata["shape"])
+        store.dtype = np.dtype(metadata["dtype"])
+        store.tile_size = metadata["tile_size"]
+        store.fill = store.dtype.type(metadata["fill"])
+        return store
+
+    def tile_path(self, i, j):
+        return os.path.join(self.directory, f"tile_{i}_{j}.npz")
+
+    def tiles(self):
+        # Tile row, tile column and the raster window of every tile.
+        for i, r0 in enumerate(range(0, self.shape[0], self.tile_size)):
+            for j, c0 in enumerate(range(0, self.shape[1], self.tile_size)):
+                yield i, j, (slice(r0, min(r0 + self.tile_size, self.shape[0])),
+                             slice(c0, min(c0 + self.tile_size, self.shape[1])))
+
+    def write(self, array):
+        # Step 1: Write every tile of the array that is not entirely the fill value.
+        array = np.asarray(array)
+        if array.shape != self.shape:
+            raise ValueError(f"Expected a raster of shape {self.shape}, got {array.shape}.")
+        for i, j, window in self.tiles():
+            tile = array[window].astype(self.dtype, copy=False)
+            path = self.tile_path(i, j)
+            if np.array_equal(tile, np.full(tile.shape, self.fill, dtype=self.dtype), equal_nan=True):
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            with open(path, "wb") as f:
+                np.savez_compressed(f, tile=tile)
+
+    def read_tile(self, i, j, window):
+        path = self.tile_path(i, j)
+        if not os.path.exists(path):
+            return np.full((window[0].stop - window[0].start, window[1].stop - window[1].start), self.fill,
+                           dtype=self.dtype)
+        with np.load(path) as data:
+            return data["tile"]
+
+    def read(self, rows=None, cols=None):
+        # Step 1: Read a window of the raster, rows and cols being slices, reading only the tiles it overlaps.
+        rows = slice(*(rows or slice(None)).indices(self.shape[0])[:2])
+        cols = slice(*(cols or slice(None)).indices(self.shape[1])[:2])
+        result = np.full((rows.stop - rows.start, cols.stop - cols.start), self.fill, dtype=self.dtype)
+        for i, j, (tile_rows, tile_cols) in self.tiles():
+            r0, r1 = max(rows.start, tile_rows.start), min(rows.stop, tile_rows.stop)
+            c0, c1 = max(cols.start, tile_cols.start), min(cols.stop, tile_cols.stop)
+            if r0 < r1 and c0 < c1:
+                tile = self.read_tile(i, j, (tile_rows, tile_cols))
+                result[r0 - rows.start:r1 - rows.start, c0 - cols.start:c1 - cols.start] = \
+                    tile[r0 - tile_rows.start:r1 - tile_rows.start, c0 - tile_cols.start:c1 - tile_cols.start]
+        return result
+
+    def disk_size(self):
+        return sum(os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory))
+
+
+def parks_surfaces(sidewalk_mask, labels, park_rows, park_cols, cell_size, n_tracts, study_area=None, directory=None,
+                   tile_size=DEFAULT_TILE_SIZE):
+    # Step 2: uint8 cost surface, float32 cost distance and the median cost distance by census tract, as
+    # PEI_Engines.parks_cost_median. With a directory, both rasters are written there as tiles, like the
+    # distance_reclass and parks_raster rasters of the arcpy script.
+    if study_area is None:
+        study_area = np.asarray(labels) >= 0
+    cost = engines.cost_surface(sidewalk_mask, cell_size, study_area, tile_size=tile_size)
+    distance = engines.cost_distance(cost, park_rows, park_cols, cell_size)
+    if directory is not None:
+        TileStore(os.path.join(directory, "distance_reclass"), cost.shape, np.uint8, tile_size).write(cost)
+        TileStore(os.path.join(directory, "parks_raster"), distance.shape, np.float32, tile_size,
+                  np.inf).write(distance)
+    return cost, distance, engines.zonal_median(labels, distance, n_tracts)
+
+
+def traced(function, *args, **kwargs):
+    # Runs a function and returns its result, wall time in seconds and peak of the NumPy allocations in bytes.
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function(*args, **kwargs)
+        return result, time.perf_counter() - start, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def reference_surfaces(sidewalk_mask, labels, park_rows, park_cols, cell_size, n_tracts, study_area=None):
+    # Step 3: The full precision chain of the arcpy script: float64 euclidean distance, cost surface and cost distance.
+    if study_area is None:
+        study_area = np.asarray(labels) >= 0
+    distance = np.where(study_area, engines.euclidean_distance(sidewalk_mask, cell_size, np.float64), np.nan)
+    cost = engines.reclassify_distance(distance).astype(np.float64)
+    cost_distance = engines.cost_distance(cost, park_rows, park_cols, cell_size, np.float64)
+    return distance, cost, cost_distance, engines.zonal_median(labels, cost_distance, n_tracts)
+
+
+def differences(reference, compact):
+    # Largest absolute and relative difference of the cells finite in either raster, inf where only one is finite.
+    reference = np.asarray(reference, dtype=float).ravel()
+    compact = np.asarray(compact, dtype=float).ravel()
+    either = np.isfinite(reference) | np.isfinite(compact)
+    if (np.isfinite(reference) != np.isfinite(compact))[either].any():
+        return np.inf, np.inf
+    both = np.isfinite(reference) & np.isfinite(compact)
+    absolute = np.abs(reference[both] - compact[both])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = np.where(reference[both] != 0, absolute / np.abs(reference[both]), 0.0)
+    return float(absolute.max(initial=0)), float(relative.max(initial=0))
+
+
+def precision_report(sidewalk_mask, labels, park_rows, park_cols, cell_size, n_tracts, study_area=None,
+                     directory=None, tile_size=DEFAULT_TILE_SIZE):
+    # Step 3: Run the float64 and the compact chains, with their peak memory, and compare every surface.
+    arguments = (sidewalk_mask, labels, park_rows, park_cols, cell_size, n_tracts, study_area)
+    (distance64, cost64, cost_distance64, median64), reference_time, reference_peak = \
+        traced(reference_surfaces, *arguments)
+    (cost, cost_distance, median), compact_time, compact_peak = \
+        traced(parks_surfaces, *arguments, directory=directory, tile_size=tile_size)
+    if study_area is None:
+        study_area = np.asarray(labels) >= 0
+    distance = np.where(study_area, engines.euclidean_distance(sidewalk_mask, cell_size), np.float32(np.nan))
+    disk = {}
+    if directory is not None:
+        disk = {name: TileStore.open(os.path.join(directory, name)).disk_size()
+                for name in ("distance_reclass", "parks_raster")}
+    rows = []
+    for name, reference, compact, tiles in (("sidewalks_distance", distance64, distance, None),
+                                            ("distance_reclass", cost64, cost, "distance_reclass"),
+                                            ("parks_raster", cost_distance64, cost_distance, "parks_raster"),
+                                            ("median", median64, median, None),
+                                            ("park_access", engines.normalize_parks_access(median64),
+                                             engines.normalize_parks_access(median), None)):
+        absolute, relative = differences(reference, compact)
+        rows.append({"surface": name, "reference_dtype": str(reference.dtype), "compact_dtype": str(compact.dtype),
+                     "max_abs_error": absolute, "max_rel_error": relative, "reference_bytes": reference.nbytes,
+                     "compact_bytes": compact.nbytes, "disk_bytes": disk.get(tiles)})
+    return {"cells": int(np.asarray(labels).size), "cell_size": cell_size, "surfaces": rows,
+            "reclass_mismatches": int(np.count_nonzero(cost64 != cost)),
+            "reference_seconds": reference_time, "compact_seconds": compact_time,
+            "reference_peak_bytes": reference_peak, "compact_peak_bytes": compact_peak}
+
+
+def format_report(report):
+    # Step 4: Report the precision loss and the sizes of every surface as text.
+    mb = 1 / 2 ** 20
+    lines = [f"{report['cells']} cells of {report['cell_size']} ft, {report['reclass_mismatches']} reclass "
+             f"mismatches",
+             f"Peak memory {report['reference_peak_bytes'] * mb:.1f} MB float64, "
+             f"{report['compact_peak_bytes'] * mb:.1f} MB compact; "
+             f"{report['reference_seconds']:.2f} s and {report['compact_seconds']:.2f} s",
+             f"{'surface':<20}{'dtype':>18}{'max abs error':>15}{'max rel error':>15}{'MB':>16}{'disk MB':>9}"]
+    for row in report["surfaces"]:
+        disk = f"{row['disk_bytes'] * mb:.2f}" if row["disk_bytes"] is not None else "-"
+        lines.append(f"{row['surface']:<20}{row['reference_dtype'] + ' > ' + row['compact_dtype']:>18}"
+                     f"{row['max_abs_error']:>15.3e}{row['max_rel_error']:>15.3e}"
+                     f"{row['reference_bytes'] * mb:>8.2f} > {row['compact_bytes'] * mb:<5.2f}{disk:>9}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact access to parks rasters and their precision loss.")
+    parser.add_argument("--inputs", help="Directory with one .npz or .parquet file per layer, as for PEI_CLI.")
+    parser.add_argument("--synthetic", type=int, help="Use a synthetic city with this many lots instead.")
+    parser.add_argument("--tiles", help="Directory to write the cost surface and cost distance tiles to.")
+    parser.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE)
+    args = parser.parse_args()
+    from PEI_CLI import load_inputs
+    inputs = load_inputs(args)
+    raster = inputs["raster"]
+    report = precision_report(raster["sidewalk"], raster["labels"], raster["park_rows"], raster["park_cols"],
+                              raster["cell_size"], len(inputs["tracts"]["ct_id"]), raster.get("study_area"),
+                              args.tiles, args.tile_size)
+    print(format_report(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Reference
+# Purpose: The purpose of this script is to make sure any faster engine reproduces the published Pedestrian
+# Environment Index results before it replaces the arcpy scripts. Golden per census tract outputs of every sub metric
+# and of the PEI are stored once from a reference run, and any engine is replayed against them with a tolerance per
+# metric. The report lists, for every metric, the largest difference, the number of census tracts outside the
+# tolerance and the worst offending census tracts, so a backend can be switched with confidence.
+#
+# Steps
+# Step 1: Store the golden per census tract outputs of a reference run.
+# Step 2: Run an engine, or load its outputs, and align them with the golden outputs by ct_id.
+# Step 3: Compare every metric within its tolerance and find the worst offending census tracts.
+# Step 4: Report the comparison.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import argparse
+import numpy as np
+from PEI_Composite import PEI_METRICS, PEIComposite
+
+PEI = "PEI"
+GOLDEN_METRICS = PEI_METRICS + [PEI]
+# Field names of the capstone outputs, for golden files exported from the original feature classes.
+ALIASES = {"shannon": "land_use_diversity", "com_sum": "commercial_density", "intersection": "intersection_density",
+           "park_access": "parks_access", "network_density": "sn_density"}
+# Absolute tolerances. The vector engines reproduce the arcpy arithmetic, the raster based access to parks differs by
+# the cost distance implementation, and the PEI compounds the differences of all of its sub metrics.
+DEFAULT_TOLERANCES = {"land_use_diversity": 1e-6,
+                      "pop_density": 1e-6,
+                      "commercial_density": 1e-6,
+                      "intersection_density": 1e-6,
+                      "sidewalk_density": 1e-6,
+                      "transportation_access": 1e-6,
+                      "parks_access": 1e-2,
+                      "sn_density": 1e-6,
+                      PEI: 1e-3}
+
+
+def canonical(metrics):
+    return {ALIASES.get(name, name): values for name, values in metrics.items()}
+
+
+def with_pei(ct_ids, metrics):
+    # Adds the equal weight PEI, in the order of ct_ids, to metrics that do not have it yet.
+    metrics = canonical(metrics)
+    if PEI not in metrics:
+        ct_ids = np.asarray(ct_ids)
+        pei = PEIComposite(ct_ids, {name: metrics[name] for name in PEI_METRICS}).weighted_product()
+        metrics[PEI] = pei[np.argsort(np.argsort(ct_ids, kind="stable"), kind="stable")]
+    return metrics
+
+
+def save_golden(path, ct_ids, metrics):
+    # Step 1: Store the golden outputs of a reference run as a .npz file of ct_id and one array per metric.
+    metrics = with_pei(ct_ids, metrics)
+    with open(path, "wb") as f:
+        np.savez(f, ct_id=np.asarray(ct_ids), **{name: np.asarray(metrics[name], dtype=float)
+                                                 for name in GOLDEN_METRICS if name in metrics})
+
+
+def load_outputs(path):
+    # Loads golden or candidate outputs saved with save_golden, as ct_id and a {metric: values} dictionary.
+    with np.load(path) as data:
+        return data["ct_id"], canonical({name: data[name] for name in data.files if name != "ct_id"})
+
+
+def golden_from_table(table, id_field, output_field):
+    # Step 1: Golden outputs from the census tract layer written by Final_PEI, where output_field holds the PEI. The
+    # population density stage writes pop_density to the layer and the other sub metrics are joined to it.
+    import arcpy
+    fields = list(PEI_METRICS)
+    array = arcpy.da.TableToNumPyArray(table, [id_field] + fields + [output_field], null_value=0)
+    metrics = {name: array[name] for name in fields}
+    metrics[PEI] = array[output_field]
+    return array[id_field], metrics
+
+
+def engine_outputs(engine, inputs):
+    # Step 2: Run an engine returning {metric: values} in the census tract order of the inputs and add the PEI.
+    ct_ids = np.asarray(inputs["tracts"]["ct_id"])
+    return ct_ids, with_pei(ct_ids, engine(inputs))
+
+
+def align(ct_ids, metrics, reference_ids):
+    # Step 2: Values of every metric in the order of reference_ids, NaN where a census tract is missing.
+    ct_ids = np.asarray(ct_ids)
+    order = np.argsort(ct_ids, kind="stable")
+    position = np.searchsorted(ct_ids[order], reference_ids)
+    position = np.minimum(position, max(len(ct_ids) - 1, 0))
+    found = (ct_ids[order][position] == reference_ids) if len(ct_ids) else np.zeros(len(reference_ids), dtype=bool)
+    return {name: np.where(found, np.asarray(values, dtype=float)[order][position], np.nan)
+            for name, values in metrics.items()}, found
+
+
+def compare(golden_ids, golden, candidate_ids, candidate, tolerances=None, worst=10):
+    # Step 3: Compare every golden metric within its tolerance. Missing census tracts and missing metrics fail.
+    tolerances = dict(DEFAULT_TOLERANCES, **(tolerances or {}))
+    golden_ids = np.asarray(golden_ids)
+    aligned, found = align(candidate_ids, candidate, golden_ids)
+    result = {"n_tracts": len(golden_ids), "missing_tracts": golden_ids[~found].tolist(), "metrics": {}}
+    for name, expected in golden.items():
+        expected = np.asarray(expected, dtype=float)
+        actual = aligned.get(name, np.full(len(golden_ids), np.nan))
+        difference = np.abs(actual - expected)
+        difference[np.isnan(actual) != np.isnan(expected)] = np.inf
+        difference[np.isnan(actual) & np.isnan(expected)] = 0
+        tolerance = tolerances.get(name, 1e-6)
+        failing = difference > tolerance
+        ranked = np.argsort(-difference, kind="stable")[:worst]
+        result["metrics"][name] = {
+            "tolerance": tolerance,
+            "max_difference": float(difference.max(initial=0)),
+            "mean_difference": float(np.mean(difference[np.isfinite(difference)])) if np.isfinite(difference).any()
+            else 0.0,
+            "failing": int(failing.sum()),
+            "worst": [{"ct_id": golden_ids[i].item(), "golden": float(expected[i]), "candidate": float(actual[i]),
+                       "difference": float(difference[i])} for i in ranked.tolist() if difference[i] > 0]}
+    result["passed"] = not result["missing_tracts"] and all(m["failing"] == 0 for m in result["metrics"].values())
+    return result
+
+
+def replay(engine, inputs, golden_path, tolerances=None, worst=10):
+    # Steps 2 and 3: Replay an engine against the golden outputs stored at golden_path.
+    golden_ids, golden = load_outputs(golden_path)
+    candidate_ids, candidate = engine_outputs(engine, inputs)
+    return compare(golden_ids, golden, candidate_ids, candidate, tolerances, worst)
+
+
+def format_report(result):
+    # Step 4: Report the comparison as text.
+    lines = [f"{'PASSED' if result['passed'] else 'FAILED'}: {result['n_tracts']} census tracts, "
+             f"{len(result['missing_tracts'])} missing",
+             f"{'metric':<24}{'tolerance':>12}{'max diff':>14}{'mean diff':>14}{'failing':>9}"]
+    for name, metric in result["metrics"].items():
+        lines.append(f"{name:<24}{metric['tolerance']:>12.1e}{metric['max_difference']:>14.3e}"
+                     f"{metric['mean_difference']:>14.3e}{metric['failing']:>9}")
+    for name, metric in result["metrics"].items():
+        if metric["failing"]:
+            lines.append(f"Worst census tracts for {name}:")
+            for row in metric["worst"]:
+                lines.append(f"  {row['ct_id']}: golden {row['golden']:.6f}, candidate {row['candidate']:.6f}, "
+                             f"difference {row['difference']:.3e}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Pedestrian Environment Index outputs with golden outputs.")
+    parser.add_argument("golden", help="Golden .npz file written by save_golden.")
+    parser.add_argument("candidate", help="Candidate .npz file written by save_golden.")
+    parser.add_argument("--tolerance", action="append", default=[], metavar="METRIC=VALUE",
+                        help="Override the tolerance of a metric, may be repeated.")
+    parser.add_argument("--worst", type=int, default=10)
+    args = parser.parse_args()
+    tolerances = {ALIASES.get(name, name): float(value)
+                  for name, value in (item.split("=", 1) for item in args.tolerance)}
+    result = compare(*load_outputs(args.golden), *load_outputs(args.candidate), tolerances, args.worst)
+    print(format_report(result))
+    raise SystemExit(0 if result["passed"] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Scratch
+# Purpose: The purpose of this script is to hold the intermediate results of a Pedestrian Environment Index run in a
+# run specific temporary directory instead of named scratch feature classes in the user's geodatabase. NumPy arrays
+# are kept in memory until a configurable RAM budget is exceeded, after which the least recently stored arrays are
+# spilled to .npy files and memory-mapped back, so stages hand each other read only views without copies. arcpy
+# intermediates go to a scratch file geodatabase inside the same directory. Everything is removed when the run ends,
+# including when it crashes midway.
+#
+# Steps
+# Step 1: Create the run specific temporary directory and register its automatic clean up.
+# Step 2: Store arrays in memory and spill the oldest ones to memory-mapped files when over the RAM budget.
+# Step 3: Hand out read only views of stored arrays and tables.
+# Step 4: Provide scratch paths for arcpy intermediates in a run specific file geodatabase.
+# Step 5: Remove the temporary directory.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict
+import numpy as np
+
+# Default RAM budget for arrays held in memory before spilling to disk, in bytes.
+DEFAULT_RAM_BUDGET = 512 * 1024 * 1024
+SCRATCH_GDB = "scratch.gdb"
+
+
+def remove_directory(directory):
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+class ScratchStore:
+
+    def __init__(self, ram_budget=DEFAULT_RAM_BUDGET, root=None, prefix="pei_run_"):
+        # Step 1: Create the run specific temporary directory and register its automatic clean up, which runs when
+        # the store is garbage collected, when cleanup is called, or at interpreter exit after a crash.
+        self.ram_budget = ram_budget
+        self.directory = tempfile.mkdtemp(prefix=prefix, dir=root)
+        self._arrays = {}
+        self._in_memory = OrderedDict()
+        self._gdb = None
+        self._finalizer = weakref.finalize(self, remove_directory, self.directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    def memory_usage(self):
+        return sum(self._in_memory.values())
+
+    def put(self, name, array):
+        # Step 2: Store arrays in memory and spill the oldest ones to memory-mapped files when over the RAM budget.
+        array = np.asarray(array)
+        if name in self._arrays:
+            self.delete(name)
+        self._arrays[name] = array
+        self._in_memory[name] = array.nbytes
+        while self.memory_usage() > self.ram_budget and self._in_memory:
+            self.spill(next(iter(self._in_memory)))
+        return self.get(name)
+
+    def spill(self, name):
+        # Writes an in memory array to a .npy file and replaces it with a read only memory map of that file.
+        if name not in self._in_memory:
+            return
+        path = os.path.join(self.directory, f"{name}.npy")
+        np.save(path, self._arrays[name], allow_pickle=False)
+        self._arrays[name] = np.load(path, mmap_mode="r")
+        del self._in_memory[name]
+
+    def get(self, name):
+        # Step 3: Hand out read only views of stored arrays, so no stage can modify another stage's result.
+        view = self._arrays[name].view()
+        view.flags.writeable = False
+        return view
+
+    def put_table(self, name, columns):
+        # Stores a {column: array} table, the form used by PEI_IO.read_arrays and PEI_Engines.
+        for column, values in columns.items():
+            self.put(f"{name}.{column}", values)
+        self._arrays[name] = np.array(list(columns))
+
+    def get_table(self, name):
+        # Step 3: Hand out read only views of the columns of a stored table.
+        return {column: self.get(f"{name}.{column}") for column in self._arrays[name].tolist()}
+
+    def delete(self, name):
+        self._arrays.pop(name, None)
+        self._in_memory.pop(name, None)
+        path = os.path.join(self.directory, f"{name}.npy")
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                # A view of the memory map is still open on Windows, the file goes with the directory at clean up.
+                pass
+
+    @property
+    def gdb(self):
+        # Step 4: Provide scratch paths for arcpy intermediates in a run specific file geodatabase, created on first use.
+        if self._gdb is None:
+            import arcpy
+            arcpy.CreateFileGDB_management(self.directory, SCRATCH_GDB)
+            self._gdb = os.path.join(self.directory, SCRATCH_GDB)
+        return self._gdb
+
+    def path(self, name):
+        # Scratch feature class, table or raster path inside the scratch geodatabase.
+        return os.path.join(self.gdb, name)
+
+    def folder_path(self, name):
+        # Scratch file path inside the run directory, for outputs such as shapefiles that cannot live in a gdb.
+        return os.path.join(self.directory, name)
+
+    def cleanup(self):
+        # Step 5: Remove the temporary directory. Memory maps and arcpy workspace locks are released first.
+        self._arrays.clear()
+        self._in_memory.clear()
+        if self._gdb is not None:
+            import arcpy
+            arcpy.ClearWorkspaceCache_management()
+        self._finalizer()
@@ -0,0 +1,136 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Sensitivity
+# Purpose: The purpose of this script is to measure how stable census tract rankings are under alternative weightings
+# of the Pedestrian Environment Index sub metrics. Instead of re-running Final_PEI for every weighting, thousands of
+# weight vectors are drawn and every composite is evaluated at once as a (draws x tracts) matrix from the sub metric
+# arrays held by PEI_Composite. Draws are processed in chunks so memory stays bounded regardless of the draw count.
+#
+# Steps
+# Step 1: Read the sub metric fields written by Final_PEI from the census tract layer.
+# Step 2: Draw weight vectors from a Dirichlet distribution scaled so the mean weight of every sub metric is 1.
+# Step 3: Evaluate each chunk of weight vectors as one matrix product and rank the tracts within each draw.
+# Step 4: Accumulate rank statistics, a rank histogram and the top decile counts across chunks.
+# Step 5: Report per tract rank intervals and the probability of being in the top decile.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import csv
+import math
+import time
+import numpy as np
+from PEI_Composite import PEIComposite, PEI_METRICS
+
+timestart = time.time()
+
+
+def draw_weights(rng, n_draws, n_metrics, concentration=1.0):
+    # Step 2: Dirichlet draws sum to 1, so they are scaled by the number of sub metrics to keep equal weights at 1.
+    # A larger concentration keeps the draws closer to equal weights.
+    return rng.dirichlet(np.full(n_metrics, concentration), size=n_draws) * n_metrics
+
+
+def rank_rows(composites):
+    # Ranks the tracts within each draw, with rank 0 being the highest PEI.
+    draws, tracts = composites.shape
+    order = np.argsort(-composites, axis=1, kind="stable")
+    ranks = np.empty((draws, tracts), dtype=np.int64)
+    ranks[np.arange(draws)[:, None], order] = np.arange(tracts)
+    return ranks
+
+
+def histogram_quantile(histogram, quantile, n_draws, n_tracts):
+    # Converts the per tract rank histogram into a rank quantile. With one bin per rank the quantile is exact,
+    # otherwise it is the lower rank edge of the bin that holds the quantile.
+    n_bins = histogram.shape[1]
+    cumulative = np.cumsum(histogram, axis=1)
+    target = np.maximum(1, np.ceil(quantile * n_draws))
+    bins = np.argmax(cumulative >= target, axis=1)
+    return np.ceil(bins * n_tracts / n_bins).astype(np.int64)
+
+
+def rank_stability(composite, n_draws=10000, chunk_size=1000, method="product", concentration=1.0,
+                   interval=(0.05, 0.95), top_fraction=0.1, max_bins=1000, seed=None):
+    # Steps 2-5 for a PEIComposite. Returns a dictionary of per tract arrays in sorted ct_id order, with 1 based ranks.
+    rng = np.random.default_rng(seed)
+    n_tracts = len(composite)
+    n_metrics = len(composite.names)
+    n_bins = min(n_tracts, max_bins)
+    top_count = max(1, math.ceil(n_tracts * top_fraction))
+
+    rank_sum = np.zeros(n_tracts)
+    rank_min = np.full(n_tracts, n_tracts, dtype=np.int64)
+    rank_max = np.zeros(n_tracts, dtype=np.int64)
+    in_top = np.zeros(n_tracts, dtype=np.int64)
+    histogram = np.zeros(n_tracts * n_bins, dtype=np.int64)
+    tract_offsets = np.arange(n_tracts) * n_bins
+
+    done = 0
+    while done < n_draws:
+        size = min(chunk_size, n_draws - done)
+        # Step 3: Evaluate each chunk of weight vectors as one matrix product and rank the tracts within each draw.
+        weights = draw_weights(rng, size, n_metrics, concentration)
+        ranks = rank_rows(composite.composite(weights, method))
+        # Step 4: Accumulate rank statistics, a rank histogram and the top decile counts across chunks.
+        rank_sum += ranks.sum(axis=0)
+        np.minimum(rank_min, ranks.min(axis=0), out=rank_min)
+        np.maximum(rank_max, ranks.max(axis=0), out=rank_max)
+        in_top += (ranks < top_count).sum(axis=0)
+        bins = (ranks * n_bins) // n_tracts
+        histogram += np.bincount((bins + tract_offsets).ravel(), minlength=n_tracts * n_bins)
+        done += size
+    histogram = histogram.reshape(n_tracts, n_bins)
+
+    # Step 5: Report per tract rank intervals and the probability of being in the top decile.
+    base_rank = rank_rows(composite.composite(None, method)[None, :])[0]
+    return {"ct_id": composite.ct_id,
+            "base_rank": base_rank + 1,
+            "mean_rank": rank_sum / n_draws + 1,
+            "rank_low": histogram_quantile(histogram, interval[0], n_draws, n_tracts) + 1,
+            "rank_high": histogram_quantile(histogram, interval[1], n_draws, n_tracts) + 1,
+            "min_rank": rank_min + 1,
+            "max_rank": rank_max + 1,
+            "p_top_decile": in_top / n_draws}
+
+
+def write_report(result, path):
+    # Writes the rank stability results as a csv table with one row per census tract.
+    fields = list(result)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for row in zip(*(result[field].tolist() for field in fields)):
+            writer.writerow(row)
+
+
+def main():
+    import arcpy
+    #
+    # input parameters
+    #
+    # Census tracts feature class with the sub metric fields written by Final_PEI.
+    geographical_units = arcpy.GetParameterAsText(0)
+    # Census tract id field.
+    geographic_id_field = arcpy.GetParameterAsText(1)
+    # Number of weight vectors to draw.
+    n_draws = int(arcpy.GetParameterAsText(2) or 10000)
+    # Output csv file with the per tract rank intervals.
+    output = arcpy.GetParameterAsText(3)
+
+    # Step 1: Read the sub metric fields written by Final_PEI from the census tract layer.
+    arcpy.AddMessage("Reading sub metrics...")
+    table = arcpy.da.TableToNumPyArray(geographical_units, [geographic_id_field] + PEI_METRICS, null_value=0)
+    composite = PEIComposite(table[geographic_id_field], {name: table[name] for name in PEI_METRICS})
+    arcpy.AddMessage(f"Evaluating {n_draws} weightings for {len(composite)} census tracts...")
+    write_report(rank_stability(composite, n_draws), output)
+
+
+if __name__ == '__main__':
+    main()
+    timeend = time.time()
+    timetotal = round((timeend - timestart) / 60, 4)
+    print(f"This script took {timetotal} minutes to run.")
@@ -0,0 +1,346 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Service
+# Purpose: The purpose of this script is to answer planning questions such as "what does the PEI become if we add a
+# park here?" in milliseconds instead of a full run of Final_PEI. A long running local service loads the census
+# tracts, the sub metric arrays, the census tract lookup, the transportation catchments and the parks cost distance
+# raster once. Every scenario of added or removed transportation stops, parks and street segments is applied as a
+# delta with the PEI_Incremental classes, which only recalculate the census tracts the scenario touches, and the PEI
+# of those census tracts is reported before and after. Scenarios are rolled back after each query unless they are
+# committed, so planners can compare alternatives against the same baseline. The service only uses the Python
+# standard library besides the NumPy engines and listens on the local host.
+#
+# Steps
+# Step 1: Load the inputs and build the incremental state of every sub metric a scenario can change.
+# Step 2: Apply the stops, parks and street segments of a scenario and build the scenario that undoes it.
+# Step 3: Recalculate the PEI and report the census tracts that changed.
+# Step 4: Serve the scenario queries over HTTP.
+#
+# Requests
+# GET  /summary          census tracts, stops, parks and street segments of the baseline and its mean PEI.
+# GET  /tracts/<ct_id>   every sub metric and the PEI of a census tract.
+# POST /scenario         {"stops": {"add": [{"x": ..., "y": ...}], "remove": [stop_id, ...]},
+#                         "parks": {"add": [{"x": ..., "y": ...}], "remove": [{"row": ..., "col": ...}]},
+#                         "streets": {"add": [{"x0": ..., "y0": ..., "x1": ..., "y1": ..., "width": ...,
+#                                              "sidewalk_width": ...}], "remove": [street_id, ...]},
+#                         "weights": "1;1;1;1;2;1;1;1", "commit": false, "limit": 50}
+#
+# Parks are given by raster cell (row, col) or by coordinates, and street segments are removed by their row in the
+# roads layer or by the id returned when they were added. Removing a street of the roads layer does not change the
+# sidewalks layer, while added street segments can carry sidewalks of the given width on both sides. An added street
+# segment is assigned to the census tract of its midpoint unless it gives a tract_index, as the undo scenario of a
+# removal does so the street returns to its census tract.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import numpy as np
+from PEI_Composite import PEI_METRICS, PEIComposite, parse_weights
+from PEI_Incremental import (IncrementalAreaDensity, IncrementalIntersectionDensity, IncrementalParksAccess,
+                             IncrementalTransportationAccess)
+from PEI_Partition import partition_metrics, partition_task, reduce_metrics
+
+# Sub metrics no scenario changes, calculated once when the service starts.
+STATIC_SUB_METRICS = ["land_use_mix", "population_density", "commercial_density"]
+STREET_COLUMNS = ["x0", "y0", "x1", "y1", "width", "sidewalk_width"]
+
+
+def street_pieces(tract_index, streets):
+    # Road and sidewalk areas of street segments, as pieces for IncrementalAreaDensity.
+    length = np.hypot(np.asarray(streets["x1"]) - np.asarray(streets["x0"]),
+                      np.asarray(streets["y1"]) - np.asarray(streets["y0"]))
+    return ({"tract_index": tract_index, "area": length * np.asarray(streets["width"], dtype=float)},
+            {"tract_index": tract_index, "area": 2 * length * np.asarray(streets["sidewalk_width"], dtype=float)})
+
+
+class ScenarioModel:
+
+    def __init__(self, inputs, weights=None, locate=None):
+        # Step 1: Load the inputs and build the incremental state of every sub metric a scenario can change. The
+        # census tract of new intersections and street segments comes from locate, by default the census tract label
+        # of the raster cell, whose upper left corner is at x_min, y_max (0 and the raster height by default).
+        tracts = inputs["tracts"]
+        self.ct_id = np.asarray(tracts["ct_id"])
+        self.index = {ct_id: i for i, ct_id in enumerate(self.ct_id.tolist())}
+        self.weights = weights
+        n = len(self.ct_id)
+        raster = inputs["raster"]
+        self.labels = np.asarray(raster["labels"])
+        self.cell_size = raster["cell_size"]
+        self.x_min = raster.get("x_min", 0.0)
+        self.y_max = raster.get("y_max", self.labels.shape[0] * self.cell_size)
+        self.locate = locate or self.raster_locate
+        self.static = reduce_metrics([partition_metrics(partition_task(inputs, np.arange(n)), STATIC_SUB_METRICS)], n)
+        self.transit = IncrementalTransportationAccess.from_inputs(inputs)
+        self.parks = IncrementalParksAccess.from_inputs(inputs)
+        self.intersections = IncrementalIntersectionDensity.from_inputs(inputs, self.locate)
+        sidewalks, roads = inputs["sidewalks"], inputs["roads"]
+        self.sidewalks = IncrementalAreaDensity(self.ct_id, tracts["area"], sidewalks["tract_index"], sidewalks["area"])
+        self.network = IncrementalAreaDensity(self.ct_id, tracts["area"], roads["tract_index"], roads["area"])
+        # Streets of the roads layer are kept as columns and referenced by row, added ones by their id.
+        self.streets = {name: np.asarray(roads.get(name, np.zeros(len(roads["x0"]))), dtype=float)
+                        for name in STREET_COLUMNS}
+        self.street_tract = np.asarray(roads["tract_index"], dtype=np.int64)
+        self.removed_streets = set()
+        self.added_streets = {}
+        self.next_stop = max([s + 1 for s in self.transit.stops if isinstance(s, int)], default=0)
+        self.next_street = len(self.street_tract)
+        self.order = np.argsort(self.ct_id, kind="stable")
+        self.pei = self.composite()
+
+    def raster_locate(self, x, y):
+        row, col = self.raster_cells(x, y)
+        inside = (row >= 0) & (row < self.labels.shape[0]) & (col >= 0) & (col < self.labels.shape[1])
+        return np.where(inside, self.labels[np.where(inside, row, 0), np.where(inside, col, 0)], -1)
+
+    def raster_cells(self, x, y):
+        return (np.floor((self.y_max - np.asarray(y, dtype=float)) / self.cell_size).astype(np.int64),
+                np.floor((np.asarray(x, dtype=float) - self.x_min) / self.cell_size).astype(np.int64))
+
+    def metrics(self):
+        return dict(self.static, intersection_density=self.intersections.normalized,
+                    sidewalk_density=self.sidewalks.normalized, transportation_access=self.transit.normalized,
+                    parks_access=self.parks.normalized, sn_density=self.network.normalized)
+
+    def composite(self, weights=None):
+        # Step 3: The PEI of every census tract in input order.
+        metrics = self.metrics()
+        composite = PEIComposite(self.ct_id, {name: metrics[name] for name in PEI_METRICS})
+        pei = np.empty(len(self.ct_id))
+        pei[self.order] = composite.weighted_product(weights if weights is not None else self.weights)
+        return pei
+
+    def park_cells(self, parks):
+        # Parks given by raster cell or by coordinates, as row and col columns.
+        rows, cols = [], []
+        for park in parks:
+            if "row" in park:
+                rows.append(int(park["row"]))
+                cols.append(int(park["col"]))
+            else:
+                row, col = self.raster_cells([park["x"]], [park["y"]])
+                rows.append(int(row[0]))
+                cols.append(int(col[0]))
+        return {"row": rows, "col": cols}
+
+    def street(self, street_id):
+        if street_id in self.added_streets:
+            return self.added_streets[street_id]
+        if not isinstance(street_id, int) or not 0 <= street_id < len(self.street_tract) or \
+                street_id in self.removed_streets:
+            raise KeyError(f"Unknown street id: {street_id}")
+        return dict({name: float(self.streets[name][street_id]) for name in STREET_COLUMNS},
+                    tract_index=int(self.street_tract[street_id]))
+
+    def apply_streets(self, added, removed):
+        # Step 2: Removed streets leave the intersection degrees, road and sidewalk areas, added ones join them.
+        affected = []
+        removed_streets = [dict(self.street(street_id), street_id=street_id) for street_id in removed]
+        added_streets = []
+        for street in added:
+            street = dict({"width": float(np.median(self.streets["width"])) if len(self.streets["width"]) else 0.0,
+                           "sidewalk_width": 0.0}, **street)
+            if "street_id" not in street:
+                street["street_id"] = self.next_street
+                self.next_street += 1
+            if street["street_id"] in self.added_streets or isinstance(street["street_id"], int) and \
+                    street["street_id"] < len(self.street_tract) and street["street_id"] not in self.removed_streets:
+                raise ValueError(f"Street id {street['street_id']} already exists.")
+            # A street restored by an undo scenario keeps the census tract it had, other streets are located at
+            # their midpoint.
+            if "tract_index" in street:
+                street["tract_index"] = int(street["tract_index"])
+            else:
+                street["tract_index"] = int(self.locate([(street["x0"] + street["x1"]) / 2],
+                                                        [(street["y0"] + street["y1"]) / 2])[0])
+            added_streets.append(street)
+        columns = [{name: [street[name] for street in streets] for name in STREET_COLUMNS + ["tract_index"]}
+                   if streets else None for streets in (added_streets, removed_streets)]
+        affected.append(self.intersections.apply(*columns))
+        pieces = [street_pieces(c["tract_index"], c) if c else (None, None) for c in columns]
+        affected.append(self.network.apply(pieces[0][0], pieces[1][0]))
+        affected.append(self.sidewalks.apply(pieces[0][1], pieces[1][1]))
+        for street in removed_streets:
+            if street["street_id"] in self.added_streets:
+                del self.added_streets[street["street_id"]]
+            else:
+                self.removed_streets.add(street["street_id"])
+        for street in added_streets:
+            if street["street_id"] in self.removed_streets:
+                self.removed_streets.discard(street["street_id"])
+            else:
+                self.added_streets[street["street_id"]] = street
+        inverse = {"add": [{name: street[name] for name in STREET_COLUMNS + ["street_id", "tract_index"]}
+                           for street in removed_streets],
+                   "remove": [street["street_id"] for street in added_streets]}
+        return affected, inverse
+
+    def validate(self, scenario):
+        # Step 2: Checks every removal before anything is applied, so a failing scenario leaves the model unchanged.
+        unknown = set(scenario) - {"stops", "parks", "streets", "weights", "commit", "limit"}
+        if unknown:
+            raise ValueError(f"Unknown scenario keys: {sorted(unknown)}")
+        stops = scenario.get("stops", {})
+        for stop in stops.get("remove", []):
+            if stop not in self.transit.stops:
+                raise KeyError(f"Unknown stop id: {stop}")
+        for stop in stops.get("add", []):
+            if stop.get("stop_id") in self.transit.stops:
+                raise ValueError(f"Stop id {stop['stop_id']} already exists.")
+        removed = self.park_cells(scenario.get("parks", {}).get("remove", []))
+        cells = self.parks.cells(removed["row"], removed["col"])
+        if len(cells) != len(removed["row"]):
+            raise KeyError("Removed parks must be on valid raster cells.")
+        for cell, count in zip(*(values.tolist() for values in np.unique(cells, return_counts=True))):
+            if self.parks.parks.get(cell, 0) < count:
+                raise KeyError(f"No park at cell {divmod(cell, self.labels.shape[1])}.")
+        for street_id in scenario.get("streets", {}).get("remove", []):
+            self.street(street_id)
+
+    def apply(self, scenario):
+        # Step 2: Apply the stops, parks and street segments of a scenario. Returns the affected census tract
+        # indices, whether any sub metric was re-normalized for every census tract and the scenario that undoes it.
+        self.validate(scenario)
+        affected = []
+        inverse = {}
+        stops = scenario.get("stops", {})
+        if stops.get("add") or stops.get("remove"):
+            removed = list(stops.get("remove", []))
+            restored = [{"stop_id": stop, "x": self.transit.stops[stop][0], "y": self.transit.stops[stop][1]}
+                        for stop in removed if stop in self.transit.stops]
+            added = []
+            for stop in stops.get("add", []):
+                if "stop_id" not in stop:
+                    stop = dict(stop, stop_id=self.next_stop)
+                    self.next_stop += 1
+                added.append(stop)
+            affected.append(self.transit.apply({name: [stop[name] for stop in added] for name in ("stop_id", "x", "y")}
+                                               if added else None, removed))
+            inverse["stops"] = {"add": restored, "remove": [stop["stop_id"] for stop in added]}
+        parks = scenario.get("parks", {})
+        if parks.get("add") or parks.get("remove"):
+            added, removed = self.park_cells(parks.get("add", [])), self.park_cells(parks.get("remove", []))
+            # Parks off the sidewalk cost surface cannot be reached and are left out, as in the full calculation.
+            cells = self.parks.cells(added["row"], added["col"])
+            added = {"row": (cells // self.labels.shape[1]).tolist(), "col": (cells % self.labels.shape[1]).tolist()}
+            affected.append(self.parks.apply(added if added["row"] else None, removed if removed["row"] else None))
+            inverse["parks"] = {"add": [{"row": row, "col": col} for row, col in zip(removed["row"], removed["col"])],
+                                "remove": [{"row": row, "col": col} for row, col in zip(added["row"], added["col"])]}
+        streets = scenario.get("streets", {})
+        if streets.get("add") or streets.get("remove"):
+            street_affected, inverse["streets"] = self.apply_streets(streets.get("add", []), streets.get("remove", []))
+            affected.extend(street_affected)
+        tracts = np.unique(np.concatenate([t for t, _ in affected])) if affected else np.arange(0)
+        return tracts, any(renormalized for _, renormalized in affected), inverse
+
+    def query(self, scenario, weights=None, commit=False, limit=50):
+        # Steps 2 and 3: Apply a scenario, report the census tracts whose PEI changed the most and roll it back
+        # unless it is committed.
+        start = time.perf_counter()
+        before = {name: values.copy() for name, values in self.metrics().items()}
+        pei_before = self.pei if weights is None else self.composite(weights)
+        tracts, renormalized, inverse = self.apply(scenario)
+        after = self.metrics()
+        pei_after = self.composite(weights)
+        changed = np.union1d(tracts, np.flatnonzero(pei_after != pei_before))
+        ranked = changed[np.argsort(-np.abs(pei_after[changed] - pei_before[changed]), kind="stable")][:limit]
+        result = {"latency_ms": 1000 * (time.perf_counter() - start),
+                  "renormalized": bool(renormalized),
+                  "changed_tracts": len(changed),
+                  "mean_pei": [float(pei_before.mean()), float(pei_after.mean())],
+                  "tracts": [dict({"ct_id": self.ct_id[i].item(), "PEI": [float(pei_before[i]), float(pei_after[i])]},
+                                  **{name: [float(before[name][i]), float(after[name][i])] for name in PEI_METRICS
+                                     if before[name][i] != after[name][i]}) for i in ranked.tolist()],
+                  "undo": inverse}
+        if commit:
+            self.pei = pei_after if weights is None else self.composite()
+        else:
+            self.apply(inverse)
+            self.pei = self.composite()
+        return result
+
+    def summary(self):
+        return {"tracts": len(self.ct_id), "stops": len(self.transit.stops), "parks": sum(self.parks.parks.values()),
+                "streets": len(self.street_tract) - len(self.removed_streets) + len(self.added_streets),
+                "mean_pei": float(self.pei.mean())}
+
+    def tract(self, ct_id):
+        try:
+            i = self.index[float(ct_id)] if float(ct_id) in self.index else self.index[ct_id]
+        except (KeyError, ValueError):
+            raise KeyError(f"Unknown ct_id: {ct_id}")
+        return dict({"ct_id": self.ct_id[i].item(), "PEI": float(self.pei[i])},
+                    **{name: float(values[i]) for name, values in self.metrics().items()})
+
+
+def handler(model):
+    # Step 4: HTTP handler answering the requests of the service from the preloaded model. The server handles one
+    # request at a time, so scenarios never interleave.
+
+    class ScenarioHandler(BaseHTTPRequestHandler):
+
+        def send(self, status, body):
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def answer(self, request):
+            try:
+                self.send(200, request())
+            except (KeyError, ValueError, TypeError) as error:
+                self.send(400, {"error": str(error.args[0] if error.args else error)})
+
+        def do_GET(self):
+            if self.path == "/summary":
+                self.answer(model.summary)
+            elif self.path.startswith("/tracts/"):
+                self.answer(lambda: model.tract(self.path[len("/tracts/"):]))
+            else:
+                self.send(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/scenario":
+                self.send(404, {"error": f"Unknown path {self.path}"})
+                return
+
+            def scenario():
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                weights = parse_weights(body["weights"]) if body.get("weights") else None
+                return model.query(body, weights, bool(body.get("commit")), int(body.get("limit", 50)))
+            self.answer(scenario)
+
+    return ScenarioHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pedestrian Environment Index what-if scenario service.")
+    parser.add_argument("--inputs", help="Directory with one .npz or .parquet file per layer, as for PEI_CLI.")
+    parser.add_argument("--synthetic", type=int, help="Use a synthetic city with this many lots instead.")
+    parser.add_argument("--weights", default="", help="Sub metric weights, for example 1;1;1;1;2;1;1;1.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    args = parser.parse_args()
+    from PEI_CLI import load_inputs
+    start = time.perf_counter()
+    model = ScenarioModel(load_inputs(args), parse_weights(args.weights))
+    print(f"Loaded {len(model.ct_id)} census tracts in {time.perf_counter() - start:.1f} seconds.")
+    server = HTTPServer((args.host, args.port), handler(model))
+    print(f"Serving what-if scenarios on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
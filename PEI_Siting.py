@@ -0,0 +1,202 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Siting
+# Purpose: The purpose of this script is to find where new transportation stops would raise the Pedestrian
+# Environment Index the most. With the 2SFCA method of Public_Transportation_Access_Index.py a new stop adds its ratio,
+# 1 over the population within its radius, to the sum of ratios of every census tract within that radius. The census
+# tract by candidate site catchment matrix is therefore built once, and the gain in total PEI of thousands of candidate
+# sites is evaluated at once from it, re-normalizing every census tract only for the candidates that would raise the
+# max sum of ratios. Sites are picked greedily, the best gain per cost first, until k sites are picked or the budget is
+# spent. Picking a site only lowers the gain of the candidates sharing census tracts with it in most cases, so the
+# gains are re-evaluated lazily (CELF): only the candidates whose previous gain could still beat the best current
+# gain are evaluated again.
+#
+# Steps
+# Step 1: Build the catchment matrix of the existing stops and the candidate sites, and the ratio of every candidate.
+# Step 2: Evaluate the total PEI gain of a batch of candidates from the current sums of ratios.
+# Step 3: Pick the sites greedily with lazy re-evaluation of the gains, under the number of sites and the budget.
+# Step 4: Write the picked sites with their gains.
+#
+# The max normalization makes a gain able to grow after a pick that lowers nothing, so lazy re-evaluation is a close
+# approximation of the full greedy search. Set lazy to False to re-evaluate every candidate after every pick.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import argparse
+import numpy as np
+import PEI_Engines as engines
+from PEI_Composite import PEI_METRICS, PEIComposite, parse_weights
+from PEI_Sensitivity import write_report
+
+TRANSIT = "transportation_access"
+# Candidates whose dense re-normalized gain is evaluated together, bounding memory to chunk x census tracts values.
+CHUNK_SIZE = 256
+
+
+def candidate_grid(tract_x, tract_y, spacing):
+    # Candidate sites on a regular grid over the census tract centroids.
+    x = np.arange(np.min(tract_x), np.max(tract_x) + spacing, spacing)
+    y = np.arange(np.min(tract_y), np.max(tract_y) + spacing, spacing)
+    return np.repeat(x, len(y)), np.tile(y, len(x))
+
+
+class StopSiting:
+
+    def __init__(self, tract_x, tract_y, population, metrics, stop_x, stop_y, candidate_x, candidate_y, costs=None,
+                 weights=None, tract_weight=None, radius=engines.TRANSPORTATION_RADIUS):
+        # Step 1: metrics maps every PEI sub metric to its values in census tract order. The transportation access
+        # sub metric is recalculated from the existing stops, the others stay fixed, and their weighted product is
+        # kept as the factor every census tract multiplies its transportation access term with. tract_weight weights
+        # the census tracts in the total PEI, for example by population, and defaults to 1.
+        population = np.asarray(population, dtype=float)
+        n = len(population)
+        composite = PEIComposite(np.arange(n), {name: metrics[name] if name != TRANSIT else np.zeros(n)
+                                                for name in PEI_METRICS})
+        weight = composite.weight_vector(weights)
+        others = [i for i, name in enumerate(composite.names) if name != TRANSIT]
+        self.exponent = weight[composite.names.index(TRANSIT)]
+        self.factor = np.exp(weight[others] @ (np.log1p(composite.values[others]) - np.log(2)))
+        self.factor *= np.ones(n) if tract_weight is None else np.asarray(tract_weight, dtype=float)
+        existing = engines.catchment_matrix(tract_x, tract_y, stop_x, stop_y, radius)
+        self.sum_ratio = engines.transportation_access(existing, population)[0]
+        self.catchment = engines.catchment_matrix(tract_x, tract_y, candidate_x, candidate_y, radius).tocsc()
+        demand = self.catchment.T @ population
+        with np.errstate(divide="ignore"):
+            self.ratio = np.where(demand > 0, 1 / demand, 0.0)
+        self.candidate_x = np.asarray(candidate_x, dtype=float)
+        self.candidate_y = np.asarray(candidate_y, dtype=float)
+        self.costs = np.ones(len(self.ratio)) if costs is None else np.asarray(costs, dtype=float)
+        self.evaluations = 0
+
+    @classmethod
+    def from_inputs(cls, inputs, metrics, candidate_x, candidate_y, costs=None, weights=None, by_population=False,
+                    radius=engines.TRANSPORTATION_RADIUS):
+        # Step 1: Build from the PEI_Partition inputs and the sub metrics of a run in census tract order.
+        tracts, stops = inputs["tracts"], inputs["stops"]
+        return cls(tracts["x"], tracts["y"], tracts["population"], metrics, stops["x"], stops["y"], candidate_x,
+                   candidate_y, costs, weights, tracts["population"] if by_population else None, radius)
+
+    def term(self, sum_ratio, max_value):
+        # The transportation access term ((1 + access) / 2) ** weight of the weighted product.
+        return ((1 + sum_ratio / max(max_value, 0.000000000000000001)) / 2) ** self.exponent
+
+    def total(self, sum_ratio=None):
+        sum_ratio = self.sum_ratio if sum_ratio is None else sum_ratio
+        return float(self.factor @ self.term(sum_ratio, sum_ratio.max(initial=0)))
+
+    def gains(self, candidates):
+        # Step 2: Total PEI gain of adding each candidate on its own to the current stops. Only the census tracts in
+        # the catchment of a candidate change, unless it raises the max sum of ratios and every census tract is
+        # re-normalized with the new max.
+        self.evaluations += len(candidates)
+        candidates = np.asarray(candidates, dtype=np.int64)
+        columns = self.catchment[:, candidates]
+        counts = np.diff(columns.indptr)
+        rows = columns.indices
+        column = np.repeat(np.arange(len(candidates)), counts)
+        before = self.sum_ratio[rows]
+        after = before + self.ratio[candidates][column]
+        max_value = self.sum_ratio.max(initial=0)
+        new_max = np.full(len(candidates), max_value)
+        np.maximum.at(new_max, column, after)
+        factor = self.factor[rows]
+        gains = np.bincount(column, factor * (self.term(after, max_value) - self.term(before, max_value)),
+                            minlength=len(candidates))
+        renormalized = np.flatnonzero(new_max > max_value)
+        if len(renormalized):
+            current = self.total()
+            starts = columns.indptr[:-1]
+            for chunk in np.array_split(renormalized, int(np.ceil(len(renormalized) / CHUNK_SIZE))):
+                # Every census tract with the new max, then the census tracts in the catchment with their new sums.
+                scaled = ((1 + self.sum_ratio[None, :] / new_max[chunk, None]) / 2) ** self.exponent
+                gains[chunk] = scaled @ self.factor - current
+                for i in chunk.tolist():
+                    entries = slice(starts[i], starts[i] + counts[i])
+                    gains[i] += factor[entries] @ (self.term(after[entries], new_max[i]) -
+                                                   self.term(before[entries], new_max[i]))
+        return gains
+
+    def add(self, candidate):
+        # Adds a picked site to the current stops.
+        column = slice(self.catchment.indptr[candidate], self.catchment.indptr[candidate + 1])
+        self.sum_ratio[self.catchment.indices[column]] += self.ratio[candidate]
+
+    def site(self, k, budget=None, lazy=True, batch=CHUNK_SIZE, log=print):
+        # Step 3: Pick up to k sites, the best total PEI gain per cost first, while the budget allows. The gain per
+        # cost of every candidate is an upper bound from its last evaluation, and the candidates with the highest
+        # bounds are re-evaluated in batches until the best one is current.
+        remaining = np.inf if budget is None else float(budget)
+        n = len(self.ratio)
+        bound = self.gains(np.arange(n)) / self.costs
+        evaluated = np.zeros(n, dtype=np.int64)
+        available = (self.ratio > 0) & (self.costs <= remaining)
+        picks = []
+        for pick in range(1, k + 1):
+            while available.any():
+                candidates = np.flatnonzero(available)
+                best = candidates[np.argmax(bound[candidates])]
+                if evaluated[best] == pick:
+                    break
+                stale = candidates[evaluated[candidates] < pick]
+                if lazy and len(stale) > batch:
+                    stale = stale[np.argpartition(-bound[stale], batch)[:batch]]
+                bound[stale] = self.gains(stale) / self.costs[stale]
+                evaluated[stale] = pick
+            if not available.any() or bound[best] <= 0:
+                break
+            gain = bound[best] * self.costs[best]
+            self.add(best)
+            remaining -= self.costs[best]
+            available[best] = False
+            available &= self.costs <= remaining
+            picks.append({"rank": pick, "candidate": int(best), "x": self.candidate_x[best],
+                          "y": self.candidate_y[best], "cost": self.costs[best], "gain": gain, "total": self.total()})
+            log(f"Site {pick}: candidate {best} at ({self.candidate_x[best]:.0f}, {self.candidate_y[best]:.0f}), "
+                f"total PEI gain {gain:.6f}.")
+        log(f"Picked {len(picks)} sites with {self.evaluations} candidate evaluations.")
+        return picks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Greedy siting of new transportation stops by PEI gain.")
+    parser.add_argument("output", help="Output csv file with one row per picked site.")
+    parser.add_argument("--inputs", help="Directory with one .npz or .parquet file per layer, as for PEI_CLI.")
+    parser.add_argument("--synthetic", type=int, help="Use a synthetic city with this many lots instead.")
+    parser.add_argument("--metrics", help="Sub metrics of a run saved with PEI_Reference.save_golden, in the census "
+                                          "tract order of the inputs. Calculated from the inputs when omitted.")
+    parser.add_argument("--candidates", help="csv file of candidate sites with x, y and optionally cost columns.")
+    parser.add_argument("--spacing", type=float, default=1000, help="Candidate grid spacing without --candidates.")
+    parser.add_argument("-k", type=int, default=10, help="Number of sites to pick.")
+    parser.add_argument("--budget", type=float, help="Total cost of the picked sites.")
+    parser.add_argument("--weights", default="", help="Sub metric weights, for example 1;1;1;1;2;1;1;1.")
+    parser.add_argument("--by-population", action="store_true", help="Weight census tracts by population.")
+    parser.add_argument("--exhaustive", action="store_true", help="Re-evaluate every candidate after every pick.")
+    args = parser.parse_args()
+    from PEI_CLI import load_inputs
+    inputs = load_inputs(args)
+    tracts = inputs["tracts"]
+    if args.metrics:
+        from PEI_Reference import load_outputs
+        metrics = load_outputs(args.metrics)[1]
+    else:
+        from PEI_Partition import run_partitioned
+        metrics = run_partitioned(inputs, np.zeros(len(tracts["ct_id"])), 1)
+    if args.candidates:
+        candidates = np.genfromtxt(args.candidates, delimiter=",", names=True)
+        candidate_x, candidate_y = candidates["x"], candidates["y"]
+        costs = candidates["cost"] if "cost" in candidates.dtype.names else None
+    else:
+        (candidate_x, candidate_y), costs = candidate_grid(tracts["x"], tracts["y"], args.spacing), None
+    siting = StopSiting.from_inputs(inputs, metrics, candidate_x, candidate_y, costs, parse_weights(args.weights),
+                                    args.by_population)
+    picks = siting.site(args.k, args.budget, not args.exhaustive)
+    write_report({name: np.array([pick[name] for pick in picks]) for name in
+                  ("rank", "candidate", "x", "y", "cost", "gain", "total")}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Synthetic
+# Purpose: The purpose of this script is to generate a synthetic city at any scale, from a thousand to ten million
+# land use lots, so the Pedestrian Environment Index engines can be benchmarked without the original New York City
+# data. The city is a grid of blocks with jittered intersections and randomly missing street segments, streets of
+# several widths with sidewalks on both sides, lots with a dominant land use per census tract and commercial floor
+# area, transportation stops, parks and a sidewalk raster. The result uses the input layout of PEI_Partition, so every
+# engine runs on it directly. Coordinates are in feet.
+#
+# Steps
+# Step 1: Lay out the blocks and group them into census tracts and counties.
+# Step 2: Generate the street network with widths and the intersection degrees.
+# Step 3: Generate the land use lots with land use categories and commercial area.
+# Step 4: Generate the sidewalks, transportation stops and parks.
+# Step 5: Rasterize the sidewalks, census tracts and parks for the access to parks metric.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import math
+import numpy as np
+
+BLOCK_WIDTH = 600
+BLOCK_HEIGHT = 250
+# Land use categories 1-11, where 4 is mixed residential and commercial and 5 is commercial and office.
+LAND_USES = np.arange(1, 12)
+STREET_WIDTHS = np.array([30, 40, 60, 100])
+STREET_WIDTH_SHARES = np.array([0.4, 0.35, 0.2, 0.05])
+SIDEWALK_WIDTH = 12
+MAX_RASTER_CELLS = 1 << 22
+
+
+def synthetic_city(n_lots, lots_per_block=20, blocks_per_tract=(4, 5), counties=(2, 2), missing_streets=0.1,
+                   park_share=0.03, blocks_per_stop=8, seed=0):
+    # Steps 1-5. Returns the PEI_Partition inputs and the county key of every census tract.
+    rng = np.random.default_rng(seed)
+
+    # Step 1: Lay out the blocks and group them into census tracts and counties.
+    n_blocks = max(int(math.ceil(n_lots / lots_per_block)), 1)
+    nx = max(int(math.ceil(math.sqrt(n_blocks * BLOCK_HEIGHT / BLOCK_WIDTH))), 1)
+    ny = int(math.ceil(n_blocks / nx))
+    tx, ty = blocks_per_tract
+    ntx, nty = int(math.ceil(nx / tx)), int(math.ceil(ny / ty))
+    block_i, block_j = np.divmod(np.arange(nx * ny), ny)
+    block_tract = (block_i // tx) * nty + block_j // ty
+    n_tracts = ntx * nty
+    tract_i, tract_j = np.divmod(np.arange(n_tracts), nty)
+    county = (tract_i * counties[0] // ntx) * counties[1] + tract_j * counties[1] // nty
+    blocks = np.bincount(block_tract, minlength=n_tracts)
+    tracts = {"ct_id": np.arange(1, n_tracts + 1, dtype=float),
+              "area": blocks * float(BLOCK_WIDTH * BLOCK_HEIGHT),
+              "population": np.round(blocks * rng.lognormal(math.log(150), 0.6, n_tracts)),
+              "x": np.bincount(block_tract, (block_i + 0.5) * BLOCK_WIDTH, n_tracts) / blocks,
+              "y": np.bincount(block_tract, (block_j + 0.5) * BLOCK_HEIGHT, n_tracts) / blocks}
+    keys = np.array([f"36{c:03d}" for c in county.tolist()])
+
+    # Step 2: Generate the street network: one segment along every block edge, a share of them missing, with
+    # intersections jittered around the block corners. The degree of an intersection is its number of segments.
+    node_x = (np.arange(nx + 1)[:, None] * BLOCK_WIDTH + rng.normal(0, 0.05 * BLOCK_WIDTH, (nx + 1, ny + 1))).ravel()
+    node_y = (np.arange(ny + 1)[None, :] * BLOCK_HEIGHT + rng.normal(0, 0.05 * BLOCK_HEIGHT, (nx + 1, ny + 1))).ravel()
+    node_id = np.arange((nx + 1) * (ny + 1)).reshape(nx + 1, ny + 1)
+    start = np.concatenate([node_id[:-1, :].ravel(), node_id[:, :-1].ravel()])
+    end = np.concatenate([node_id[1:, :].ravel(), node_id[:, 1:].ravel()])
+    keep = rng.random(len(start)) >= missing_streets
+    start, end = start[keep], end[keep]
+    degree = np.bincount(start, minlength=len(node_x)) + np.bincount(end, minlength=len(node_x))
+    node_i, node_j = np.divmod(np.arange(len(node_x)), ny + 1)
+    node_tract = block_tract[np.minimum(node_i, nx - 1) * ny + np.minimum(node_j, ny - 1)]
+    nodes = {"x": node_x, "y": node_y, "degree": degree, "tract_index": node_tract}
+    length = np.hypot(node_x[end] - node_x[start], node_y[end] - node_y[start])
+    width = rng.choice(STREET_WIDTHS, len(start), p=STREET_WIDTH_SHARES).astype(float)
+    segment_tract = node_tract[start]
+    roads = {"x0": node_x[start], "y0": node_y[start], "x1": node_x[end], "y1": node_y[end], "width": width,
+             "area": length * width, "tract_index": segment_tract}
+
+    # Step 3: Generate the land use lots. Every census tract has a dominant land use that most of its lots share, the
+    # rest are drawn uniformly. Mixed use and commercial lots carry commercial floor area.
+    lot_block = np.arange(n_lots) // lots_per_block
+    position = np.arange(n_lots) % lots_per_block
+    columns = int(math.ceil(lots_per_block / 2))
+    lot_tract = block_tract[lot_block]
+    dominant = rng.choice(LAND_USES, n_tracts)
+    dominance = rng.uniform(0.3, 0.9, n_tracts)
+    land_use = np.where(rng.random(n_lots) < dominance[lot_tract], dominant[lot_tract], rng.choice(LAND_USES, n_lots))
+    lot_area = BLOCK_WIDTH * BLOCK_HEIGHT / lots_per_block * rng.lognormal(0, 0.3, n_lots)
+    commercial_share = np.select([land_use == 5, land_use == 4], [rng.uniform(0.3, 1.0, n_lots),
+                                                                  rng.uniform(0.1, 0.5, n_lots)], 0.0)
+    lots = {"x": (block_i[lot_block] + ((position % columns) + 0.5) / columns) * BLOCK_WIDTH,
+            "y": (block_j[lot_block] + ((position // columns) + 0.5) / 2) * BLOCK_HEIGHT,
+            "land_use": land_use, "land_use_area": lot_area, "commercial_area": lot_area * commercial_share,
+            "tract_index": lot_tract}
+
+    # Step 4: Generate the sidewalks on both sides of every street, the transportation stops and the parks.
+    sidewalks = {"area": 2 * length * SIDEWALK_WIDTH, "tract_index": segment_tract}
+    n_stops = max(n_blocks // blocks_per_stop, 1)
+    stops = {"x": rng.uniform(0, nx * BLOCK_WIDTH, n_stops), "y": rng.uniform(0, ny * BLOCK_HEIGHT, n_stops),
+             "stop_id": np.arange(n_stops)}
+    parks = np.flatnonzero(rng.random(nx * ny) < park_share)
+
+    # Step 5: Rasterize the sidewalks, census tracts and parks. Sidewalk cells lie along the streets, every cell is
+    # labelled with the census tract of its block and every park is a source at its center cell.
+    width_ft, height_ft = nx * BLOCK_WIDTH, ny * BLOCK_HEIGHT
+    cell_size = max(25.0, math.sqrt(width_ft * height_ft / MAX_RASTER_CELLS))
+    n_rows, n_cols = int(math.ceil(height_ft / cell_size)), int(math.ceil(width_ft / cell_size))
+    x = (np.arange(n_cols) + 0.5) * cell_size
+    y = height_ft - (np.arange(n_rows) + 0.5) * cell_size
+    on_x = np.abs((x + BLOCK_WIDTH / 2) % BLOCK_WIDTH - BLOCK_WIDTH / 2) < cell_size
+    on_y = np.abs((y + BLOCK_HEIGHT / 2) % BLOCK_HEIGHT - BLOCK_HEIGHT / 2) < cell_size
+    cell_i = np.minimum((x // BLOCK_WIDTH).astype(np.int64), nx - 1)
+    cell_j = np.minimum((y // BLOCK_HEIGHT).astype(np.int64), ny - 1)
+    labels = block_tract[cell_i[None, :] * ny + cell_j[:, None]]
+    park_x = (block_i[parks] + 0.5) * BLOCK_WIDTH
+    park_y = (block_j[parks] + 0.5) * BLOCK_HEIGHT
+    raster = {"sidewalk": on_y[:, None] | on_x[None, :], "labels": labels,
+              "park_rows": np.minimum(((height_ft - park_y) // cell_size).astype(np.int64), n_rows - 1),
+              "park_cols": np.minimum((park_x // cell_size).astype(np.int64), n_cols - 1),
+              "cell_size": cell_size}
+
+    inputs = {"tracts": tracts, "lots": lots, "nodes": nodes, "sidewalks": sidewalks, "roads": roads,
+              "stops": stops, "raster": raster}
+    return inputs, keys
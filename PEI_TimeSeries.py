@@ -0,0 +1,172 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_TimeSeries
+# Purpose: The purpose of this script is to calculate the Pedestrian Environment Index for several years, such as
+# census vintages and parcel snapshots, without repeating the work for layers that did not change. Every input layer
+# has a list of snapshots by year, a year uses the latest snapshot of every layer up to that year, and identical
+# snapshots are recognised by a content hash. Every sub metric depends on the census tracts and one other layer, so it
+# is calculated once for every distinct combination of their snapshots and reused by every year sharing it. Streets,
+# sidewalks and parks that barely change are then processed once for a whole census vintage. The result is a panel
+# with one row per year and census tract holding every sub metric and the PEI.
+#
+# Steps
+# Step 1: Resolve the snapshot of every layer for every year and hash the distinct snapshots.
+# Step 2: Calculate every unnormalized sub metric once per distinct combination of input snapshots.
+# Step 3: Normalize the sub metrics of every year and combine them into the PEI.
+# Step 4: Write the per year, per census tract panel.
+#
+# Snapshots are PEI_Partition layer column dictionaries or .npz or .parquet files holding those columns, where the
+# tract_index of lots, nodes, sidewalks and roads refers to the census tracts snapshot of the same year.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import argparse
+import hashlib
+import json
+import numpy as np
+from PEI_Composite import PEIComposite, parse_weights
+from PEI_Engines import TRANSPORTATION_RADIUS
+from PEI_Index import content_hash
+from PEI_Partition import SUB_METRICS, reduce_metrics
+from PEI_Sensitivity import write_report
+
+LAYERS = ["tracts", "lots", "nodes", "sidewalks", "roads", "stops", "raster"]
+# The layer every sub metric reads besides the census tracts.
+SUB_METRIC_LAYERS = {"land_use_mix": "lots",
+                     "population_density": None,
+                     "commercial_density": "lots",
+                     "intersection_density": "nodes",
+                     "sidewalk_density": "sidewalks",
+                     "transportation_access": "stops",
+                     "parks_access": "raster",
+                     "street_network_density": "roads"}
+# Columns read from GeoParquet layers, where lot_id is only read when the file has it.
+LAYER_COLUMNS = {"lots": ["tract_index", "land_use", "land_use_area", "commercial_area", "lot_id"]}
+
+
+def layer_signature(snapshot):
+    # Step 1: Content hash of a snapshot file, or of the arrays of an in memory snapshot.
+    if isinstance(snapshot, str):
+        return content_hash(snapshot)
+    digest = hashlib.sha1()
+    for name in sorted(snapshot):
+        values = np.ascontiguousarray(snapshot[name])
+        digest.update(f"{name}:{values.dtype}:{values.shape}".encode())
+        digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+def load_layer(snapshot, columns=None, bbox=None):
+    # Loads a snapshot file as a column dictionary. In memory snapshots are returned as they are. GeoParquet files
+    # are read through PEI_IO.read_arrays with only the given columns that the file has and only the row groups
+    # within bbox, an (xmin, ymin, xmax, ymax) tuple or the path of a census tracts GeoParquet file.
+    if not isinstance(snapshot, str):
+        return snapshot
+    if snapshot.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+        from PEI_IO import is_geoparquet, read_arrays
+        if is_geoparquet(snapshot):
+            if columns is not None:
+                names = pq.read_schema(snapshot).names
+                columns = [name for name in columns if name in names]
+            return read_arrays(snapshot, columns, bbox)
+        table = pq.read_table(snapshot)
+        return {name: table.column(name).to_numpy() for name in table.column_names
+                if name not in ("geometry", "bbox")}
+    with np.load(snapshot) as data:
+        return {name: data[name] if data[name].ndim else data[name].item() for name in data.files}
+
+
+def resolve(snapshots, year):
+    # Step 1: The latest snapshot of a layer up to year, or None when the layer has no snapshot that early.
+    years = sorted(y for y in snapshots if y <= year)
+    return snapshots[years[-1]] if years else None
+
+
+def sub_metric_task(tracts, name, layer):
+    # Builds the single partition task one sub metric reads, for the whole study area of a year.
+    n = len(tracts["ct_id"])
+    task = {"tracts": tracts, "positions": np.arange(n)}
+    if name == "transportation_access":
+        task.update(stops=layer, radius=TRANSPORTATION_RADIUS,
+                    halo={"x": np.asarray(tracts["x"]), "y": np.asarray(tracts["y"]),
+                          "population": np.asarray(tracts["population"]), "local_index": np.arange(n)})
+    elif name == "parks_access":
+        task["raster"] = dict(layer, study_area=np.asarray(layer["labels"]) >= 0)
+    elif layer is not None:
+        task[SUB_METRIC_LAYERS[name]] = layer
+    return task
+
+
+def run_time_series(snapshots, years=None, weights=None, log=print):
+    # Steps 1-3. snapshots maps every layer of LAYERS to a {year: snapshot} dictionary. Returns the panel columns.
+    years = sorted(years or {y for by_year in snapshots.values() for y in by_year})
+    signatures = {}
+    loaded = {}
+    raw_cache = {}
+    panel = {}
+
+    def layer(snapshot, name=None):
+        key = id(snapshot) if not isinstance(snapshot, str) else snapshot
+        if key not in signatures:
+            signatures[key] = layer_signature(snapshot)
+        signature = signatures[key]
+        if signature not in loaded:
+            loaded[signature] = load_layer(snapshot, LAYER_COLUMNS.get(name))
+        return signature, loaded[signature]
+
+    for year in years:
+        # Step 1: Resolve the snapshot of every layer for the year.
+        tracts_signature, tracts = layer(resolve(snapshots["tracts"], year))
+        n = len(tracts["ct_id"])
+        area = np.asarray(tracts["area"], dtype=float)
+
+        # Step 2: Calculate every unnormalized sub metric once per distinct combination of input snapshots.
+        result = {"positions": np.arange(n)}
+        for name, layer_name in SUB_METRIC_LAYERS.items():
+            snapshot = resolve(snapshots.get(layer_name, {}), year) if layer_name else None
+            signature, data = layer(snapshot, layer_name) if snapshot is not None else (None, None)
+            if layer_name and data is None:
+                raise ValueError(f"No {layer_name} snapshot for {year}.")
+            key = (name, tracts_signature, signature)
+            if key not in raw_cache:
+                raw_cache[key] = SUB_METRICS[name](sub_metric_task(tracts, name, data), n, area)
+            else:
+                log(f"{year}: reusing {name}.")
+            result.update(raw_cache[key])
+
+        # Step 3: Normalize the sub metrics of the year and combine them into the PEI.
+        composite = PEIComposite(tracts["ct_id"], reduce_metrics([result], n))
+        columns = {"year": np.full(n, year), "ct_id": composite.ct_id}
+        columns.update({metric: composite.values[i] for i, metric in enumerate(composite.names)})
+        columns["PEI"] = composite.weighted_product(weights)
+        for column, values in columns.items():
+            panel.setdefault(column, []).append(values)
+    log(f"Calculated {len(raw_cache)} sub metric inputs for {len(years)} years "
+        f"instead of {len(years) * len(SUB_METRICS)}.")
+    return {column: np.concatenate(values) for column, values in panel.items()}
+
+
+def main():
+    # Step 4: Write the per year, per census tract panel. The specification is a JSON file mapping every layer to
+    # {year: snapshot file}, for example {"tracts": {"2010": "tracts_2010.npz", "2020": "tracts_2020.npz"}, ...}.
+    parser = argparse.ArgumentParser(description="Multi year Pedestrian Environment Index panel.")
+    parser.add_argument("specification", help="JSON file mapping every layer to {year: snapshot file}.")
+    parser.add_argument("output", help="Output csv file with one row per year and census tract.")
+    parser.add_argument("--years", help="Comma separated years, every snapshot year by default.")
+    parser.add_argument("--weights", default="", help="Sub metric weights, for example 1;1;1;1;2;1;1;1.")
+    args = parser.parse_args()
+    with open(args.specification) as f:
+        specification = json.load(f)
+    snapshots = {layer: {int(year): path for year, path in by_year.items()}
+                 for layer, by_year in specification.items()}
+    years = [int(year) for year in args.years.split(",")] if args.years else None
+    write_report(run_time_series(snapshots, years, parse_weights(args.weights)), args.output)
+
+
+if __name__ == '__main__':
+    main()
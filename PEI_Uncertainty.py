@@ -0,0 +1,115 @@
+# -------------------------------------------------------------------------------
+# Name:        PEI_Uncertainty
+# Purpose: The purpose of this script is to propagate the margins of error of the American Community Survey census
+# tract populations through the Pedestrian Environment Index. Population enters both the population density and the
+# public transportation access (2SFCA) sub metrics, so batches of population draws are generated as a NumPy matrix and
+# pushed through the vectorized sub metric and composite calculations at once, giving per tract confidence intervals
+# without re-running Final_PEI for every draw.
+#
+# Steps
+# Step 1: Read census tract populations, margins of error, areas, centroids and the other sub metrics.
+# Step 2: Build the census tract by transportation point catchment matrix once.
+# Step 3: Draw batches of populations from a normal distribution with the standard error implied by the margin of error.
+# Step 4: Calculate population density, transportation access and the composite for every draw in the batch.
+# Step 5: Summarize the draws into per tract confidence intervals.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import time
+import numpy as np
+from PEI_Composite import PEIComposite, PEI_METRICS
+from PEI_Engines import catchment_matrix, population_density, transportation_access
+from PEI_Sensitivity import write_report
+
+timestart = time.time()
+
+# ACS margins of error are published at the 90 percent confidence level.
+ACS_Z_SCORE = 1.645
+
+
+def population_draws(rng, population, moe, n_draws):
+    # Step 3: Draw populations from a normal distribution with the standard error implied by the margin of error,
+    # truncated at 0 since a census tract cannot have a negative population.
+    standard_error = np.asarray(moe, dtype=float) / ACS_Z_SCORE
+    draws = rng.normal(np.asarray(population, dtype=float), standard_error, size=(n_draws, len(population)))
+    return np.maximum(draws, 0)
+
+
+def simulate(composite, population, moe, area, catchment, n_draws=1000, chunk_size=250, weights=None,
+             method="product", interval=(0.05, 0.95), seed=None):
+    # Steps 3-5 for census tract arrays already in the sorted ct_id order of the composite. Returns a dictionary of
+    # per tract arrays with the base values and the confidence interval of each simulated quantity.
+    rng = np.random.default_rng(seed)
+    pei = np.empty((n_draws, len(composite)))
+    pop_density = np.empty_like(pei)
+    access = np.empty_like(pei)
+    done = 0
+    while done < n_draws:
+        size = min(chunk_size, n_draws - done)
+        draws = population_draws(rng, population, moe, size)
+        # Step 4: Calculate population density, transportation access and the composite for every draw in the batch.
+        pop_density[done:done + size] = population_density(draws, area)[1]
+        access[done:done + size] = transportation_access(catchment, draws)[1]
+        pei[done:done + size] = composite.simulate({"pop_density": pop_density[done:done + size],
+                                                    "transportation_access": access[done:done + size]},
+                                                   weights, method)
+        done += size
+
+    # Step 5: Summarize the draws into per tract confidence intervals.
+    result = {"ct_id": composite.ct_id, "PEI": composite.composite(weights, method)}
+    for name, values in (("PEI", pei), ("pop_density", pop_density), ("transportation_access", access)):
+        low, high = np.quantile(values, interval, axis=0)
+        result[f"{name}_mean"] = values.mean(axis=0)
+        result[f"{name}_low"] = low
+        result[f"{name}_high"] = high
+    return result
+
+
+def main():
+    import arcpy
+    #
+    # input parameters
+    #
+    # Census tracts feature class with the sub metric fields written by Final_PEI.
+    geographical_units = arcpy.GetParameterAsText(0)
+    # Census tract id field.
+    geographic_id_field = arcpy.GetParameterAsText(1)
+    # Population field of census tract feature class.
+    population_field = arcpy.GetParameterAsText(2)
+    # Margin of error field of the population field.
+    moe_field = arcpy.GetParameterAsText(3)
+    # Area field of census tract feature class.
+    geographic_area_field = arcpy.GetParameterAsText(4)
+    # Points feature class representing transportation (metro and bus) stops.
+    transportation_points = arcpy.GetParameterAsText(5)
+    # Number of population draws.
+    n_draws = int(arcpy.GetParameterAsText(6) or 1000)
+    # Output csv file with the per tract confidence intervals.
+    output = arcpy.GetParameterAsText(7)
+
+    # Step 1: Read census tract populations, margins of error, areas, centroids and the other sub metrics.
+    arcpy.AddMessage("Reading census tracts...")
+    fields = [geographic_id_field, population_field, moe_field, geographic_area_field, "SHAPE@X", "SHAPE@Y"]
+    tracts = arcpy.da.FeatureClassToNumPyArray(geographical_units, fields + PEI_METRICS, null_value=0)
+    tracts = tracts[np.argsort(tracts[geographic_id_field], kind="stable")]
+    points = arcpy.da.FeatureClassToNumPyArray(transportation_points, ["SHAPE@X", "SHAPE@Y"])
+    composite = PEIComposite(tracts[geographic_id_field], {name: tracts[name] for name in PEI_METRICS})
+
+    # Step 2: Build the census tract by transportation point catchment matrix once.
+    catchment = catchment_matrix(tracts["SHAPE@X"], tracts["SHAPE@Y"], points["SHAPE@X"], points["SHAPE@Y"])
+    arcpy.AddMessage(f"Simulating {n_draws} population draws...")
+    result = simulate(composite, tracts[population_field], tracts[moe_field], tracts[geographic_area_field],
+                      catchment, n_draws)
+    write_report(result, output)
+
+
+if __name__ == '__main__':
+    main()
+    timeend = time.time()
+    timetotal = round((timeend - timestart) / 60, 4)
+    print(f"This script took {timetotal} minutes to run.")
@@ -6,7 +6,7 @@
 #
 # Steps
 # Step 1: Calculate euclidean distance raster for distance from sidewalk polygons.
-# Step 2: Reclassify euclidean distance from sidewalks raster to create cost surface.
+# Step 2: Reclassify euclidean distance from sidewalks raster to create cost surface, stored as an 8 bit raster.
 # Step 3: Convert park polygons into points.
 # Step 4: Select census tracts that intersect with park points.
 # Step 5: Calculate cost distance using parks points and cost surface from steps 4 and 2, respectively.
@@ -26,6 +26,8 @@ import time
 timestart = time.time()
 arcpy.env.workspace = data = fr"C:\MSGA_Capstone\capstone_data"
 arcpy.env.overwriteOutput = True
+# The rasters are written as compressed tiles, the euclidean and cost distances as 32 bit float rasters.
+RASTER_ENVIRONMENT = {"compression": "LZ77", "tileSize": "512 512"}
 
 
 def main():
@@ -52,19 +54,24 @@ def main():
     parks_access = fr"{gdb}\parks_access"
 
     # Step 1: Calculate euclidean distance raster for distance from sidewalk polygons.
-    with arcpy.EnvManager(mask=geographical_units):
+    with arcpy.EnvManager(mask=geographical_units, **RASTER_ENVIRONMENT):
         out_distance_raster = arcpy.sa.EucDistance(sidewalks, None, 10, None, "PLANAR", None, None)
         out_distance_raster.save(sidewalks_distance)
-    # Step 2: Reclassify euclidean distance from sidewalks raster to create cost surface.
-    arcpy.Reclassify_3d(sidewalks_distance, "VALUE", "0 1;0 30 2;30 60 3;60 100 4;100 24816.060547 5", distance_reclass, "DATA")
+    # Step 2: Reclassify euclidean distance from sidewalks raster to create cost surface. The classes 1 to 5 are stored
+    # as an 8 bit unsigned raster.
+    with arcpy.EnvManager(**RASTER_ENVIRONMENT):
+        arcpy.Reclassify_3d(sidewalks_distance, "VALUE", "0 1;0 30 2;30 60 3;60 100 4;100 24816.060547 5",
+                            distance_reclass + "_int", "DATA")
+        arcpy.CopyRaster_management(distance_reclass + "_int", distance_reclass, pixel_type="8_BIT_UNSIGNED")
     # Step 3: Convert park polygons into points.
     arcpy.FeatureToPoint_management(parks, parks_FeatureToPoint)
     # Step 4: Select census tracts that intersect with park points.
     arcpy.SelectLayerByLocation_management(geographical_units, "INTERSECT", parks_FeatureToPoint, None, "NEW_SELECTION", "NOT_INVERT")
     arcpy.CopyFeatures_management(geographical_units, near_roads)
     # Step 5: Calculate cost distance using parks points and cost surface from steps 4 and 2, respectively.
-    out_distance_raster = arcpy.sa.CostDistance(parks_FeatureToPoint, distance_reclass)
-    out_distance_raster.save(parks_raster)
+    with arcpy.EnvManager(**RASTER_ENVIRONMENT):
+        out_distance_raster = arcpy.sa.CostDistance(parks_FeatureToPoint, distance_reclass)
+        out_distance_raster.save(parks_raster)
     # Step 6: Calculate zonal statistics to obtain all the summary statistics of the cost distance raster from step 5 by census tract.
     arcpy.ia.ZonalStatisticsAsTable(geographical_units, "GEOID", parks_raster, parks_access, "DATA", "ALL", "CURRENT_SLICE", 90, "AUTO_DETECT")
     max_value = 0
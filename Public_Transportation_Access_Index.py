@@ -5,7 +5,7 @@
 # healthcare access, to measure public transportation access.
 #
 # Steps
-# Step 1: Create census tract centroids.
+# Step 1: Create census tract centroids from the census tract geometry cached by PEI_Geometry.
 # Step 2: Create lines between all census tract centroids and transportation points.
 # Step 3: Summarize selected lines based on transportation point ID.
 # Step 4: Join summarized table from steps 2 and 3 with the lines layer based on transportation location unique id.
@@ -21,6 +21,7 @@
 
 import arcpy
 import time
+from PEI_Geometry import centroid_points
 
 timestart = time.time()
 arcpy.env.workspace = data = fr"C:\MSGA_Capstone\capstone_data"
@@ -55,8 +56,9 @@ def main():
     ratio_transportation = fr"{gdb}\ratio_transportation"
     transportation_accessibility = fr"{gdb}\transportation_accessibility"
 
-    # Step 1: Create census tract centroids.
-    arcpy.FeatureToPoint_management(geographical_units, geographical_centroids)
+    # Step 1: Create census tract centroids from the census tract geometry cached next to the census tracts, with the
+    # census tract id and population the next steps read.
+    centroid_points(geographical_units, geographic_id_field, geographical_centroids, [population_field], arcpy.AddMessage)
 
     # Step 2: Create lines between all census tract centroids and transportation points.
     arcpy.AddGeometryAttributes_management(geographical_centroids, "POINT_X_Y_Z_M", "FEET_US")
@@ -0,0 +1,19 @@
+import os
+import sys
+import pytest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS))
+
+
+@pytest.fixture
+def fake_arcpy(monkeypatch):
+    # The fake arcpy of tests/fake_arcpy, imported fresh with no datasets for every test and removed afterwards.
+    monkeypatch.syspath_prepend(os.path.join(TESTS, "fake_arcpy"))
+    for name in [name for name in sys.modules if name == "arcpy" or name.startswith("arcpy.")]:
+        monkeypatch.delitem(sys.modules, name)
+    import arcpy
+    arcpy.DATASETS.clear()
+    yield arcpy
+    for name in [name for name in sys.modules if name == "arcpy" or name.startswith("arcpy.")]:
+        del sys.modules[name]
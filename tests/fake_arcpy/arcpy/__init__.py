@@ -0,0 +1,57 @@
+# -------------------------------------------------------------------------------
+# Name:        arcpy (fake)
+# Purpose: The purpose of this module is to stand in for arcpy in the tests, so the arcpy tracer can be exercised
+# where arcpy is not installed. Datasets are named lists of rows held in memory, and every tool sleeps for a known
+# time before writing its output dataset, so the durations and row counts recorded by the tracer can be checked.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import time
+import types
+
+DATASETS = {}
+# Seconds every tool call sleeps.
+TOOL_SECONDS = 0.01
+env = types.SimpleNamespace(workspace=None, overwriteOutput=False)
+
+
+class Result:
+
+    def __init__(self, *outputs):
+        self.outputs = outputs
+
+    def getOutput(self, index):
+        return self.outputs[index]
+
+
+def Exists(dataset):
+    return dataset in DATASETS
+
+
+def GetCount_management(dataset):
+    return Result(str(len(DATASETS[dataset])))
+
+
+def CopyFeatures_management(in_features, out_feature_class):
+    time.sleep(TOOL_SECONDS)
+    DATASETS[out_feature_class] = list(DATASETS[in_features])
+    return Result(out_feature_class)
+
+
+def SpatialJoin_analysis(target_features, join_features, out_feature_class, match_option="INTERSECT"):
+    time.sleep(TOOL_SECONDS)
+    DATASETS[out_feature_class] = [row + (match_option,) for row in DATASETS[target_features]]
+    return Result(out_feature_class)
+
+
+def Delete_management(dataset):
+    DATASETS.pop(dataset, None)
+    return Result("true")
+
+
+from arcpy import sa  # noqa: E402
@@ -0,0 +1,26 @@
+# -------------------------------------------------------------------------------
+# Name:        arcpy.sa (fake)
+# Purpose: The purpose of this module is to stand in for the arcpy spatial analyst module in the tests. A raster is
+# returned as a plain object, so calls through it have no output dataset to count.
+#
+# Author:      Christopher Papp
+#
+# Created:     10/19/2026
+# Copyright:   (c) Christopher Papp
+
+# -------------------------------------------------------------------------------
+
+import time
+
+__all__ = ["CostDistance", "Raster"]
+
+
+class Raster:
+
+    def __init__(self, source):
+        self.source = source
+
+
+def CostDistance(in_source_data, in_cost_raster):
+    time.sleep(0.02)
+    return Raster(f"cost_distance({in_source_data}, {in_cost_raster})")
@@ -0,0 +1,111 @@
+import json
+import sys
+import PEI_ArcpyTrace as arcpy_trace
+from PEI_Trace import Tracer
+
+SCRIPT = """import arcpy
+from arcpy.sa import *
+
+arcpy.env.workspace = "memory"
+arcpy.CopyFeatures_management("lots", "lots_copy")
+arcpy.SpatialJoin_analysis("lots_copy", "tracts", "lots_join", match_option="LARGEST_OVERLAP")
+arcpy.SpatialJoin_analysis("lots", "tracts", "lots_join_2")
+CostDistance("parks", "cost")
+"""
+
+
+def test_install_and_uninstall(fake_arcpy):
+    tracer = Tracer(log=lambda message: None)
+    proxy = arcpy_trace.install(tracer)
+    assert isinstance(sys.modules["arcpy"], arcpy_trace.TracedModule)
+    assert isinstance(sys.modules["arcpy.sa"], arcpy_trace.TracedModule)
+    import arcpy
+    assert arcpy is proxy
+    # Attribute writes pass through to the module, classes and values are not wrapped.
+    arcpy.env.workspace = "memory"
+    arcpy.overwrite = True
+    assert fake_arcpy.overwrite is True
+    assert arcpy.Result is fake_arcpy.Result
+    assert arcpy.sa.Raster is fake_arcpy.sa.Raster
+    arcpy_trace.uninstall()
+    assert sys.modules["arcpy"] is fake_arcpy
+    assert sys.modules["arcpy.sa"] is fake_arcpy.sa
+
+
+def test_records_arguments_durations_and_counts(fake_arcpy):
+    fake_arcpy.DATASETS.update(lots=[(1,), (2,), (3,)], tracts=[(1,)])
+    tracer = Tracer(log=lambda message: None)
+    arcpy = arcpy_trace.install(tracer)
+    try:
+        result = arcpy.SpatialJoin_analysis("lots", "tracts", "lots_join", match_option="LARGEST_OVERLAP")
+        raster = arcpy.sa.CostDistance("parks", "cost")
+    finally:
+        arcpy_trace.uninstall()
+    assert result.getOutput(0) == "lots_join"
+    assert fake_arcpy.DATASETS["lots_join"] == [(1, "LARGEST_OVERLAP"), (2, "LARGEST_OVERLAP"),
+                                                (3, "LARGEST_OVERLAP")]
+    assert isinstance(raster, fake_arcpy.sa.Raster)
+    # Counting the output rows goes through the unwrapped module and is not recorded.
+    join, cost = tracer.records
+    assert join["stage"] == "arcpy.SpatialJoin_analysis"
+    assert join["tool"] == "SpatialJoin_analysis"
+    assert join["arguments"] == ["'lots'", "'tracts'", "'lots_join'", "match_option='LARGEST_OVERLAP'"]
+    assert join["output"] == "lots_join"
+    assert join["rows_out"] == 3
+    assert join["wall_seconds"] >= fake_arcpy.TOOL_SECONDS
+    assert cost["stage"] == "arcpy.sa.CostDistance"
+    assert cost["output"] is None and cost["rows_out"] is None
+    assert cost["wall_seconds"] >= 0.02
+
+
+def test_long_arguments_are_shortened(fake_arcpy):
+    fake_arcpy.DATASETS["lots"] = [(1,)]
+    tracer = Tracer(log=lambda message: None)
+    arcpy = arcpy_trace.install(tracer, count_outputs=False)
+    try:
+        arcpy.CopyFeatures_management("lots", "x" * 500)
+    finally:
+        arcpy_trace.uninstall()
+    (record,) = tracer.records
+    assert len(record["arguments"][1]) == arcpy_trace.ARGUMENT_LENGTH
+    assert record["arguments"][1].endswith("...")
+    assert "rows_out" in record and record["rows_out"] is None
+
+
+def test_errors_are_recorded(fake_arcpy):
+    tracer = Tracer(log=lambda message: None)
+    arcpy = arcpy_trace.install(tracer)
+    try:
+        arcpy.CopyFeatures_management("missing", "copy")
+    except KeyError:
+        pass
+    finally:
+        arcpy_trace.uninstall()
+    (record,) = tracer.records
+    assert record["error"] == "KeyError"
+
+
+def test_main_runs_a_script_and_writes_the_profile(fake_arcpy, tmp_path, monkeypatch):
+    fake_arcpy.DATASETS.update(lots=[(1,), (2,)], tracts=[(1,)])
+    script = tmp_path / "script.py"
+    script.write_text(SCRIPT)
+    trace, report = tmp_path / "trace.jsonl", tmp_path / "report.txt"
+    monkeypatch.setattr(sys, "argv", ["PEI_ArcpyTrace.py", "--trace", str(trace), "--report", str(report),
+                                      str(script)])
+    arcpy_trace.main()
+    assert sys.modules["arcpy"] is fake_arcpy
+    assert fake_arcpy.env.workspace == "memory"
+    records = [json.loads(line) for line in trace.read_text().splitlines()]
+    assert [r["stage"] for r in records] == ["arcpy.CopyFeatures_management", "arcpy.SpatialJoin_analysis",
+                                            "arcpy.SpatialJoin_analysis", "arcpy.sa.CostDistance"]
+    assert [r["rows_out"] for r in records] == [2, 2, 2, None]
+    lines = report.read_text().splitlines()
+    assert lines[0].split() == ["tool", "calls", "total", "s", "mean", "s", "max", "s", "rows", "out"]
+    rows = {line.split()[0]: line.split()[1:] for line in lines[1:]}
+    assert set(rows) == {"arcpy.CopyFeatures_management", "arcpy.SpatialJoin_analysis", "arcpy.sa.CostDistance"}
+    assert rows["arcpy.SpatialJoin_analysis"][0] == "2"
+    assert rows["arcpy.SpatialJoin_analysis"][-1] == "4"
+    assert rows["arcpy.CopyFeatures_management"][-1] == "2"
+    assert rows["arcpy.sa.CostDistance"][-1] == "0"
+    totals = [float(line.split()[2]) for line in lines[1:]]
+    assert totals == sorted(totals, reverse=True)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from PEI_Service import ScenarioModel
+from PEI_Synthetic import synthetic_city
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    return synthetic_city(3000)[0]
+
+
+def centre(inputs):
+    return float(np.mean(inputs["tracts"]["x"])), float(np.mean(inputs["tracts"]["y"]))
+
+
+def scenarios(inputs):
+    x, y = centre(inputs)
+    return {"add stop": {"stops": {"add": [{"x": x, "y": y}]}},
+            "remove stop": {"stops": {"remove": [0, 1]}},
+            "add park": {"parks": {"add": [{"x": x, "y": y}]}},
+            "add street": {"streets": {"add": [{"x0": x, "y0": y, "x1": x + 300, "y1": y + 10,
+                                                "sidewalk_width": 5}]}},
+            "remove street": {"streets": {"remove": [0, 5]}},
+            "mixed": {"stops": {"add": [{"x": x + 100, "y": y}], "remove": [2]},
+                      "parks": {"add": [{"x": x - 200, "y": y}]},
+                      "streets": {"add": [{"x0": x, "y0": y, "x1": x, "y1": y + 400}], "remove": [3]}}}
+
+
+def assert_restored(model, scenario):
+    metrics = {name: values.copy() for name, values in model.metrics().items()}
+    pei = model.pei.copy()
+    result = model.query(scenario)
+    assert result["changed_tracts"] > 0
+    for name, values in model.metrics().items():
+        assert np.array_equal(values, metrics[name]), name
+    assert np.array_equal(model.pei, pei)
+    assert np.array_equal(model.composite(), pei)
+
+
+@pytest.mark.parametrize("name", ["add stop", "remove stop", "add park", "add street", "remove street", "mixed"])
+def test_uncommitted_query_restores_every_metric(inputs, name):
+    model = ScenarioModel(inputs)
+    assert_restored(model, scenarios(inputs)[name])
+    summary = model.summary()
+    assert summary == ScenarioModel(inputs).summary()
+
+
+def test_uncommitted_park_removal_restores_every_metric(inputs):
+    model = ScenarioModel(inputs)
+    row, col = divmod(next(iter(model.parks.parks)), model.labels.shape[1])
+    assert_restored(model, {"parks": {"remove": [{"row": row, "col": col}]}})
+
+
+def test_undo_keeps_the_census_tract_of_removed_streets(inputs):
+    # A street of the roads layer keeps its census tract when the undo scenario adds it back, even where locating
+    # its midpoint would give another census tract.
+    model = ScenarioModel(inputs, locate=lambda x, y: np.full(len(x), -1))
+    assert_restored(model, {"streets": {"remove": [0, 5]}})
+    result = model.query({"streets": {"remove": [0]}})
+    assert result["undo"]["streets"]["add"][0]["tract_index"] == int(inputs["roads"]["tract_index"][0])